@@ -0,0 +1,92 @@
+"""
+Peak Python memory per screenshot: old byte handling vs ImageBuffer.
+
+Follows one image from download to the hand-offs used by on_image: content
+hash, the OCR worker pickle, and vision preprocessing. "old" is the previous
+code path (default download BytesIO, then seek + read()), "buffer" is
+services.imagebuf.ImageBuffer.
+
+tracemalloc only sees Python allocations (bytes objects, BytesIO storage),
+not Pillow's decoded pixel memory, which is the same in both paths, so the
+numbers isolate the extra copies.
+
+Run from the project root:
+    python -m benchmarks.bench_image_memory [--width 1440] [--height 3120]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import io
+import pickle
+import tracemalloc
+
+from PIL import Image
+
+from src.services.imagebuf import ImageBuffer
+from src.services.vision import _prepare_image
+
+
+class FakeBot:
+    """Mimics aiogram's Bot.download_file: 64 KiB chunks into a BinaryIO."""
+
+    def __init__(self, payload: bytes):
+        self.payload = payload
+
+    async def download_file(self, file_path, destination=None, chunk_size=65536, seek=True):
+        destination = destination or io.BytesIO()
+        for i in range(0, len(self.payload), chunk_size):
+            destination.write(self.payload[i:i + chunk_size])
+        if seek:
+            destination.seek(0)
+        return destination
+
+
+def make_screenshot(width: int, height: int) -> bytes:
+    """Noisy PNG, so it does not compress away (like a photo-heavy profile)."""
+    noise = Image.effect_noise((width, height), 64)
+    img = Image.merge("RGB", (noise, noise.rotate(180), noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT)))
+    out = io.BytesIO()
+    img.save(out, "PNG", compress_level=1)
+    return out.getvalue()
+
+
+async def old_path(bot: FakeBot) -> None:
+    b = await bot.download_file("photo.png")
+    image_bytes = b.read() if hasattr(b, "read") else b.getvalue()
+    hashlib.sha256(image_bytes).hexdigest()
+    pickle.dumps(image_bytes)           # handing the image to the OCR process pool
+    _prepare_image(image_bytes)
+
+
+async def buffer_path(bot: FakeBot) -> None:
+    image = await ImageBuffer.download(bot, "photo.png")
+    hashlib.sha256(image.view()).hexdigest()
+    pickle.dumps(image.data)
+    _prepare_image(image.data)
+
+
+def peak_mb(path, bot: FakeBot) -> float:
+    tracemalloc.start()
+    asyncio.run(path(bot))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 1e6
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--width", type=int, default=1440)
+    ap.add_argument("--height", type=int, default=3120)
+    args = ap.parse_args()
+
+    payload = make_screenshot(args.width, args.height)
+    bot = FakeBot(payload)
+    print(f"image: {args.width}x{args.height} PNG, {len(payload) / 1e6:.1f} MB")
+    for name, path in (("old", old_path), ("buffer", buffer_path)):
+        peak_mb(path, bot)  # warm-up (imports, Pillow plugins)
+        print(f"{name:<8} peak {peak_mb(path, bot):6.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Query latency on a synthetic year of history, before and after the indexes.
+
+Builds a throwaway DB with USERS users × 365 daily sessions (half the users
+still have today's session open) and ITEMS screenshots per session, times the
+hot handler queries at schema v0 (no secondary indexes), then migrates to the
+latest version and times them again.
+
+Run from the project root:
+    python -m benchmarks.bench_queries [--users 50] [--items 20] [--runs 200]
+"""
+
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src import db
+
+# (label, sql, params builder) — the queries every image/command handler runs
+QUERIES = [
+    (
+        "open session",
+        "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
+        lambda r, users, sessions: [r.randrange(users)],
+    ),
+    (
+        "session items",
+        "SELECT * FROM items WHERE session_id=?",
+        lambda r, users, sessions: [r.randint(1, sessions)],
+    ),
+    (
+        "last item",
+        "SELECT * FROM items WHERE session_id=? ORDER BY id DESC LIMIT 1",
+        lambda r, users, sessions: [r.randint(1, sessions)],
+    ),
+]
+
+
+def populate(conn: sqlite3.Connection, users: int, items: int, days: int = 365) -> int:
+    """Insert synthetic sessions/items; returns the number of sessions."""
+    sessions = [
+        (uid, f"{1 + d % 28:02d}/{1 + d // 31:02d}/2024", "open" if d == days - 1 and uid % 2 else "closed")
+        for d in range(days)
+        for uid in range(users)
+    ]
+    conn.executemany("INSERT INTO sessions(tg_user_id,date_str,status) VALUES(?,?,?)", sessions)
+    conn.executemany(
+        "INSERT INTO items(session_id,order_index,username,followers_normalized) VALUES(?,?,?,?)",
+        (
+            (sid, i + 1, f"user_{i}", f"{1000 + i:,}")
+            for sid in range(1, len(sessions) + 1)
+            for i in range(items)
+        ),
+    )
+    conn.commit()
+    return len(sessions)
+
+
+def time_queries(conn: sqlite3.Connection, users: int, sessions: int, runs: int) -> dict[str, float]:
+    """Median latency (ms) per query."""
+    r = random.Random(0)
+    out = {}
+    for label, sql, params in QUERIES:
+        samples = []
+        for _ in range(runs):
+            args = params(r, users, sessions)
+            t0 = time.perf_counter()
+            conn.execute(sql, args).fetchall()
+            samples.append((time.perf_counter() - t0) * 1000)
+        out[label] = statistics.median(samples)
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--items", type=int, default=20, help="screenshots per session")
+    ap.add_argument("--runs", type=int, default=200, help="timed executions per query")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(Path(tmp) / "bench.db")
+        conn.row_factory = sqlite3.Row
+        db.migrate(conn, target=0)
+        sessions = populate(conn, args.users, args.items)
+        print(f"{sessions} sessions, {sessions * args.items} items")
+
+        before = time_queries(conn, args.users, sessions, args.runs)
+        t0 = time.perf_counter()
+        version = db.migrate(conn)
+        print(f"migrated to v{version} in {time.perf_counter() - t0:.2f}s")
+        after = time_queries(conn, args.users, sessions, args.runs)
+        conn.close()
+
+    print(f"{'query':<16}{'v0 ms':>10}{'v' + str(version) + ' ms':>10}{'speedup':>10}")
+    for label, *_ in QUERIES:
+        speedup = before[label] / after[label] if after[label] else float("inf")
+        print(f"{label:<16}{before[label]:>10.3f}{after[label]:>10.3f}{speedup:>9.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Per-screenshot matching cost: the old per-entry Python loop vs OrderIndex.
+
+"loop" is best_match as it was before OrderIndex (fuzz_ratio called once per
+order entry); "index" is a prebuilt OrderIndex, as order_cache hands it out;
+"ocr_index" is the same with the OCR-confusion scorer (MATCH_SCORER=ocr).
+Each round matches 50 OCR-like candidates (one character off, some with a
+trailing "_") against orders of 10, 100 and 1,000 handles.
+
+Needs pytest-benchmark (pip install ".[dev]"). Run from the project root:
+    python -m pytest benchmarks/test_matching_bench.py --benchmark-group-by=param:size
+"""
+
+import random
+import string
+
+import pytest
+
+from src.services.matching import OrderIndex, fuzz_ratio
+
+SIZES = [10, 100, 1000]
+
+
+def loop_best_match(candidate, order_list, threshold=80):
+    best_i, best_s = None, -1
+    for i, target in enumerate(order_list):
+        s = fuzz_ratio(candidate, target)
+        if s > best_s:
+            best_i, best_s = i, s
+    return (best_i, best_s) if best_s >= threshold else (None, best_s)
+
+
+def make_case(size: int, queries: int = 50, seed: int = 0):
+    r = random.Random(seed)
+    alphabet = string.ascii_lowercase + "._0123456789"
+    handles = ["".join(r.choices(alphabet, k=r.randint(5, 18))) for _ in range(size)]
+    candidates = []
+    for _ in range(queries):
+        h = r.choice(handles)
+        k = r.randrange(len(h))
+        c = h[:k] + r.choice("x0o1l") + h[k + 1:]
+        candidates.append(c + "_" if r.random() < 0.3 else c)
+    return handles, candidates
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_loop(benchmark, size):
+    handles, candidates = make_case(size)
+    benchmark(lambda: [loop_best_match(c, handles, 75) for c in candidates])
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_index(benchmark, size):
+    handles, candidates = make_case(size)
+    index = OrderIndex(handles)
+    results = benchmark(lambda: [index.match(c, 75) for c in candidates])
+    assert [i for i, _ in results] == [loop_best_match(c, handles, 75)[0] for c in candidates]
+
+
+@pytest.mark.parametrize("size", SIZES)
+def test_ocr_index(benchmark, size):
+    handles, candidates = make_case(size)
+    index = OrderIndex(handles, "ocr")
+    benchmark(lambda: [index.match(c, 75) for c in candidates])
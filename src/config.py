@@ -39,6 +39,40 @@ BOSS_THREAD_ID = _get_int("BOSS_THREAD_ID", 0) or 0
 # If True, ignore DB overrides and always use .env BOSS_CHAT_ID / BOSS_THREAD_ID
 FORCE_ENV_DESTINATION = _get_bool("FORCE_ENV_DESTINATION", False)
 
+# How updates arrive:
+#   polling : long-poll getUpdates (default; easiest for local dev)
+#   webhook : Telegram POSTs updates to WEBHOOK_BASE_URL + WEBHOOK_PATH (needs public HTTPS)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower().strip()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").strip().rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook").strip() or "/telegram/webhook"
+# Telegram sends this back in X-Telegram-Bot-Api-Secret-Token; requests without it are rejected
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "").strip()
+# Local HTTP server for webhook mode (Render and most hosts provide PORT)
+WEBAPP_HOST = os.getenv("WEBAPP_HOST", "0.0.0.0").strip()
+WEBAPP_PORT = _get_int("PORT", 8080) or 8080
+# On shutdown, wait this long for updates still being handled
+WEBHOOK_DRAIN_SEC = float(os.getenv("WEBHOOK_DRAIN_SEC", "25") or "25")
+
+# Wizard (FSM) state is persisted to SQLite; changes are batched and written at most this often
+FSM_FLUSH_SEC = float(os.getenv("FSM_FLUSH_SEC", "1.0") or "1.0")
+
+# Bot API server base URL, e.g. a local telegram-bot-api or a fake server in tests.
+# Empty = https://api.telegram.org
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "").strip().rstrip("/")
+
+# /send delivery limits. Telegram allows ~20 messages/min into one group and ~30/sec overall;
+# 429 flood-control replies are honoured on top of these.
+DELIVERY_CHAT_PER_MIN = float(os.getenv("DELIVERY_CHAT_PER_MIN", "20") or "20")
+# Messages one chat may receive back-to-back before the per-minute pace applies
+DELIVERY_CHAT_BURST = float(os.getenv("DELIVERY_CHAT_BURST", "3") or "3")
+DELIVERY_GLOBAL_PER_SEC = float(os.getenv("DELIVERY_GLOBAL_PER_SEC", "25") or "25")
+DELIVERY_MAX_RETRIES = _get_int("DELIVERY_MAX_RETRIES", 5) or 5
+# /send mode: album = media groups of up to 10 photos per call, single = one photo per call
+# (/send album or /send single overrides it per run)
+SEND_MODE = "album" if os.getenv("SEND_MODE", "album").lower().strip() == "album" else "single"
+# Minimum seconds between edits of the "Sending n/N" progress message
+DELIVERY_PROGRESS_EVERY_SEC = float(os.getenv("DELIVERY_PROGRESS_EVERY_SEC", "3") or "3")
+
 
 # ───────────────────────────── OpenAI / OCR ───────────────────────────── #
 
@@ -48,22 +82,81 @@ OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini").strip()
 
 # OCR mode:
 #   local  : only Tesseract (fast, no network)
-#   hybrid : try local first; fallback to OpenAI if fields missing
+#   hybrid : try local first; fallback to OpenAI if fields missing or confidence is low
 #   openai : only OpenAI vision
 #   manual : skip OCR; ask you to reply with username/followers
 OCR_MODE = os.getenv("OCR_MODE", "hybrid").lower().strip()
 
+# hybrid: escalate to OpenAI when the local read's confidence is below this (0..1)
+LOCAL_OCR_MIN_CONFIDENCE = float(os.getenv("LOCAL_OCR_MIN_CONFIDENCE", "0.7") or "0.7")
+
 # Tesseract path (Windows users set this if tesseract.exe is not in PATH)
 TESSERACT_CMD = os.getenv("TESSERACT_CMD", "").strip()
 
+# Local OCR backend:
+#   pytesseract : spawn the tesseract CLI per call (default, no extra install)
+#   tesserocr   : keep one loaded Tesseract API per worker process (pip install tesserocr);
+#                 falls back to pytesseract if the module is missing
+OCR_BACKEND = os.getenv("OCR_BACKEND", "pytesseract").lower().strip()
+TESSERACT_LANG = os.getenv("TESSERACT_LANG", "eng").strip() or "eng"
+
 # Throttling / UX knobs
 OPENAI_MAX_RPM = float(os.getenv("OPENAI_MAX_RPM", "3") or "3")
 OPENAI_MAX_TPM = float(os.getenv("OPENAI_MAX_TPM", "100000") or "100000")
-OPENAI_TOKENS_PER_IMAGE = float(os.getenv("OPENAI_TOKENS_PER_IMAGE", "900") or "900")
+# Per-image token estimate for ETAs; 0 = derive from the prepared image size below
+OPENAI_TOKENS_PER_IMAGE = float(os.getenv("OPENAI_TOKENS_PER_IMAGE", "0") or "0")
+
+# Image preprocessing before upload (smaller request, fewer image tokens)
+#   OPENAI_IMAGE_MAX_EDGE     : long edge after resizing (px)
+#   OPENAI_IMAGE_FORMAT       : jpeg | webp
+#   OPENAI_IMAGE_QUALITY      : encoder quality 1..95
+#   OPENAI_CROP_TOP_FRACTION  : keep only this top part of tall screenshots (1 = no crop)
+#   OPENAI_IMAGE_MAX_TILES    : high detail bills per 512px tile; shrink to at most this many
+#   OPENAI_IMAGE_DETAIL       : high | low (low = one 512px view at the base price, no tiles)
+OPENAI_IMAGE_MAX_EDGE = _get_int("OPENAI_IMAGE_MAX_EDGE", 1024) or 1024
+OPENAI_IMAGE_FORMAT = os.getenv("OPENAI_IMAGE_FORMAT", "jpeg").lower().strip()
+OPENAI_IMAGE_QUALITY = _get_int("OPENAI_IMAGE_QUALITY", 80) or 80
+OPENAI_CROP_TOP_FRACTION = float(os.getenv("OPENAI_CROP_TOP_FRACTION", "0.5") or "0.5")
+OPENAI_IMAGE_MAX_TILES = _get_int("OPENAI_IMAGE_MAX_TILES", 2) or 2
+OPENAI_IMAGE_DETAIL = "low" if os.getenv("OPENAI_IMAGE_DETAIL", "high").lower().strip() == "low" else "high"
+
+# Micro-batching: screenshots arriving within the window share ONE vision request
+# (capped further so one request's image tokens fit within OPENAI_MAX_TPM)
+OPENAI_BATCH_MAX = _get_int("OPENAI_BATCH_MAX", 8) or 1
+OPENAI_BATCH_WINDOW_SEC = float(os.getenv("OPENAI_BATCH_WINDOW_SEC", "2.0") or "2.0")
 
 QUEUE_NOTIFY_THRESHOLD = int(os.getenv("QUEUE_NOTIFY_THRESHOLD", "5"))
 MAX_START_WAIT_SEC = int(os.getenv("MAX_START_WAIT_SEC", "300"))
 
+# Local OCR engine: Tesseract runs in worker processes, off the event loop.
+#   OCR_WORKERS     : number of worker processes (default: CPU cores, max 4)
+#   OCR_MAX_PENDING : jobs allowed in the pool at once; extra images wait (backpressure)
+OCR_WORKERS = _get_int("OCR_WORKERS", 0) or min(4, os.cpu_count() or 1)
+OCR_MAX_PENDING = _get_int("OCR_MAX_PENDING", 32) or 32
+
+# Screenshot pipeline: concurrent Telegram downloads (DB batching: DB_BATCH_* in db.py)
+DOWNLOAD_CONCURRENCY = _get_int("DOWNLOAD_CONCURRENCY", 8) or 8
+
+# Bulk intake (ZIP archives and albums handled as one batch):
+#   BULK_MAX_FILES         : screenshots taken from one ZIP (the rest are ignored)
+#   BULK_MAX_IMAGE_MB      : ZIP entries larger than this (uncompressed) are skipped
+#   MEDIA_GROUP_WINDOW_SEC : quiet time after an album's last photo before it is processed
+BULK_MAX_FILES = _get_int("BULK_MAX_FILES", 200) or 200
+BULK_MAX_IMAGE_MB = _get_int("BULK_MAX_IMAGE_MB", 15) or 15
+MEDIA_GROUP_WINDOW_SEC = float(os.getenv("MEDIA_GROUP_WINDOW_SEC", "1.0") or "1.0")
+
+# Parsed /set_order lists kept in memory (LRU by user)
+ORDER_CACHE_MAX_USERS = _get_int("ORDER_CACHE_MAX_USERS", 1000) or 1000
+
+# Username matching against the order (services/matching.py):
+#   ocr   : edit distance that forgives OCR confusions (l/1/i, o/0, rn/m, _/.)
+#   ratio : plain fuzz.ratio
+MATCH_SCORER = os.getenv("MATCH_SCORER", "ocr").lower().strip()
+
+# OCR result cache (re-sent screenshots skip OCR entirely)
+OCR_CACHE_TTL_SEC = _get_int("OCR_CACHE_TTL_SEC", 30 * 24 * 3600) or 30 * 24 * 3600
+OCR_CACHE_MAX_ENTRIES = _get_int("OCR_CACHE_MAX_ENTRIES", 5000) or 5000
+
 
 # ───────────────────────────── Timezone ───────────────────────────── #
 
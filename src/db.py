@@ -1,101 +1,415 @@
 """
 SQLite database helpers.
 - Creates tables if missing.
-- Auto-migrates missing columns on existing DBs.
+- Versioned migrations (recorded in PRAGMA user_version) for later changes.
 - Tiny query helper `q` to execute SQL with parameters.
+- Shared connection pool (one writer + a few readers), configured once and
+  used from a small DB thread pool through async helpers, so handlers never
+  open connections or wait on SQLite locks on the event loop.
+- `batch`: write-behind batching of small writes into shared commits.
 """
+import asyncio
+import logging
 import os
-from pathlib import Path
+import queue
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Iterable, Any
+from typing import Any, Callable, Iterable, TypeVar
 
 # Database file lives at project/src/../bot.db
 DB_PATH = Path(os.getenv("BOT_DB_PATH") or (Path(__file__).resolve().parent.parent / "bot.db"))
 
+# Reader connections in the pool (writes always go through a single writer)
+DB_READERS = int(os.getenv("DB_READERS", "4") or "4")
+
+# Write-behind batching: small writes queued within this window share one commit
+DB_BATCH_MAX = int(os.getenv("DB_BATCH_MAX", "100") or "100")
+DB_BATCH_WINDOW_MS = float(os.getenv("DB_BATCH_WINDOW_MS", "20") or "20")
+
+# Applied to every connection when it is opened
+_PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # WAL + NORMAL: no fsync per commit, so a power loss can drop the last commits (never
+    # corrupts). It stays on readers and the startup migration connection; the pooled
+    # writer overrides it with FULL (see _with_writer).
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA busy_timeout = 5000",    # wait for locks (in the DB thread) instead of failing
+    "PRAGMA mmap_size = 134217728",  # 128 MB memory-mapped reads
+    "PRAGMA cache_size = -16000",    # ~16 MB page cache per connection
+)
+
+T = TypeVar("T")
+
+log = logging.getLogger(__name__)
+
 
 def connect() -> sqlite3.Connection:
     """
-    Create a SQLite connection with row_factory returning dict-like rows.
+    Create a configured SQLite connection with row_factory returning dict-like rows.
+    Handlers should use the pooled async helpers below instead.
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    for pragma in _PRAGMAS:
+        conn.execute(pragma)
     return conn
 
 
+# ───────────────────────────── Connection pool ───────────────────────────── #
+
+_executor = ThreadPoolExecutor(max_workers=DB_READERS + 1, thread_name_prefix="db")
+_writer: sqlite3.Connection | None = None
+_writer_lock = threading.Lock()
+_readers: "queue.SimpleQueue[sqlite3.Connection]" = queue.SimpleQueue()
+
+
+def _with_writer(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run fn on the single writer connection as one transaction."""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = connect()
+            # Every write goes through this connection, so this (not NORMAL above) decides
+            # durability. Commits are batched (see BatchWriter), so pay for a real fsync on
+            # each one: a confirmed write survives power loss, not just a process crash
+            _writer.execute("PRAGMA synchronous = FULL")
+        try:
+            result = fn(_writer)
+            _writer.commit()
+            return result
+        except BaseException:
+            _writer.rollback()
+            raise
+
+
+def _with_reader(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run fn on a pooled reader connection (opened on demand; the DB thread pool caps how many)."""
+    try:
+        conn = _readers.get_nowait()
+    except queue.Empty:
+        conn = connect()
+    try:
+        return fn(conn)
+    finally:
+        _readers.put(conn)
+
+
+async def write(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run fn(conn) in a DB thread on the writer connection; commits, or rolls back on error."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, _with_writer, fn)
+
+
+async def read(fn: Callable[[sqlite3.Connection], T]) -> T:
+    """Run fn(conn) in a DB thread on a reader connection."""
+    return await asyncio.get_running_loop().run_in_executor(_executor, _with_reader, fn)
+
+
+async def fetchone(sql: str, params: Iterable[Any] | None = None) -> sqlite3.Row | None:
+    return await read(lambda conn: q(conn, sql, params).fetchone())
+
+
+async def fetchall(sql: str, params: Iterable[Any] | None = None) -> list[sqlite3.Row]:
+    return await read(lambda conn: q(conn, sql, params).fetchall())
+
+
+async def execute(sql: str, params: Iterable[Any] | None = None) -> int:
+    """Run one write statement and commit. Returns the last inserted row id."""
+    return await write(lambda conn: q(conn, sql, params).lastrowid)
+
+
+# ───────────────────────────── Batched writes ───────────────────────────── #
+
+class BatchWriter:
+    """
+    Write-behind for single statements (item inserts/updates). Statements
+    queued within `window_sec` (or until `max_batch` are waiting) run in ONE
+    writer transaction, i.e. one WAL commit/fsync for the whole batch.
+
+    `execute()` returns only after the batch containing the statement has
+    committed, so callers may confirm to the user as soon as it returns.
+    If a batch fails, its statements are retried one by one so a single bad
+    row only fails its own caller.
+    """
+
+    def __init__(self, max_batch: int, window_sec: float):
+        self.max_batch = max(1, max_batch)
+        self.window_sec = max(0.0, window_sec)
+        self._pending: list[tuple[str, tuple, asyncio.Future]] = []
+        self._timer: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+        self.batches = 0
+        self.statements = 0
+
+    async def execute(self, sql: str, params: Iterable[Any] | None = None) -> int:
+        """Queue one statement; returns its lastrowid once committed."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((sql, tuple(params or []), fut))
+        if len(self._pending) >= self.max_batch:
+            asyncio.ensure_future(self.flush())
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+        return await fut
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window_sec)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Commit everything queued so far (batches commit in queue order)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._pending:
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+                await self._commit(batch)
+
+    async def _commit(self, batch: list[tuple[str, tuple, asyncio.Future]]) -> None:
+        try:
+            ids = await write(lambda conn: [q(conn, sql, params).lastrowid for sql, params, _ in batch])
+        except Exception:
+            # Isolate the failing statement(s); the rest still commit
+            for sql, params, fut in batch:
+                try:
+                    row_id = await write(lambda conn: q(conn, sql, params).lastrowid)
+                except Exception as e:
+                    if not fut.done():
+                        fut.set_exception(e)
+                else:
+                    if not fut.done():
+                        fut.set_result(row_id)
+            return
+        self.batches += 1
+        self.statements += len(batch)
+        for (_, _, fut), row_id in zip(batch, ids):
+            if not fut.done():
+                fut.set_result(row_id)
+
+
+# Shared batcher for hot-path item writes
+batch = BatchWriter(max_batch=DB_BATCH_MAX, window_sec=DB_BATCH_WINDOW_MS / 1000.0)
+
+
+def close_pool() -> None:
+    """Close pooled connections (called on shutdown)."""
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    while True:
+        try:
+            _readers.get_nowait().close()
+        except queue.Empty:
+            break
+    _executor.shutdown(wait=False)
+
+
 def _add_column_if_missing(conn: sqlite3.Connection, table: str, column: str, coltype: str) -> None:
     """
-    Idempotent migration: add a column if it doesn't already exist.
+    Idempotent helper for migrations: add a column if it doesn't already exist.
     """
     cur = conn.execute(f"PRAGMA table_info({table})")
     cols = {row["name"] for row in cur.fetchall()}
     if column not in cols:
         conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {coltype}")
-        conn.commit()
 
 
-def init_db() -> None:
-    """
-    Initialize database schema if not present and apply lightweight migrations.
-    """
-    conn = connect()
-    cur = conn.cursor()
-    cur.executescript(
-        """
-        PRAGMA journal_mode = WAL;
-
-        -- Telegram users that interacted with the bot
-        CREATE TABLE IF NOT EXISTS users (
-            id            INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_user_id    INTEGER UNIQUE,   -- telegram user id
-            boss_chat_id  INTEGER,          -- optional boss chat override
-            tz            TEXT,             -- optional timezone override
-            created_at    TEXT              -- when the user first interacted
-            -- (boss_thread_id / updated_at are added via migration below)
-        );
-
-        -- Per-user ordered list of usernames to enforce when sending
-        CREATE TABLE IF NOT EXISTS username_orders (
-            id             INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_user_id     INTEGER UNIQUE,
-            usernames_json TEXT,           -- JSON array of strings
-            updated_at     TEXT
-        );
-
-        -- A session groups multiple screenshots (one per day)
-        CREATE TABLE IF NOT EXISTS sessions (
-            id         INTEGER PRIMARY KEY AUTOINCREMENT,
-            tg_user_id INTEGER,
-            date_str   TEXT,               -- DD/MM/YYYY
-            status     TEXT,               -- 'open' | 'closed'
-            created_at TEXT,
-            closed_at  TEXT
-        );
-
-        -- One row per uploaded image
-        CREATE TABLE IF NOT EXISTS items (
-            id                   INTEGER PRIMARY KEY AUTOINCREMENT,
-            session_id           INTEGER,
-            order_index          INTEGER,   -- 1-based index in the order list
-            username             TEXT,
-            followers_raw        TEXT,      -- raw OCR string
-            followers_normalized TEXT,      -- normalized "80,200" style
-            image_file_id        TEXT,      -- Telegram file id to re-send
-            ocr_confidence       REAL,      -- 0..1
-            corrected            INTEGER,   -- 0/1 flag if user edited
-            created_at           TEXT
-        );
-        """
-    )
-    conn.commit()
+# ─────────────────────────────── Schema ─────────────────────────────── #
+
+# Version 0: the original tables. Everything after this is a numbered migration.
+_BASE_SCHEMA = """
+-- Telegram users that interacted with the bot
+CREATE TABLE IF NOT EXISTS users (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    tg_user_id    INTEGER UNIQUE,   -- telegram user id
+    boss_chat_id  INTEGER,          -- optional boss chat override
+    tz            TEXT,             -- optional timezone override
+    created_at    TEXT              -- when the user first interacted
+    -- (boss_thread_id / updated_at are added by migration 1)
+);
 
-    # ---- Lightweight migrations (safe to run every start) ----
+-- Per-user ordered list of usernames to enforce when sending
+CREATE TABLE IF NOT EXISTS username_orders (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    tg_user_id     INTEGER UNIQUE,
+    usernames_json TEXT,           -- JSON array of strings
+    updated_at     TEXT
+);
+
+-- A session groups multiple screenshots (one per day)
+CREATE TABLE IF NOT EXISTS sessions (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    tg_user_id INTEGER,
+    date_str   TEXT,               -- DD/MM/YYYY
+    status     TEXT,               -- 'open' | 'closed'
+    created_at TEXT,
+    closed_at  TEXT
+);
+
+-- One row per uploaded image
+CREATE TABLE IF NOT EXISTS items (
+    id                   INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id           INTEGER,
+    order_index          INTEGER,   -- 1-based index in the order list
+    username             TEXT,
+    followers_raw        TEXT,      -- raw OCR string
+    followers_normalized TEXT,      -- normalized "80,200" style
+    image_file_id        TEXT,      -- Telegram file id to re-send
+    ocr_confidence       REAL,      -- 0..1
+    corrected            INTEGER,   -- 0/1 flag if user edited
+    created_at           TEXT
+);
+"""
+
+
+def _m001_user_destination(conn: sqlite3.Connection) -> None:
     # Needed for posting into a specific forum topic (e.g., "Work Proof")
     _add_column_if_missing(conn, "users", "boss_thread_id", "INTEGER")
     # Commands like /set_boss_here and /set_topic_here update this
     _add_column_if_missing(conn, "users", "updated_at", "TEXT")
 
-    conn.close()
+
+def _m002_ocr_cache(conn: sqlite3.Connection) -> None:
+    # OCR results keyed by image content, so re-sent screenshots skip OCR
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            content_hash   TEXT PRIMARY KEY, -- sha256 of the image bytes
+            file_unique_id TEXT,             -- Telegram's stable id for the same file
+            username       TEXT,
+            followers      TEXT,
+            confidence     REAL,
+            created_at     REAL,             -- unix time (TTL)
+            last_used_at   REAL              -- unix time (LRU)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_ocr_cache_file_unique_id ON ocr_cache(file_unique_id)")
+
+
+def _m003_lookup_indexes(conn: sqlite3.Connection) -> None:
+    # "Open session for this user": WHERE tg_user_id=? AND status='open' ORDER BY id DESC
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_sessions_user_status ON sessions(tg_user_id, status, id)")
+    # Items of a session (review/send/undo): WHERE session_id=? [ORDER BY ...]
+    conn.execute("CREATE INDEX IF NOT EXISTS ix_items_session_order ON items(session_id, order_index)")
+
+
+def _m004_deliveries(conn: sqlite3.Connection) -> None:
+    # What /send already delivered where, so a re-run resumes instead of re-sending
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id         INTEGER PRIMARY KEY AUTOINCREMENT,
+            item_id    INTEGER,
+            chat_id    INTEGER,
+            message_id INTEGER,            -- Telegram message id of the sent photo
+            status     TEXT,               -- 'sent' | 'failed'
+            updated_at TEXT
+        )
+        """
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_deliveries_item_chat ON deliveries(item_id, chat_id)")
+
+
+def _m005_delivery_destination(conn: sqlite3.Connection) -> None:
+    # A destination is chat + forum topic (0 = no topic); count attempts, stamp successes
+    _add_column_if_missing(conn, "deliveries", "thread_id", "INTEGER NOT NULL DEFAULT 0")
+    _add_column_if_missing(conn, "deliveries", "attempts", "INTEGER NOT NULL DEFAULT 1")
+    _add_column_if_missing(conn, "deliveries", "sent_at", "TEXT")
+    conn.execute("UPDATE deliveries SET sent_at=updated_at WHERE status='sent' AND sent_at IS NULL")
+    conn.execute("DROP INDEX IF EXISTS ux_deliveries_item_chat")
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_deliveries_destination ON deliveries(item_id, chat_id, thread_id)"
+    )
+
+
+def _m006_fsm_state(conn: sqlite3.Connection) -> None:
+    # Wizard step + data per aiogram storage key, so restarts keep everyone's place
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            key        TEXT PRIMARY KEY,   -- bot:chat:user:thread:business:destiny
+            state      TEXT,               -- e.g. 'Intake:collecting_images'
+            data_json  TEXT,
+            updated_at TEXT
+        )
+        """
+    )
+
+
+def _m007_item_images(conn: sqlite3.Connection) -> None:
+    # Screenshots that arrived inside a ZIP have no Telegram file id; /send uploads these bytes
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS item_images (
+            item_id INTEGER PRIMARY KEY,   -- items.id
+            data    BLOB NOT NULL
+        )
+        """
+    )
+
+
+def _m008_item_image_keys(conn: sqlite3.Connection) -> None:
+    # The screenshot's ocr_cache keys, so a correction can fix the cached read too
+    _add_column_if_missing(conn, "items", "image_hash", "TEXT")
+    _add_column_if_missing(conn, "items", "image_file_unique_id", "TEXT")
+
+
+# (version, description, apply). Append only; never renumber or edit a shipped step.
+# Steps must be idempotent: a crash between a step and its version bump re-runs it.
+MIGRATIONS: list[tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "users.boss_thread_id / users.updated_at", _m001_user_destination),
+    (2, "ocr_cache table", _m002_ocr_cache),
+    (3, "indexes for open-session and session-items lookups", _m003_lookup_indexes),
+    (4, "deliveries ledger", _m004_deliveries),
+    (5, "deliveries per chat + topic, attempts, sent_at", _m005_delivery_destination),
+    (6, "fsm_state table", _m006_fsm_state),
+    (7, "item_images table", _m007_item_images),
+    (8, "items.image_hash / items.image_file_unique_id", _m008_item_image_keys),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Schema version recorded in the database file (PRAGMA user_version)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection, target: int | None = None) -> int:
+    """
+    Create the base tables and apply pending migrations up to `target`
+    (default: latest). Each step commits together with its version bump.
+    Returns the resulting schema version.
+    """
+    conn.executescript(_BASE_SCHEMA)
+    current = schema_version(conn)
+    target = SCHEMA_VERSION if target is None else target
+    for version, description, apply in MIGRATIONS:
+        if current < version <= target:
+            try:
+                apply(conn)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            log.info("DB migrated to v%d: %s", version, description)
+            current = version
+    return current
+
+
+def init_db() -> None:
+    """
+    Initialize database schema if not present and apply pending migrations.
+    """
+    conn = connect()
+    try:
+        migrate(conn)
+    finally:
+        conn.close()
 
 
 def q(conn: sqlite3.Connection, sql: str, params: Iterable[Any] | None = None) -> sqlite3.Cursor:
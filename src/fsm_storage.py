@@ -0,0 +1,129 @@
+"""
+SQLite-backed FSM storage for aiogram (table `fsm_state`).
+
+The wizard step (`Intake` in handlers/sessions.py) and its data survive
+restarts and deploys.
+- Reads are served from memory; every row is loaded once at startup.
+- Writes are write-behind: changed keys are flushed together in one
+  transaction at most every FSM_FLUSH_SEC, so a burst of transitions costs
+  one commit instead of one per step. A crash can lose at most that window.
+- close() (run by the dispatcher on shutdown) flushes whatever is pending.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from . import db
+from .config import FSM_FLUSH_SEC
+
+log = logging.getLogger(__name__)
+
+
+def _key(key: StorageKey) -> str:
+    return ":".join(
+        str(part) if part is not None else ""
+        for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+    )
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, flush_sec: float = FSM_FLUSH_SEC):
+        self.flush_sec = flush_sec
+        self._states: dict[str, str | None] = {}
+        self._data: dict[str, dict[str, Any]] = {}
+        self._dirty: set[str] = set()
+        self._flusher: asyncio.Task | None = None
+        self._flush_lock: asyncio.Lock | None = None
+
+    async def load(self) -> int:
+        """Read every saved state into memory (call once before polling). Returns the row count."""
+        rows = await db.fetchall("SELECT key, state, data_json FROM fsm_state")
+        for r in rows:
+            self._states[r["key"]] = r["state"]
+            self._data[r["key"]] = json.loads(r["data_json"]) if r["data_json"] else {}
+        log.info("Restored %d FSM state(s)", len(rows))
+        return len(rows)
+
+    # ───────────────────────────── BaseStorage ───────────────────────────── #
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k = _key(key)
+        self._states[k] = state.state if isinstance(state, State) else state
+        self._mark(k)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return self._states.get(_key(key))
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        k = _key(key)
+        self._data[k] = dict(data)
+        self._mark(k)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict(self._data.get(_key(key), {}))
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+
+    # ───────────────────────────── Write-behind ───────────────────────────── #
+
+    def _mark(self, k: str) -> None:
+        self._dirty.add(k)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_sec)
+        # From here on a new change schedules its own flush instead of relying
+        # on this one (which may already be past reading _dirty)
+        self._flusher = None
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("FSM state flush failed; will retry on the next change")
+
+    async def flush(self) -> None:
+        """Write all changed keys in one transaction (empty state + data deletes the row)."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        # One flush at a time, so a newer value is never overwritten by an older write
+        async with self._flush_lock:
+            await self._flush_dirty()
+
+    async def _flush_dirty(self) -> None:
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for k in keys:
+            state, data = self._states.get(k), self._data.get(k)
+            if state is None and not data:
+                deletes.append((k,))
+                self._states.pop(k, None)
+                self._data.pop(k, None)
+            else:
+                upserts.append((k, state, json.dumps(data) if data else None))
+
+        def _write(conn: sqlite3.Connection) -> None:
+            conn.executemany(
+                "INSERT INTO fsm_state(key,state,data_json,updated_at) VALUES(?,?,?,datetime('now')) "
+                "ON CONFLICT(key) DO UPDATE SET state=excluded.state, data_json=excluded.data_json, "
+                "updated_at=excluded.updated_at",
+                upserts,
+            )
+            conn.executemany("DELETE FROM fsm_state WHERE key=?", deletes)
+
+        try:
+            await db.write(_write)
+        except BaseException:
+            self._dirty |= keys  # keep them for the next flush
+            raise
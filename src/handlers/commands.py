@@ -8,7 +8,6 @@ PLUS admin helpers:
  /who_is_topic, /set_topic_here, /set_topic, /debug_send, /where_sending
 """
 
-import json
 from aiogram import Router, types
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
@@ -16,8 +15,13 @@ from aiogram.exceptions import TelegramBadRequest
 
 from .. import db
 from .sessions import Intake
+from ..models import DeliveryItem
+from ..services import order_cache, session_slots
 from ..services.formatting import format_caption
-from ..config import BOSS_CHAT_ID, BOSS_THREAD_ID, FORCE_ENV_DESTINATION
+from ..services.delivery import engine as delivery, DestinationError, ProgressMessage
+from ..services.sending import ALBUM_MAX
+from ..services.vision import cancel_pending
+from ..config import BOSS_CHAT_ID, BOSS_THREAD_ID, FORCE_ENV_DESTINATION, SEND_MODE
 
 router = Router(name="commands")
 
@@ -45,7 +49,7 @@ async def help_cmd(m: types.Message):
         "/set_order - set/change username order (manual)\n"
         "/status - show progress vs order\n"
         "/review - preview captions in order (Step 6)\n"
-        "/send - send images+captions to boss (Step 7)\n"
+        "/send - send images+captions to boss (Step 7; add album/single to pick the mode)\n"
         "/end_session - close session (Step 8)\n"
         "/cancel - cancel session\n"
         "/undo - remove last item\n\n"
@@ -63,188 +67,194 @@ async def set_order_cmd(m: types.Message, state: FSMContext):
 
 @router.message(Command("status"))
 async def status_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        sess = db.q(conn,
-            "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
-            [m.from_user.id]
-        ).fetchone()
-        if not sess:
-            await m.reply("No open session. Use /start_session.")
-            return
+    sess = await db.fetchone(
+        "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
+        [m.from_user.id]
+    )
+    if not sess:
+        await m.reply("No open session. Use /start_session.")
+        return
 
-        order_row = db.q(conn,
-            "SELECT usernames_json FROM username_orders WHERE tg_user_id=?",
-            [m.from_user.id]
-        ).fetchone()
-        order = json.loads(order_row["usernames_json"]) if order_row and order_row["usernames_json"] else []
-
-        items = db.q(conn,
-            "SELECT username, followers_normalized, order_index FROM items WHERE session_id=?",
-            [sess["id"]]
-        ).fetchall()
-
-        captured = {r["order_index"]: (r["username"], r["followers_normalized"]) for r in items if r["order_index"]}
-        lines = []
-        for i, u in enumerate(order, start=1):
-            if i in captured:
-                lines.append(f"{i}. {u} — ✅ {captured[i][1]}")
-            else:
-                lines.append(f"{i}. {u} — ❌ (missing)")
-        if not lines:
-            lines.append("No order set. Use /set_order.")
-        await m.reply("\n".join(lines))
-    finally:
-        conn.close()
+    order = (await order_cache.get(m.from_user.id)).usernames
+
+    items = await db.fetchall(
+        "SELECT username, followers_normalized, order_index FROM items WHERE session_id=?",
+        [sess["id"]]
+    )
+
+    captured = {r["order_index"]: (r["username"], r["followers_normalized"]) for r in items if r["order_index"]}
+    lines = []
+    for i, u in enumerate(order, start=1):
+        if i in captured:
+            lines.append(f"{i}. {u} — ✅ {captured[i][1]}")
+        else:
+            lines.append(f"{i}. {u} — ❌ (missing)")
+    if not lines:
+        lines.append("No order set. Use /set_order.")
+    await m.reply("\n".join(lines))
 
 
 @router.message(Command("review"))
 async def review_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        sess = db.q(conn,
-            "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
-            [m.from_user.id]
-        ).fetchone()
-        if not sess:
-            await m.reply("No open session. Use /start_session.")
-            return
+    sess = await db.fetchone(
+        "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
+        [m.from_user.id]
+    )
+    if not sess:
+        await m.reply("No open session. Use /start_session.")
+        return
 
-        order_row = db.q(conn,
-            "SELECT usernames_json FROM username_orders WHERE tg_user_id=?",
-            [m.from_user.id]
-        ).fetchone()
-        order = json.loads(order_row["usernames_json"]) if order_row and order_row["usernames_json"] else []
-
-        items = db.q(conn, "SELECT * FROM items WHERE session_id=?", [sess["id"]]).fetchall()
-
-        by_idx = {r["order_index"]: r for r in items if r["order_index"]}
-        missing = [u for i, u in enumerate(order, start=1) if i not in by_idx]
-
-        lines = []
-        for i, u in enumerate(order, start=1):
-            r = by_idx.get(i)
-            if not r:
-                lines.append(f"{i}. {u} — ❌ missing")
-                continue
-            cap = format_caption(
-                sess["date_str"], r["username"] or u, i, r["followers_normalized"] or r["followers_raw"] or ""
-            )
-            first_line = cap.splitlines()[0] if cap else ""
-            lines.append(f"{i}. {first_line}")
+    index = await order_cache.get(m.from_user.id)
+    order = index.usernames
+    conflicts = (await session_slots.reassign(sess["id"], index)).conflicts if order else []
 
-        summary = ["Step 6/8 — Review preview:", *lines]
-        if missing:
-            summary.append("\nMissing: " + ", ".join(missing))
-        summary.append("\nIf this looks good, type /send to deliver to your boss.")
-        await m.reply("\n".join(summary))
-    finally:
-        conn.close()
+    items = await db.fetchall("SELECT * FROM items WHERE session_id=?", [sess["id"]])
+
+    by_idx = {r["order_index"]: r for r in items if r["order_index"]}
+    by_id = {r["id"]: r for r in items}
+    missing = [u for i, u in enumerate(order, start=1) if i not in by_idx]
+
+    lines = []
+    for i, u in enumerate(order, start=1):
+        r = by_idx.get(i)
+        if not r:
+            lines.append(f"{i}. {u} — ❌ missing")
+            continue
+        cap = format_caption(
+            sess["date_str"], r["username"] or u, i, r["followers_normalized"] or r["followers_raw"] or ""
+        )
+        first_line = cap.splitlines()[0] if cap else ""
+        lines.append(f"{i}. {first_line}")
+
+    summary = ["Step 6/8 — Review preview:", *lines]
+    if missing:
+        summary.append("\nMissing: " + ", ".join(missing))
+    if conflicts:
+        summary.append("\nConflicts (fix with a reply: username=…):")
+        for c in conflicts:
+            summary.append(
+                f"• {by_id[c.item_id]['username'] or '?'} also matches #{c.slot} {order[c.slot - 1]}, "
+                f"which went to {by_id[c.holder_id]['username'] or '?'}"
+            )
+    summary.append("\nIf this looks good, type /send to deliver to your boss.")
+    await m.reply("\n".join(summary))
 
 
 @router.message(Command("send"))
 async def send_cmd(m: types.Message, bot):
-    conn = db.connect()
-    try:
-        sess = db.q(conn,
-            "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
-            [m.from_user.id]
-        ).fetchone()
-        if not sess:
-            await m.reply("No open session. Use /start_session.")
-            return
+    # /send album | /send single overrides SEND_MODE for this run
+    args = (m.text or "").split(maxsplit=1)
+    mode = args[1].strip().lower() if len(args) > 1 else SEND_MODE
+    if mode not in ("album", "single"):
+        await m.reply(
+            "Usage: /send [album|single]\n"
+            "• album — up to 10 photos per message\n"
+            "• single — one photo per message"
+        )
+        return
 
-        order_row = db.q(conn,
-            "SELECT usernames_json FROM username_orders WHERE tg_user_id=?",
-            [m.from_user.id]
-        ).fetchone()
-        order = json.loads(order_row["usernames_json"]) if order_row and order_row["usernames_json"] else []
-        if not order:
-            await m.reply("No order set. Use /set_order first.")
-            return
+    sess = await db.fetchone(
+        "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
+        [m.from_user.id]
+    )
+    if not sess:
+        await m.reply("No open session. Use /start_session.")
+        return
 
-        items = db.q(conn, "SELECT * FROM items WHERE session_id=?", [sess["id"]]).fetchall()
-        by_idx = {r["order_index"]: r for r in items if r["order_index"]}
+    order = (await order_cache.get(m.from_user.id)).usernames
+    if not order:
+        await m.reply("No order set. Use /set_order first.")
+        return
 
-        # Destination resolution: if FORCE_ENV_DESTINATION is true, always use .env
-        row = db.q(conn,
-            "SELECT boss_chat_id, boss_thread_id FROM users WHERE tg_user_id=?",
-            [m.from_user.id]
-        ).fetchone()
+    items = await db.fetchall("SELECT * FROM items WHERE session_id=?", [sess["id"]])
+    by_idx = {r["order_index"]: r for r in items if r["order_index"]}
 
-        if FORCE_ENV_DESTINATION:
-            boss_chat_id = int(BOSS_CHAT_ID)
-            topic_id = int(BOSS_THREAD_ID) if BOSS_THREAD_ID else None
-        else:
-            boss_chat_id = int(row["boss_chat_id"]) if row and row["boss_chat_id"] else int(BOSS_CHAT_ID)
-            topic_id = (int(row["boss_thread_id"]) if row and row["boss_thread_id"]
-                        else (int(BOSS_THREAD_ID) if BOSS_THREAD_ID else None))
-
-        sent = 0
-        for i, u in enumerate(order, start=1):
-            r = by_idx.get(i)
-            if not r:
-                continue
-            caption = format_caption(
-                sess["date_str"], r["username"] or u, i, r["followers_normalized"] or r["followers_raw"] or ""
-            )
-            try:
-                await bot.send_photo(
-                    chat_id=boss_chat_id,
-                    photo=r["image_file_id"],
-                    caption=caption,
-                    message_thread_id=topic_id,  # routes to a forum topic (e.g., “Work Proof”)
-                )
-                sent += 1
-            except TelegramBadRequest as e:
-                msg = (e.message or "").lower()
-                if "chat not found" in msg or "forbidden" in msg:
-                    await m.reply(
-                        "🚫 I can't send to the configured destination.\n\n"
-                        "Fix one:\n"
-                        "• If it's a **user**, they must open the bot and tap *Start* once.\n"
-                        "• If it's a **group**, add me there; use its negative chat id.\n"
-                        "• If it's a **channel**, add me as admin and use its id.\n"
-                        "• If it's a **forum group** (topics), set the topic with /set_topic_here.\n\n"
-                        "Check with /who_is_boss and /who_is_topic.\n"
-                        "Set with /set_boss_here (in the target chat) and /set_topic_here (inside the topic)."
-                    )
-                    return
-                else:
-                    raise
+    # Destination resolution: if FORCE_ENV_DESTINATION is true, always use .env
+    row = await db.fetchone(
+        "SELECT boss_chat_id, boss_thread_id FROM users WHERE tg_user_id=?",
+        [m.from_user.id]
+    )
+
+    if FORCE_ENV_DESTINATION:
+        boss_chat_id = int(BOSS_CHAT_ID)
+        topic_id = int(BOSS_THREAD_ID) if BOSS_THREAD_ID else None
+    else:
+        boss_chat_id = int(row["boss_chat_id"]) if row and row["boss_chat_id"] else int(BOSS_CHAT_ID)
+        topic_id = (int(row["boss_thread_id"]) if row and row["boss_thread_id"]
+                    else (int(BOSS_THREAD_ID) if BOSS_THREAD_ID else None))
+
+    outgoing = []
+    for i, u in enumerate(order, start=1):
+        r = by_idx.get(i)
+        if not r:
+            continue
+        caption = format_caption(
+            sess["date_str"], r["username"] or u, i, r["followers_normalized"] or r["followers_raw"] or ""
+        )
+        outgoing.append(DeliveryItem(item_id=r["id"], photo=r["image_file_id"] or None, caption=caption))
+
+    # Screenshots that came from a ZIP have no file id: upload their stored bytes
+    no_file_id = [it.item_id for it in outgoing if not it.photo]
+    if no_file_id:
+        rows = await db.fetchall(
+            f"SELECT item_id, data FROM item_images WHERE item_id IN ({','.join('?' * len(no_file_id))})",
+            no_file_id,
+        )
+        images = {r["item_id"]: r["data"] for r in rows}
+        for it in outgoing:
+            if not it.photo:
+                it.data = images.get(it.item_id)
+
+    album_size = ALBUM_MAX if mode == "album" else 1
 
+    status = await m.reply(f"📤 Sending… 0/{len(outgoing)}")
+    try:
+        report = await delivery.deliver(
+            bot, boss_chat_id, topic_id, outgoing, progress=ProgressMessage(status), album_size=album_size
+        )
+    except DestinationError:
         await m.reply(
-            f"Step 7/8 — Sent {sent} item(s) to your boss.\n"
-            "Step 8/8 — Do you want to end this session? Type /end_session to close, or keep sending images then /review."
+            "🚫 I can't send to the configured destination.\n\n"
+            "Fix one:\n"
+            "• If it's a **user**, they must open the bot and tap *Start* once.\n"
+            "• If it's a **group**, add me there; use its negative chat id.\n"
+            "• If it's a **channel**, add me as admin and use its id.\n"
+            "• If it's a **forum group** (topics), set the topic with /set_topic_here.\n\n"
+            "Check with /who_is_boss and /who_is_topic.\n"
+            "Set with /set_boss_here (in the target chat) and /set_topic_here (inside the topic)."
         )
-    finally:
-        conn.close()
+        return
+
+    sent = report.sent
+    if report.skipped:
+        await m.reply(f"↩️ Skipped {report.skipped} item(s) already delivered by an earlier /send.")
+    if report.failed:
+        await m.reply(f"⚠️ {len(report.failed)} item(s) failed to send. Run /send again to retry them.")
+
+    await m.reply(
+        f"Step 7/8 — Sent {sent} item(s) to your boss.\n"
+        "Step 8/8 — Do you want to end this session? Type /end_session to close, or keep sending images then /review."
+    )
 
 
 @router.message(Command("end_session"))
 async def end_session_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "UPDATE sessions SET status='closed', closed_at=datetime('now') WHERE tg_user_id=? AND status='open'",
-             [m.from_user.id])
-        conn.commit()
-        await m.reply("Session closed. ✅")
-    finally:
-        conn.close()
+    await db.execute(
+        "UPDATE sessions SET status='closed', closed_at=datetime('now') WHERE tg_user_id=? AND status='open'",
+        [m.from_user.id],
+    )
+    await m.reply("Session closed. ✅")
 
 
 @router.message(Command("cancel"))
 async def cancel_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "UPDATE sessions SET status='closed', closed_at=datetime('now') WHERE tg_user_id=? AND status='open'",
-             [m.from_user.id])
-        conn.commit()
-        await m.reply("Cancelled current session.")
-    finally:
-        conn.close()
+    await db.execute(
+        "UPDATE sessions SET status='closed', closed_at=datetime('now') WHERE tg_user_id=? AND status='open'",
+        [m.from_user.id],
+    )
+    # Stop any OpenAI requests still queued for this user's screenshots
+    cancel_pending(m.from_user.id)
+    await m.reply("Cancelled current session.")
 
 
 # ───────────────────────────── Admin / debug helpers ───────────────────────────── #
@@ -256,29 +266,21 @@ async def my_id_cmd(m: types.Message):
 
 @router.message(Command("who_is_boss"))
 async def who_is_boss_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        row = db.q(conn, "SELECT boss_chat_id FROM users WHERE tg_user_id=?", [m.from_user.id]).fetchone()
-        if row and row["boss_chat_id"]:
-            await m.reply(f"Boss chat (DB) = {row['boss_chat_id']}")
-        else:
-            await m.reply(f"Boss chat (.env) = {BOSS_CHAT_ID}")
-    finally:
-        conn.close()
+    row = await db.fetchone("SELECT boss_chat_id FROM users WHERE tg_user_id=?", [m.from_user.id])
+    if row and row["boss_chat_id"]:
+        await m.reply(f"Boss chat (DB) = {row['boss_chat_id']}")
+    else:
+        await m.reply(f"Boss chat (.env) = {BOSS_CHAT_ID}")
 
 
 @router.message(Command("set_boss_here"))
 async def set_boss_here_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "INSERT INTO users(tg_user_id,boss_chat_id,updated_at) VALUES(?,?,datetime('now')) "
-             "ON CONFLICT(tg_user_id) DO UPDATE SET boss_chat_id=excluded.boss_chat_id, updated_at=datetime('now')",
-             [m.from_user.id, m.chat.id])
-        conn.commit()
-        await m.reply(f"✅ Boss chat set to current chat: {m.chat.id}")
-    finally:
-        conn.close()
+    await db.execute(
+        "INSERT INTO users(tg_user_id,boss_chat_id,updated_at) VALUES(?,?,datetime('now')) "
+        "ON CONFLICT(tg_user_id) DO UPDATE SET boss_chat_id=excluded.boss_chat_id, updated_at=datetime('now')",
+        [m.from_user.id, m.chat.id],
+    )
+    await m.reply(f"✅ Boss chat set to current chat: {m.chat.id}")
 
 
 @router.message(Command("set_boss"))
@@ -302,29 +304,21 @@ async def set_boss_cmd(m: types.Message, bot):
             await m.reply("Invalid id. Use a number or @username.")
             return
 
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "INSERT INTO users(tg_user_id,boss_chat_id,updated_at) VALUES(?,?,datetime('now')) "
-             "ON CONFLICT(tg_user_id) DO UPDATE SET boss_chat_id=excluded.boss_chat_id, updated_at=datetime('now')",
-             [m.from_user.id, chat_id])
-        conn.commit()
-        await m.reply(f"✅ Boss chat set to {chat_id}")
-    finally:
-        conn.close()
+    await db.execute(
+        "INSERT INTO users(tg_user_id,boss_chat_id,updated_at) VALUES(?,?,datetime('now')) "
+        "ON CONFLICT(tg_user_id) DO UPDATE SET boss_chat_id=excluded.boss_chat_id, updated_at=datetime('now')",
+        [m.from_user.id, chat_id],
+    )
+    await m.reply(f"✅ Boss chat set to {chat_id}")
 
 
 @router.message(Command("who_is_topic"))
 async def who_is_topic_cmd(m: types.Message):
-    conn = db.connect()
-    try:
-        row = db.q(conn, "SELECT boss_thread_id FROM users WHERE tg_user_id=?", [m.from_user.id]).fetchone()
-        if row and row["boss_thread_id"]:
-            await m.reply(f"Topic (DB) = {row['boss_thread_id']}")
-        else:
-            await m.reply("Topic is not set. Run /set_topic_here inside the topic (thread).")
-    finally:
-        conn.close()
+    row = await db.fetchone("SELECT boss_thread_id FROM users WHERE tg_user_id=?", [m.from_user.id])
+    if row and row["boss_thread_id"]:
+        await m.reply(f"Topic (DB) = {row['boss_thread_id']}")
+    else:
+        await m.reply("Topic is not set. Run /set_topic_here inside the topic (thread).")
 
 
 @router.message(Command("set_topic_here"))
@@ -332,16 +326,12 @@ async def set_topic_here_cmd(m: types.Message):
     if m.message_thread_id is None:
         await m.reply("This chat has no topic context. Run this inside the topic you want.")
         return
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "INSERT INTO users(tg_user_id,boss_thread_id,updated_at) VALUES(?,?,datetime('now')) "
-             "ON CONFLICT(tg_user_id) DO UPDATE SET boss_thread_id=excluded.boss_thread_id, updated_at=datetime('now')",
-             [m.from_user.id, m.message_thread_id])
-        conn.commit()
-        await m.reply(f"✅ Topic set to this thread id: {m.message_thread_id}")
-    finally:
-        conn.close()
+    await db.execute(
+        "INSERT INTO users(tg_user_id,boss_thread_id,updated_at) VALUES(?,?,datetime('now')) "
+        "ON CONFLICT(tg_user_id) DO UPDATE SET boss_thread_id=excluded.boss_thread_id, updated_at=datetime('now')",
+        [m.from_user.id, m.message_thread_id],
+    )
+    await m.reply(f"✅ Topic set to this thread id: {m.message_thread_id}")
 
 
 @router.message(Command("set_topic"))
@@ -355,16 +345,12 @@ async def set_topic_cmd(m: types.Message):
     except ValueError:
         await m.reply("Topic id must be a number.")
         return
-    conn = db.connect()
-    try:
-        db.q(conn,
-             "INSERT INTO users(tg_user_id,boss_thread_id,updated_at) VALUES(?,?,datetime('now')) "
-             "ON CONFLICT(tg_user_id) DO UPDATE SET boss_thread_id=excluded.boss_thread_id, updated_at=datetime('now')",
-             [m.from_user.id, thread_id])
-        conn.commit()
-        await m.reply(f"✅ Topic set to {thread_id}")
-    finally:
-        conn.close()
+    await db.execute(
+        "INSERT INTO users(tg_user_id,boss_thread_id,updated_at) VALUES(?,?,datetime('now')) "
+        "ON CONFLICT(tg_user_id) DO UPDATE SET boss_thread_id=excluded.boss_thread_id, updated_at=datetime('now')",
+        [m.from_user.id, thread_id],
+    )
+    await m.reply(f"✅ Topic set to {thread_id}")
 
 
 @router.message(Command("debug_send"))
@@ -400,22 +386,18 @@ async def debug_send_cmd(m: types.Message, bot):
 
 @router.message(Command("where_sending"))
 async def where_sending(m: types.Message):
-    conn = db.connect()
-    try:
-        row = db.q(conn,
-            "SELECT boss_chat_id, boss_thread_id FROM users WHERE tg_user_id=?",
-            [m.from_user.id]
-        ).fetchone()
-        db_chat = row["boss_chat_id"] if row else None
-        db_topic = row["boss_thread_id"] if row else None
-        effective_chat = BOSS_CHAT_ID if FORCE_ENV_DESTINATION or not db_chat else db_chat
-        effective_topic = BOSS_THREAD_ID if FORCE_ENV_DESTINATION or not db_topic else db_topic
-        await m.reply(
-            "Destination:\n"
-            f"• FORCE_ENV_DESTINATION = {FORCE_ENV_DESTINATION}\n"
-            f"• .env chat = {BOSS_CHAT_ID}, .env topic = {BOSS_THREAD_ID}\n"
-            f"• DB chat = {db_chat}, DB topic = {db_topic}\n"
-            f"→ Effective chat = {effective_chat}, topic = {effective_topic}"
-        )
-    finally:
-        conn.close()
+    row = await db.fetchone(
+        "SELECT boss_chat_id, boss_thread_id FROM users WHERE tg_user_id=?",
+        [m.from_user.id]
+    )
+    db_chat = row["boss_chat_id"] if row else None
+    db_topic = row["boss_thread_id"] if row else None
+    effective_chat = BOSS_CHAT_ID if FORCE_ENV_DESTINATION or not db_chat else db_chat
+    effective_topic = BOSS_THREAD_ID if FORCE_ENV_DESTINATION or not db_topic else db_topic
+    await m.reply(
+        "Destination:\n"
+        f"• FORCE_ENV_DESTINATION = {FORCE_ENV_DESTINATION}\n"
+        f"• .env chat = {BOSS_CHAT_ID}, .env topic = {BOSS_THREAD_ID}\n"
+        f"• DB chat = {db_chat}, DB topic = {db_topic}\n"
+        f"→ Effective chat = {effective_chat}, topic = {effective_topic}"
+    )
@@ -11,18 +11,20 @@ router = Router(name="corrections")
 
 @router.message(Command("undo"))
 async def undo_cmd(m: types.Message) -> None:
-    conn = db.connect()
-    sess = db.q(conn, "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
-                [m.from_user.id]).fetchone()
+    sess = await db.fetchone("SELECT * FROM sessions WHERE tg_user_id=? AND status='open' ORDER BY id DESC LIMIT 1",
+                             [m.from_user.id])
     if not sess:
-        await m.reply("No open session."); conn.close(); return
+        await m.reply("No open session."); return
 
-    last = db.q(conn, "SELECT * FROM items WHERE session_id=? ORDER BY id DESC LIMIT 1", [sess["id"]]).fetchone()
+    last = await db.fetchone("SELECT * FROM items WHERE session_id=? ORDER BY id DESC LIMIT 1", [sess["id"]])
     if not last:
-        await m.reply("Nothing to undo."); conn.close(); return
+        await m.reply("Nothing to undo."); return
 
-    db.q(conn, "DELETE FROM items WHERE id=?", [last["id"]])
-    conn.commit(); conn.close()
+    def _delete(conn):
+        db.q(conn, "DELETE FROM items WHERE id=?", [last["id"]])
+        db.q(conn, "DELETE FROM item_images WHERE item_id=?", [last["id"]])  # ZIP screenshots
+
+    await db.write(_delete)
     await m.reply("Removed last item.")
 
 @router.message(Command("retry_last"))
@@ -1,22 +1,45 @@
 """
 Step 4/8: receive screenshots, OCR, save, and confirm.
+
+Download, OCR and the item insert run as stages of services/pipeline.py,
+so concurrent uploads overlap instead of queueing behind each other.
+
+Bulk intake: a ZIP of screenshots, or an album (photos/documents sharing a
+media_group_id), is one batch job: images are read in parallel, saved in one
+transaction and answered with one summary reply.
 """
 
+import asyncio
 import re
 import logging
+import zipfile
 from aiogram import F, Router, types
 from aiogram.fsm.context import FSMContext
 
 from .. import db
-from ..services.matching import best_match
+from ..models import OCRResult
 from ..services.normalize import clean_username, normalize_followers
-from ..services.local_ocr import extract as local_extract
-from ..services.vision import VisionClient, estimate_wait_seconds
+from ..services import bulk, ocr_cache, order_cache, pipeline, session_slots
+from ..services.imagebuf import ImageBuffer
+from ..services.matching import MATCH_THRESHOLD, OrderIndex
+from ..services.ocr_engine import engine as ocr_engine
+from ..services.vision import (
+    VisionBatcher,
+    VisionCancelled,
+    VisionClient,
+    estimate_wait_seconds,
+)
 from ..config import (
     OPENAI_API_KEY,
+    OPENAI_BATCH_MAX,
+    OPENAI_BATCH_WINDOW_SEC,
     OCR_MODE,
+    LOCAL_OCR_MIN_CONFIDENCE,
     QUEUE_NOTIFY_THRESHOLD,
     MAX_START_WAIT_SEC,
+    BULK_MAX_FILES,
+    BULK_MAX_IMAGE_MB,
+    MEDIA_GROUP_WINDOW_SEC,
 )
 from .sessions import Intake
 
@@ -26,21 +49,30 @@ BOT_IMAGE_HANDLER_VERSION = "1.6.1"
 log = logging.getLogger(__name__)
 log.debug("Images handler version: %s", BOT_IMAGE_HANDLER_VERSION)
 
+
+def _make_vision() -> VisionBatcher:
+    """Vision client behind the micro-batcher (bursts of screenshots share requests)."""
+    return VisionBatcher(
+        VisionClient(api_key=OPENAI_API_KEY),
+        max_batch=OPENAI_BATCH_MAX,
+        window_sec=OPENAI_BATCH_WINDOW_SEC,
+    )
+
+
 # Build Vision client only if an API key exists (created lazily below as well)
 vision = (
-    VisionClient(api_key=OPENAI_API_KEY)
+    _make_vision()
     if (OPENAI_API_KEY and OCR_MODE in ("hybrid", "openai"))
     else None
 )
 
 
-def _get_open_session(conn, uid):
-    return db.q(
-        conn,
+async def _get_open_session(uid):
+    return await db.fetchone(
         "SELECT * FROM sessions WHERE tg_user_id=? AND status='open' "
         "ORDER BY id DESC LIMIT 1",
         [uid],
-    ).fetchone()
+    )
 
 
 def _fmt_eta(seconds: float) -> str:
@@ -55,173 +87,429 @@ def _fmt_eta(seconds: float) -> str:
     return f"{s}s"
 
 
-@router.message(F.photo | F.document)
-async def on_image(m: types.Message, bot, state: FSMContext) -> None:
-    """
-    Accepts photos (compressed) or image documents (original).
-    Saves the item even if you’re not exactly at Step 4, but warns once.
-    """
+def _cacheable(confidence: float | None, from_openai: bool) -> bool:
+    """Only final reads go in ocr_cache: OpenAI's, or a local one that would not be escalated."""
+    return from_openai or (confidence or 0.0) >= LOCAL_OCR_MIN_CONFIDENCE
+
+
+def _image_file(m: types.Message) -> tuple[str, str] | None:
+    """(file_id, file_unique_id) of a photo or image document, else None."""
+    if m.photo:
+        return m.photo[-1].file_id, m.photo[-1].file_unique_id
+    if m.document and m.document.mime_type and m.document.mime_type.startswith("image/"):
+        return m.document.file_id, m.document.file_unique_id
+    return None
+
 
+async def _intake_checks(m: types.Message, state: FSMContext, what: str):
+    """Warn when not at Step 4; returns the open session (None after telling the user)."""
     st = await state.get_state()
     if st != Intake.collecting_images.state:
         await m.reply(
-            "I'll save that image, but you're not in Step 4. "
+            f"I'll save {what}, but you're not in Step 4. "
             "Use /start_session → date → order → then send screenshots."
         )
 
-    conn = db.connect()
+    sess = await _get_open_session(m.from_user.id)
+    if not sess:
+        await m.reply("No open session. Use /start_session first.")
+    return sess
+
+
+# ───────────────────────────── Bulk intake ───────────────────────────── #
+
+# Largest file the Bot API lets a bot download
+_MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+albums: bulk.MediaGroupCollector[types.Message] = bulk.MediaGroupCollector(MEDIA_GROUP_WINDOW_SEC)
+
+
+def _is_zip(m: types.Message) -> bool:
+    d = m.document
+    return bool(d) and (
+        (d.mime_type or "") in ("application/zip", "application/x-zip-compressed")
+        or (d.file_name or "").lower().endswith(".zip")
+    )
+
+
+class _Shot:
+    """One screenshot of a batch: a label for the summary and how to get its bytes."""
+
+    __slots__ = ("label", "file_id", "file_uid", "_load")
+
+    def __init__(self, label: str, load, file_id: str | None = None, file_uid: str | None = None):
+        self.label = label
+        self.file_id = file_id
+        self.file_uid = file_uid
+        self._load = load
+
+    async def load(self) -> ImageBuffer:
+        return await self._load()
+
+
+async def _zip_shots(bot, m: types.Message) -> tuple[list[_Shot], int, str | None]:
+    """Screenshots inside a ZIP document: (shots, skipped entries, error message)."""
+    d = m.document
+    if d.file_size and d.file_size > _MAX_DOWNLOAD_BYTES:
+        return [], 0, f"{d.file_name or 'ZIP'} is over 20 MB, the most Telegram lets me download. Split it up."
+    archive = await pipeline.download(bot, d.file_id)
     try:
-        sess = _get_open_session(conn, m.from_user.id)
-        if not sess:
-            await m.reply("No open session. Use /start_session first.")
-            return
+        zf, entries, skipped = bulk.zip_images(archive.data, BULK_MAX_FILES, BULK_MAX_IMAGE_MB * 1024 * 1024)
+    except zipfile.BadZipFile:
+        return [], 0, f"{d.file_name or 'That file'} isn't a valid ZIP."
+
+    def loader(info):
+        async def load():
+            # Inflating an entry can take a while; keep it off the event loop
+            return ImageBuffer(await asyncio.to_thread(bulk.read_entry, zf, info))
+        return load
+
+    return [_Shot(info.filename, loader(info)) for info in entries], skipped, None
+
+
+def _download_shot(bot, label: str, file_id: str, file_uid: str) -> _Shot:
+    return _Shot(label, lambda: pipeline.download(bot, file_id), file_id, file_uid)
+
+
+async def _bulk_read(shot: _Shot, order: OrderIndex, owner: int) -> dict | None:
+    """
+    Read one screenshot of a batch without messaging the user: OCR cache,
+    local OCR, then OpenAI when the local read is weak and the API is not in
+    a long cooldown (the same rules as on_image). Returns the item fields
+    for pipeline.save_items(), or None if it could not be read.
+    """
+    global vision
+    image = image_hash = None
+    cached = await ocr_cache.lookup(file_unique_id=shot.file_uid) if shot.file_uid else None
+    if cached is None:
+        image = await shot.load()
+        image_hash = ocr_cache.content_hash(image.view())
+        cached = await ocr_cache.lookup(content_hash=image_hash)
+
+    from_openai = False
+    if cached is not None:
+        res = cached
+    else:
+        res = await pipeline.ocr(image, order)
+        username = clean_username(res.username)
+        local_ok = bool(username and normalize_followers(res.followers or ""))
+        local_strong = local_ok and (res.confidence or 0.0) >= LOCAL_OCR_MIN_CONFIDENCE
+        need_openai = (
+            (OCR_MODE in ("openai", "hybrid") and not local_strong)
+            or (OCR_MODE == "local" and bool(OPENAI_API_KEY) and not local_ok)
+        )
+        if need_openai and OPENAI_API_KEY and estimate_wait_seconds() < MAX_START_WAIT_SEC:
+            if not vision:
+                vision = _make_vision()
+            ocr = await vision.extract(image.data, owner=owner)
+            from_openai = bool(ocr.username or ocr.followers)
+            res = OCRResult(
+                username=ocr.username or res.username,
+                followers=ocr.followers or res.followers,
+                confidence=ocr.confidence if ocr.confidence is not None else res.confidence,
+            )
 
-        # Choose file id
-        file_id = None
-        if m.photo:
-            file_id = m.photo[-1].file_id
-        elif (
-            m.document
-            and m.document.mime_type
-            and m.document.mime_type.startswith("image/")
-        ):
-            file_id = m.document.file_id
+    username = clean_username(res.username)
+    followers_norm = normalize_followers(res.followers or "")
+    if not (username and followers_norm):
+        return None
+    if image_hash and _cacheable(res.confidence, from_openai):
+        await ocr_cache.store(image_hash, shot.file_uid, res)
+
+    order_index = None
+    if order:
+        idx, _ = order.match(username, threshold=MATCH_THRESHOLD)
+        order_index = idx + 1 if idx is not None else None
+    return {
+        "order_index": order_index,
+        "username": username,
+        "followers_raw": res.followers,
+        "followers_norm": followers_norm,
+        "file_id": shot.file_id,
+        "confidence": res.confidence or 0.0,
+        "image_hash": image_hash,
+        "file_unique_id": shot.file_uid,
+        # A ZIP entry has no Telegram file id, so /send needs the bytes
+        "image": image.data if shot.file_id is None else None,
+    }
+
+
+async def _ingest(m: types.Message, sess, shots: list[_Shot], skipped: int, errors: list[str]) -> None:
+    """Read a batch in parallel, save it in one transaction and send one summary."""
+    uid = m.from_user.id
+    order = await order_cache.get(uid)
+
+    # Bounded so a big ZIP isn't decompressed all at once (the OCR pool queues the rest anyway)
+    slots = asyncio.Semaphore(ocr_engine.max_pending)
+
+    async def read(shot: _Shot):
+        async with slots:
+            return await _bulk_read(shot, order, uid)
+
+    results = await asyncio.gather(*(read(s) for s in shots), return_exceptions=True)
+    if any(isinstance(r, VisionCancelled) for r in results):
+        await m.reply("Cancelled — this batch was not saved.")
+        return
+
+    good, unreadable = [], []
+    for shot, r in zip(shots, results):
+        if isinstance(r, BaseException):
+            log.error("Bulk read failed for %s", shot.label, exc_info=r)
+        if isinstance(r, dict):
+            good.append(r)
         else:
-            await m.reply("Please send an image (photo or image document).")
-            return
+            unreadable.append(shot.label)
+
+    ids = await pipeline.save_items(sess["id"], good) if good else []
+
+    slots_by_id, conflicts = {i: it["order_index"] for i, it in zip(ids, good)}, []
+    if order and ids:
+        result = await session_slots.reassign(sess["id"], order)
+        slots_by_id = {i: result.slots.get(i) for i in ids}
+        conflicts = [c for c in result.conflicts if c.item_id in slots_by_id]
+
+    matched = sum(1 for v in slots_by_id.values() if v)
+    lines = [f"📦 Batch of {len(shots)} screenshot(s): saved {len(good)}"
+             + (f", {matched} matched to your order." if order else ".")]
+    if conflicts:
+        lines.append(f"⚠️ {len(conflicts)} look like an order entry another screenshot matches better — see /review.")
+    if unreadable:
+        shown = ", ".join(unreadable[:10]) + (f" (+{len(unreadable) - 10} more)" if len(unreadable) > 10 else "")
+        lines.append(f"❗ Couldn't read {len(unreadable)} — send them on their own: {shown}")
+    if skipped:
+        lines.append(
+            f"⏭️ Skipped {skipped} ZIP entr{'y' if skipped == 1 else 'ies'} "
+            f"(over {BULK_MAX_IMAGE_MB} MB or past {BULK_MAX_FILES} files)."
+        )
+    lines.extend(f"🚫 {e}" for e in errors)
+    if order:
+        filled = {r["order_index"] for r in await db.fetchall(
+            "SELECT order_index FROM items WHERE session_id=? AND order_index IS NOT NULL", [sess["id"]]
+        )}
+        missing = sum(1 for i in range(1, len(order) + 1) if i not in filled)
+        lines.append(f"Still missing {missing} of {len(order)} — /status for the list." if missing
+                     else "Every order entry has a screenshot — /review next.")
+    await m.reply("\n".join(lines))
+
+
+@router.message(F.media_group_id, F.photo | F.document)
+async def on_album(m: types.Message, bot, state: FSMContext) -> None:
+    """Photos/documents sent together (one album, possibly with ZIPs) as one batch."""
+    group = await albums.collect((m.chat.id, m.media_group_id), m)
+    if group is None:
+        return  # part of an album another update is collecting
+    group.sort(key=lambda x: x.message_id)
+    first = group[0]
+
+    sess = await _intake_checks(first, state, "these images")
+    if not sess:
+        return
+
+    shots, skipped, errors = [], 0, []
+    for n, msg in enumerate(group, start=1):
+        if _is_zip(msg):
+            zshots, zskipped, error = await _zip_shots(bot, msg)
+            shots += zshots
+            skipped += zskipped
+            errors += [error] if error else []
+        elif (f := _image_file(msg)) is not None:
+            label = msg.document.file_name if msg.document and msg.document.file_name else f"#{n}"
+            shots.append(_download_shot(bot, label, *f))
+        else:
+            errors.append(f"#{n} is not an image or ZIP.")
+    await _ingest(first, sess, shots, skipped, errors)
+
+
+@router.message(F.document, _is_zip)
+async def on_zip(m: types.Message, bot, state: FSMContext) -> None:
+    """A ZIP of screenshots as one batch (entries are read from memory, never unpacked to disk)."""
+    sess = await _intake_checks(m, state, "these images")
+    if not sess:
+        return
+    shots, skipped, error = await _zip_shots(bot, m)
+    if error:
+        await m.reply(f"🚫 {error}")
+        return
+    if not shots:
+        await m.reply("I didn't find any screenshots (.jpg/.png/.webp) in that ZIP.")
+        return
+    await _ingest(m, sess, shots, skipped, [])
 
-        # Download bytes
-        fobj = await bot.get_file(file_id)
-        b = await bot.download_file(fobj.file_path)
-        image_bytes = b.read() if hasattr(b, "read") else b.getvalue()
 
-        # --- Pass 1: Local OCR (fast/offline)
-        lres = local_extract(image_bytes)
+# ───────────────────────────── Single image ───────────────────────────── #
+
+@router.message(F.photo | F.document)
+async def on_image(m: types.Message, bot, state: FSMContext) -> None:
+    """
+    Accepts photos (compressed) or image documents (original).
+    Saves the item even if you’re not exactly at Step 4, but warns once.
+    """
+
+    sess = await _intake_checks(m, state, "that image")
+    if not sess:
+        return
+
+    f = _image_file(m)
+    if f is None:
+        await m.reply("Please send an image (photo or image document).")
+        return
+    file_id, file_uid = f
+
+    # Same Telegram file seen before → reuse its OCR without downloading
+    image_hash = None
+    cached = await ocr_cache.lookup(file_unique_id=file_uid)
+    if cached is None:
+        # Download bytes (download stage)
+        image = await pipeline.download(bot, file_id)
+        image_hash = ocr_cache.content_hash(image.view())
+        cached = await ocr_cache.lookup(content_hash=image_hash)
+
+    # Desired order (cached per user); local OCR decodes the username against it
+    order = await order_cache.get(m.from_user.id)
+
+    want_openai_mode = OCR_MODE in ("openai", "hybrid")
+    have_api_key = bool(OPENAI_API_KEY)
+    from_openai = False
+
+    if cached is not None:
+        username = clean_username(cached.username)
+        followers_raw = cached.followers
+        conf = cached.confidence
+        followers_norm = normalize_followers(followers_raw or "")
+        local_ok = bool(username and followers_norm)
+        need_openai = False
+    else:
+        # --- Pass 1: Local OCR (fast/offline, runs in the worker pool)
+        depth = ocr_engine.depth()
+        if depth >= QUEUE_NOTIFY_THRESHOLD:
+            await m.reply(f"⏳ Queued behind {depth} image(s) — I’ll reply when this one is read.")
+        lres = await pipeline.ocr(image, order)
         username = clean_username(lres.username)
         followers_raw = lres.followers
         conf = lres.confidence
         followers_norm = normalize_followers(followers_raw or "")
         local_ok = bool(username and followers_norm)
+        local_strong = local_ok and (conf or 0.0) >= LOCAL_OCR_MIN_CONFIDENCE
 
         # --- Decide on OpenAI fallback
-        want_openai_mode = OCR_MODE in ("openai", "hybrid")
-        have_api_key = bool(OPENAI_API_KEY)
+        # hybrid/openai: only pay for OpenAI when the local read is weak.
         # NEW: if OCR_MODE=local but local OCR failed AND we have an API key, escalate automatically.
         need_openai = (
-            (want_openai_mode and not local_ok)
+            (want_openai_mode and not local_strong)
             or (OCR_MODE == "local" and have_api_key and not local_ok)
         )
 
-        # Lazily create Vision client if not created yet
-        global vision
-        if need_openai and not vision and have_api_key:
-            vision = VisionClient(api_key=OPENAI_API_KEY)
-
-        # --- Pass 2: OpenAI OCR if needed
-        if need_openai and vision:
-            wait_s = estimate_wait_seconds()
-            if wait_s >= MAX_START_WAIT_SEC:
-                # Save stub, ask user to reply with manual correction
-                db.q(
-                    conn,
-                    "INSERT INTO items(session_id,order_index,username,followers_raw,followers_normalized,"
-                    "image_file_id,ocr_confidence,corrected,created_at) "
-                    "VALUES(?,?,?,?,?,?,?,?,datetime('now'))",
-                    [sess["id"], None, None, None, None, file_id, 0.0, 0],
-                )
-                conn.commit()
-                await m.reply(
-                    "🚦 OpenAI is in long cooldown "
-                    f"(~{_fmt_eta(wait_s)}). I saved the image; reply here with:\n"
-                    "username=handle followers=1234  (or 1.2k/1.2m)"
-                )
-                return
-
-            if wait_s >= QUEUE_NOTIFY_THRESHOLD:
-                await m.reply(
-                    f"⏳ Queued — processing in ~{_fmt_eta(wait_s)}. I’ll update when done."
-                )
-
-            ocr = await vision.extract(image_bytes)
-            if ocr.username:
-                username = clean_username(ocr.username)
-            if ocr.followers:
-                followers_raw = ocr.followers
-            if ocr.confidence is not None:
-                conf = ocr.confidence
-            followers_norm = normalize_followers(followers_raw or "")
-            local_ok = bool(username and followers_norm)
-
-        # If we expected to use OpenAI but **no API key**, be explicit to the user
-        if not local_ok and want_openai_mode and not have_api_key:
+    # Lazily create Vision client if not created yet
+    global vision
+    if need_openai and not vision and have_api_key:
+        vision = _make_vision()
+
+    # --- Pass 2: OpenAI OCR if needed
+    wait_s = estimate_wait_seconds() if (need_openai and vision) else 0.0
+    if need_openai and local_ok and wait_s >= MAX_START_WAIT_SEC:
+        # Weak but usable local read: keep it rather than wait out a long cooldown
+        need_openai = False
+
+    if need_openai and vision:
+        if wait_s >= MAX_START_WAIT_SEC:
+            # Save stub, ask user to reply with manual correction
+            await pipeline.save_item(sess["id"], None, None, None, None, file_id, 0.0, image_hash, file_uid)
             await m.reply(
-                "⚠️ I couldn't read this with local OCR and OpenAI fallback is disabled "
-                "(missing OPENAI_API_KEY). Send a correction reply:\n"
-                "username=handle followers=1234 (or 1.2k/1.2m)"
+                "🚦 OpenAI is in long cooldown "
+                f"(~{_fmt_eta(wait_s)}). I saved the image; reply here with:\n"
+                "username=handle followers=1234  (or 1.2k/1.2m)"
             )
+            return
+
+        if wait_s >= QUEUE_NOTIFY_THRESHOLD:
+            await m.reply(
+                f"⏳ Queued — processing in ~{_fmt_eta(wait_s)}. I’ll update when done."
+            )
+
+        try:
+            ocr = await vision.extract(image.data, owner=m.from_user.id)
+        except VisionCancelled:
+            await m.reply("Cancelled — this image was not saved.")
+            return
+        from_openai = bool(ocr.username or ocr.followers)
+        if ocr.username:
+            username = clean_username(ocr.username)
+        if ocr.followers:
+            followers_raw = ocr.followers
+        if ocr.confidence is not None:
+            conf = ocr.confidence
+        followers_norm = normalize_followers(followers_raw or "")
+        local_ok = bool(username and followers_norm)
+
+    # Remember final reads so a re-sent screenshot skips OCR next time (a weak
+    # local read kept during a cooldown is left out, so a re-send escalates)
+    if image_hash and local_ok and _cacheable(conf, from_openai):
+        await ocr_cache.store(
+            image_hash,
+            file_uid,
+            OCRResult(username=username, followers=followers_raw, confidence=conf),
+        )
 
-        # Load desired order
-        ord_row = db.q(
-            conn,
-            "SELECT usernames_json FROM username_orders WHERE tg_user_id=?",
-            [m.from_user.id],
-        ).fetchone()
-        order = []
-        if ord_row and ord_row["usernames_json"]:
-            import json
-
-            order = json.loads(ord_row["usernames_json"])
-
-        # Match to order index
-        order_index = None
-        match_score = 0
-        if username and order:
-            idx, match_score = best_match(username, order, threshold=75)
-            if idx is not None:
-                order_index = idx + 1
-
-        # Persist item
-        db.q(
-            conn,
-            "INSERT INTO items(session_id,order_index,username,followers_raw,followers_normalized,"
-            "image_file_id,ocr_confidence,corrected,created_at) "
-            "VALUES(?,?,?,?,?,?,?,?,datetime('now'))",
-            [
-                sess["id"],
-                order_index,
-                username,
-                followers_raw,
-                followers_norm,
-                file_id,
-                (conf or 0.0),
-                0,
-            ],
+    # If we expected to use OpenAI but **no API key**, be explicit to the user
+    if not local_ok and want_openai_mode and not have_api_key:
+        await m.reply(
+            "⚠️ I couldn't read this with local OCR and OpenAI fallback is disabled "
+            "(missing OPENAI_API_KEY). Send a correction reply:\n"
+            "username=handle followers=1234 (or 1.2k/1.2m)"
         )
-        conn.commit()
-
-        # User feedback
-        if username and followers_norm:
-            if order and order_index is None:
-                await m.reply(
-                    f"✅ Got it: {username} — {followers_norm}\n"
-                    "But I couldn't match this username to your /set_order list.\n"
-                    "• Reply to fix: username=correct_name\n"
-                    "• Or keep sending screenshots, then /review."
-                )
-            else:
-                oi = order_index if order_index is not None else "?"
-                await m.reply(
-                    f"✅ Detected {username} — {followers_norm} (order #{oi}, match {match_score})"
-                )
+
+    # Match to order index
+    order_index = None
+    match_score = 0
+    if username and order:
+        idx, match_score = order.match(username, threshold=MATCH_THRESHOLD)
+        if idx is not None:
+            order_index = idx + 1
+
+    # Persist item (db stage: batched with other screenshots, committed before we reply)
+    item_id = await pipeline.save_item(
+        sess["id"], order_index, username, followers_raw, followers_norm, file_id, (conf or 0.0),
+        image_hash, file_uid,
+    )
+
+    # One screenshot per slot: re-solve the session so near-identical handles
+    # don't both land on the same order index
+    conflict = None
+    if username and order:
+        result = await session_slots.reassign(sess["id"], order)
+        order_index = result.slots.get(item_id)
+        match_score = result.scores.get(item_id, match_score)
+        conflict = next((c for c in result.conflicts if c.item_id == item_id), None)
+
+    # User feedback
+    if username and followers_norm:
+        if conflict is not None:
+            await m.reply(
+                f"⚠️ Got it: {username} — {followers_norm}\n"
+                f"It looks most like order #{conflict.slot} ({order.usernames[conflict.slot - 1]}), "
+                "but another screenshot matches that one better"
+                + (f", so I put it at #{order_index}." if order_index else ", so it's unassigned for now.")
+                + "\n• Reply to fix: username=correct_name\n• /review lists all conflicts."
+            )
+        elif order and order_index is None:
+            await m.reply(
+                f"✅ Got it: {username} — {followers_norm}\n"
+                "But I couldn't match this username to your /set_order list.\n"
+                "• Reply to fix: username=correct_name\n"
+                "• Or keep sending screenshots, then /review."
+            )
         else:
+            oi = order_index if order_index is not None else "?"
             await m.reply(
-                "❗ I couldn't confidently detect username/followers.\n"
-                f"(debug) I saw: username={username!r} followers={followers_raw!r}\n"
-                "Reply like: username=imsakuraneko followers=1,914  (or 1.2k / 1.2m)"
+                f"✅ Detected {username} — {followers_norm} (order #{oi}, match {match_score})"
             )
+    else:
+        await m.reply(
+            "❗ I couldn't confidently detect username/followers.\n"
+            f"(debug) I saw: username={username!r} followers={followers_raw!r}\n"
+            "Reply like: username=imsakuraneko followers=1,914  (or 1.2k / 1.2m)"
+        )
 
-    finally:
-        conn.close()
 
 
 @router.message(F.reply_to_message, F.text.regexp(r"(?i)username\s*=|followers\s*="))
@@ -236,50 +524,46 @@ async def on_correction(m: types.Message):
     username = clean_username(u.group(1)) if u else None
     followers_raw = f.group(1).strip() if f else None
 
-    conn = db.connect()
-    try:
-        sess = _get_open_session(conn, m.from_user.id)
-        if not sess:
-            await m.reply("No open session.")
-            return
-
-        item = db.q(
-            conn,
-            "SELECT * FROM items WHERE session_id=? ORDER BY id DESC LIMIT 1",
-            [sess["id"]],
-        ).fetchone()
-        if not item:
-            await m.reply("Nothing to correct.")
-            return
-
-        followers_norm = normalize_followers(followers_raw or "") if followers_raw else None
-        new_username = username or item["username"]
-        new_followers_raw = followers_raw or item["followers_raw"]
-        new_followers_norm = followers_norm or item["followers_normalized"]
-
-        # Recompute order index from your /set_order list
-        order_index = item["order_index"]
-        ord_row = db.q(
-            conn,
-            "SELECT usernames_json FROM username_orders WHERE tg_user_id=?",
-            [m.from_user.id],
-        ).fetchone()
-        if ord_row and ord_row["usernames_json"]:
-            import json
-
-            order = json.loads(ord_row["usernames_json"])
-            if new_username:
-                idx, _ = best_match(new_username, order, threshold=75)
-                order_index = idx + 1 if idx is not None else None
-
-        db.q(
-            conn,
-            "UPDATE items SET username=?, followers_raw=?, followers_normalized=?, "
-            "order_index=?, corrected=1 WHERE id=?",
-            [new_username, new_followers_raw, new_followers_norm, order_index, item["id"]],
-        )
-        conn.commit()
-
-        await m.reply(f"✅ Updated {new_username or '—'} — {new_followers_norm or '—'}")
-    finally:
-        conn.close()
+    sess = await _get_open_session(m.from_user.id)
+    if not sess:
+        await m.reply("No open session.")
+        return
+
+    item = await db.fetchone(
+        "SELECT * FROM items WHERE session_id=? ORDER BY id DESC LIMIT 1",
+        [sess["id"]],
+    )
+    if not item:
+        await m.reply("Nothing to correct.")
+        return
+
+    followers_norm = normalize_followers(followers_raw or "") if followers_raw else None
+    new_username = username or item["username"]
+    new_followers_raw = followers_raw or item["followers_raw"]
+    new_followers_norm = followers_norm or item["followers_normalized"]
+
+    # Recompute order index from your /set_order list
+    order_index = item["order_index"]
+    order = await order_cache.get(m.from_user.id)
+    if order:
+        if new_username:
+            idx, _ = order.match(new_username, threshold=MATCH_THRESHOLD)
+            order_index = idx + 1 if idx is not None else None
+
+    await db.batch.execute(
+        "UPDATE items SET username=?, followers_raw=?, followers_normalized=?, "
+        "order_index=?, corrected=1 WHERE id=?",
+        [new_username, new_followers_raw, new_followers_norm, order_index, item["id"]],
+    )
+    # A re-sent copy of this screenshot should come back corrected, not re-read
+    fixed = (
+        OCRResult(username=new_username, followers=new_followers_raw, confidence=1.0)
+        if new_username and new_followers_norm else None
+    )
+    await ocr_cache.correct(item["image_hash"], item["image_file_unique_id"], fixed)
+
+    if order:
+        # The corrected item keeps its slot; anything else there moves over
+        await session_slots.reassign(sess["id"], order)
+
+    await m.reply(f"✅ Updated {new_username or '—'} — {new_followers_norm or '—'}")
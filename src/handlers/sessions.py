@@ -10,6 +10,7 @@ from aiogram import Router, types, F
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from .. import db
+from ..services import order_cache
 
 router = Router(name="sessions")
 
@@ -38,11 +39,8 @@ async def handle_date(m: types.Message, state: FSMContext):
             await m.reply("Invalid date. Use DD/MM/YYYY or YYYY-MM-DD or 'today'.")
             return
 
-    conn = db.connect()
-    db.q(conn, "INSERT INTO sessions(tg_user_id,date_str,status,created_at) VALUES(?,?, 'open', datetime('now'))",
-         [m.from_user.id, ds])
-    conn.commit()
-    conn.close()
+    await db.execute("INSERT INTO sessions(tg_user_id,date_str,status,created_at) VALUES(?,?, 'open', datetime('now'))",
+                     [m.from_user.id, ds])
 
     await state.set_state(Intake.waiting_order)
     await m.reply(
@@ -58,15 +56,8 @@ async def handle_order(m: types.Message, state: FSMContext):
         await m.reply("I didn't see any usernames. Please paste them (one per line or comma-separated).")
         return
 
-    import json
-    conn = db.connect()
-    db.q(conn,
-         "INSERT INTO username_orders(tg_user_id,usernames_json,updated_at) "
-         "VALUES(?,?,datetime('now')) "
-         "ON CONFLICT(tg_user_id) DO UPDATE SET usernames_json=excluded.usernames_json, updated_at=datetime('now')",
-         [m.from_user.id, json.dumps(parts)])
-    conn.commit()
-    conn.close()
+    # Saves to SQLite and replaces the cached copy used for matching
+    await order_cache.set_order(m.from_user.id, parts)
 
     await state.set_state(Intake.collecting_images)
     await m.reply("Step 4/8 — Send ALL the screenshots now (you can send many). When you're done, type /review.")
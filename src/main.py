@@ -1,21 +1,46 @@
 """
 Application entrypoint: wires together dispatcher, routers, middleware,
 and registers Telegram slash commands so typing "/" shows the menu.
+
+Updates arrive by long polling (default) or, with BOT_MODE=webhook, through
+an aiohttp server (POST WEBHOOK_PATH, GET /healthz).
 """
 
 import asyncio
+import logging
+import signal
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import BotCommand
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 # NOTE: We intentionally do NOT import ParseMode; we disable parse mode globally.
 
-from .config import TELEGRAM_BOT_TOKEN
-from .db import init_db
+from .config import (
+    BOT_MODE,
+    TELEGRAM_API_BASE,
+    TELEGRAM_BOT_TOKEN,
+    WEBAPP_HOST,
+    WEBAPP_PORT,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_DRAIN_SEC,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+)
+from .db import init_db, close_pool
+from .fsm_storage import SQLiteStorage
 from .handlers import commands, corrections, images, sessions
 from .middleware.errors import ErrorMiddleware
+from .middleware.inflight import InFlightMiddleware
+from .services import pipeline
+from .services.ocr_engine import engine as ocr_engine
 from .middleware.logging import setup_logging
 
+log = logging.getLogger(__name__)
+
 
 async def setup_bot_commands(bot: Bot) -> None:
     """Register the bot's slash commands so they appear when you type "/"."""
@@ -34,21 +59,21 @@ async def setup_bot_commands(bot: Bot) -> None:
     await bot.set_my_commands(cmds)
 
 
-async def main() -> None:
-    # Fail fast if there is no bot token configured
-    if not TELEGRAM_BOT_TOKEN:
-        raise SystemExit("TELEGRAM_BOT_TOKEN is not set")
-
-    # Init logging and DB
-    setup_logging()
-    init_db()
-
-    # Create bot and dispatcher (disable parse mode so "<...>" text won't break)
-    bot = Bot(
+def create_bot() -> Bot:
+    """Bot with parse mode disabled (so "<...>" text won't break), optionally on a custom API server."""
+    session = None
+    if TELEGRAM_API_BASE:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_BASE))
+    return Bot(
         token=TELEGRAM_BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=None)
     )
-    dp = Dispatcher()
+
+
+def create_dispatcher(storage: SQLiteStorage) -> Dispatcher:
+    # Wizard state lives in SQLite so restarts don't send users back to Step 1
+    dp = Dispatcher(storage=storage)
 
     # Register global error middleware for messages
     dp.message.middleware(ErrorMiddleware())
@@ -58,12 +83,106 @@ async def main() -> None:
     dp.include_router(sessions.router)
     dp.include_router(images.router)
     dp.include_router(corrections.router)
+    return dp
+
+
+# ─────────────────────────────── Polling ─────────────────────────────── #
+
+async def run_polling(bot: Bot, dp: Dispatcher) -> None:
+    # getUpdates is refused while a webhook is set (e.g. after switching back from webhook mode)
+    await bot.delete_webhook(drop_pending_updates=False)
+    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
+
+# ─────────────────────────────── Webhook ─────────────────────────────── #
+
+async def healthz(request: web.Request) -> web.Response:
+    """Liveness probe for the host/load balancer."""
+    return web.json_response({"ok": True, "mode": "webhook", "ocr_queue": ocr_engine.depth(),
+                              "pipeline": pipeline.metrics()})
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """
+    Serve Telegram updates over HTTP until SIGTERM/SIGINT, then stop accepting
+    requests and let in-flight updates finish (up to WEBHOOK_DRAIN_SEC).
+    """
+    if not WEBHOOK_BASE_URL:
+        raise SystemExit("BOT_MODE=webhook needs WEBHOOK_BASE_URL (public https URL of this service)")
+
+    async def on_startup(bot: Bot) -> None:
+        await bot.set_webhook(
+            f"{WEBHOOK_BASE_URL}{WEBHOOK_PATH}",
+            secret_token=WEBHOOK_SECRET or None,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+        log.info("Webhook set to %s%s", WEBHOOK_BASE_URL, WEBHOOK_PATH)
+
+    dp.startup.register(on_startup)
+    # Updates are handled in background tasks; remember them so shutdown can wait
+    inflight = InFlightMiddleware()
+    dp.update.outer_middleware(inflight)
+
+    app = web.Application()
+    # Answer Telegram right away and handle the update in a background task (OCR can take a while)
+    handler = SimpleRequestHandler(dispatcher=dp, bot=bot, handle_in_background=True,
+                                   secret_token=WEBHOOK_SECRET or None)
+    handler.register(app, path=WEBHOOK_PATH)
+    app.router.add_get("/healthz", healthz)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=WEBAPP_HOST, port=WEBAPP_PORT)
+    await site.start()
+    log.info("Webhook server listening on %s:%s", WEBAPP_HOST, WEBAPP_PORT)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    try:
+        await stop.wait()
+    finally:
+        # Stop taking new updates; Telegram keeps undelivered ones and retries later
+        await site.stop()
+        if inflight.tasks:
+            log.info("Waiting for %d update(s) in progress", len(inflight.tasks))
+        await inflight.drain(WEBHOOK_DRAIN_SEC)
+        await runner.cleanup()  # dispatcher shutdown + bot session close
+
+
+async def main() -> None:
+    # Fail fast if there is no bot token configured
+    if not TELEGRAM_BOT_TOKEN:
+        raise SystemExit("TELEGRAM_BOT_TOKEN is not set")
+
+    # Init logging and DB
+    setup_logging()
+    init_db()
+
+    storage = SQLiteStorage()
+    await storage.load()
+
+    bot = create_bot()
+    dp = create_dispatcher(storage)
 
     # Register slash commands so Telegram shows them on "/"
     await setup_bot_commands(bot)
 
-    # Start long-polling
-    await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    # Receive updates (polling by default); stop OCR worker processes on the way out
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
+    finally:
+        ocr_engine.shutdown()
+        close_pool()
 
 
 if __name__ == "__main__":
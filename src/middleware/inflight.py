@@ -0,0 +1,40 @@
+"""
+Tracks the updates being handled right now, so a webhook shutdown can let
+them finish. aiogram's SimpleRequestHandler handles each update in its own
+background task but doesn't expose those tasks, so we record them here.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """Outer update middleware: remembers the task of every update until it is handled."""
+
+    def __init__(self) -> None:
+        self.tasks: set[asyncio.Task] = set()
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tasks.discard(task)
+
+    async def drain(self, timeout: float) -> int:
+        """Wait up to `timeout` seconds for updates in progress. Returns how many there were."""
+        # Update tasks created just before this call reach the middleware on their first step
+        await asyncio.sleep(0)
+        pending = self.tasks - {asyncio.current_task()}
+        if pending:
+            await asyncio.wait(pending, timeout=timeout)
+        return len(pending)
@@ -13,3 +13,23 @@ class OCRResult(BaseModel):
     username: str | None = None
     followers: str | None = None
     confidence: float | None = None
+
+
+class DeliveryItem(BaseModel):
+    """
+    One photo for /send: the stored item, its Telegram file id and caption.
+    Items that came out of a ZIP have no file id and carry the image bytes.
+    """
+    item_id: int
+    photo: str | None = None
+    data: bytes | None = None
+    caption: str
+
+
+class DeliveryReport(BaseModel):
+    """
+    Outcome of one /send run.
+    """
+    sent: int = 0
+    skipped: int = 0                  # already delivered by an earlier run
+    failed: list[int] = []            # item ids that could not be sent
@@ -0,0 +1,209 @@
+"""
+Session-level matching: assign every captured username to at most one order
+slot, and every slot to at most one screenshot.
+
+Per-image best_match is greedy: `sakura9neko` and `sakura9neko_` can both
+land on the same slot and /review silently keeps the last one. Here the full
+score matrix (captured × order) is built with rapidfuzz.process.cdist and a
+one-to-one assignment maximising the total score is solved (Hungarian /
+scipy's linear_sum_assignment). Screenshots that lose a slot they would
+have taken greedily are reported as conflicts instead of overwriting.
+
+`SessionMatcher` keeps one score row per item, so as images arrive only the
+new rows are scored before re-solving (200×200: a few ms).
+
+numpy/scipy are optional (pip install ".[matching]"); without them the
+matrix is built row by row and a pure-Python Hungarian solves it, which is
+fine for typical orders but slower for agency-sized ones.
+"""
+
+from typing import NamedTuple, Optional
+
+from .matching import OCR_RESCORE_MIN, fuzz_ratio, ocr_canonical, ocr_ratio
+
+try:
+    import numpy as np
+    from rapidfuzz import fuzz, process
+    from scipy.optimize import linear_sum_assignment
+except ImportError:  # pragma: no cover - fallback path
+    np = None
+
+
+def score_rows(captured: list[str], order: list[str], scorer: str = "ratio") -> list[list[int]]:
+    """
+    Similarity of each captured username against each order entry.
+    scorer="ocr": pairs whose canonical forms score OCR_RESCORE_MIN+ are
+    rescored with ocr_ratio (the rest keep fuzz ratio, which it never lowers).
+    """
+    if not captured or not order:
+        return [[] for _ in captured]
+    if np is not None:
+        # float scores truncated like matching.fuzz_ratio (an int dtype would round)
+        scores = process.cdist(captured, order, scorer=fuzz.ratio, dtype=np.float32, workers=-1)
+        rows = scores.astype(np.int32).tolist()
+        if scorer == "ocr":
+            canon = process.cdist(
+                [ocr_canonical(c) for c in captured], [ocr_canonical(o) for o in order],
+                scorer=fuzz.ratio, dtype=np.float32, score_cutoff=OCR_RESCORE_MIN, workers=-1,
+            )
+            for i, j in zip(*np.nonzero(canon > scores)):
+                rows[i][j] = int(ocr_ratio(captured[i], order[j]))
+        return rows
+    rows = [[fuzz_ratio(c, o) for o in order] for c in captured]
+    if scorer == "ocr":
+        canon_order = [ocr_canonical(o) for o in order]
+        for c, row in zip(captured, rows):
+            cc = ocr_canonical(c)
+            for j, o in enumerate(canon_order):
+                if fuzz_ratio(cc, o) >= OCR_RESCORE_MIN:
+                    row[j] = max(row[j], int(ocr_ratio(c, order[j])))
+    return rows
+
+
+def _hungarian(cost: list[list[float]]) -> list[int]:
+    """
+    Min-cost assignment for an n×m cost matrix with n <= m (shortest
+    augmenting paths with potentials, O(n²m)). Returns the column per row.
+    """
+    n, m = len(cost), len(cost[0])
+    inf = float("inf")
+    u, v = [0.0] * (n + 1), [0.0] * (m + 1)
+    p, way = [0] * (m + 1), [0] * (m + 1)   # p[j]: row matched to column j (1-based)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0, delta, j1 = p[j0], inf, 0
+            row = cost[i0 - 1]
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j], way[j] = cur, j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    out = [0] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            out[p[j] - 1] = j - 1
+    return out
+
+
+def solve(rows: list[list[int]], threshold: int) -> list[Optional[int]]:
+    """
+    One-to-one assignment maximising total score; pairs scoring below
+    `threshold` are never used. Returns the 0-based column per row (or None).
+    """
+    if not rows or not rows[0]:
+        return [None] * len(rows)
+    # Below-threshold pairs count as 0 so they never displace a real match
+    gain = [[s if s >= threshold else 0 for s in r] for r in rows]
+    if np is not None:
+        r_idx, c_idx = linear_sum_assignment(np.asarray(gain), maximize=True)
+        pairs = zip(r_idx.tolist(), c_idx.tolist())
+    else:
+        n, m = len(gain), len(gain[0])
+        if n <= m:
+            pairs = enumerate(_hungarian([[-s for s in r] for r in gain]))
+        else:
+            cols = _hungarian([[-gain[i][j] for i in range(n)] for j in range(m)])
+            pairs = ((i, j) for j, i in enumerate(cols))
+    out: list[Optional[int]] = [None] * len(rows)
+    for i, j in pairs:
+        if gain[i][j] > 0:
+            out[i] = j
+    return out
+
+
+class Conflict(NamedTuple):
+    item_id: int        # screenshot that lost the slot
+    slot: int           # 1-based order index it matched best
+    holder_id: int      # screenshot the slot was given to
+
+
+class Assignment(NamedTuple):
+    slots: dict[int, Optional[int]]   # item_id -> 1-based order index (None = unmatched)
+    scores: dict[int, int]            # item_id -> score of its assigned slot (or best score)
+    conflicts: list[Conflict]
+
+
+class SessionMatcher:
+    """Score rows for one session's items against one order list."""
+
+    def __init__(self, order: list[str], scorer: str = "ratio"):
+        self.order = list(order)
+        self.scorer = scorer
+        self.usernames: dict[int, str] = {}
+        self.rows: dict[int, list[int]] = {}
+
+    def sync(self, items: dict[int, str]) -> None:
+        """Bring rows up to date with item_id -> username (score only new/changed items)."""
+        for item_id in [i for i in self.rows if i not in items]:
+            del self.rows[item_id]
+            del self.usernames[item_id]
+        changed = [i for i, u in items.items() if self.usernames.get(i) != u]
+        if changed:
+            for item_id, row in zip(changed, score_rows([items[i] for i in changed], self.order, self.scorer)):
+                self.rows[item_id] = row
+                self.usernames[item_id] = items[item_id]
+
+    def assign(self, threshold: int, pinned: Optional[dict[int, int]] = None) -> Assignment:
+        """
+        Solve the assignment. `pinned` maps item_id -> 1-based slot for items
+        fixed by hand (corrections); those slots are not given to anyone else.
+        Two pinned items on one slot: the later item keeps it, the earlier is
+        unassigned (slot None) and reported as a conflict.
+        """
+        pinned = pinned or {}
+        taken = set(pinned.values())
+        holder: dict[int, int] = {}
+        conflicts = []
+        slots: dict[int, Optional[int]] = {}
+        scores: dict[int, int] = {}
+        for item_id in sorted(pinned):
+            slot = pinned[item_id]
+            if slot in holder:
+                loser = holder[slot]
+                conflicts.append(Conflict(loser, slot, item_id))
+                slots[loser], scores[loser] = None, 0
+            holder[slot] = item_id
+            slots[item_id], scores[item_id] = slot, 100
+        free_cols = [j for j in range(len(self.order)) if j + 1 not in taken]
+        ids = [i for i in sorted(self.rows) if i not in pinned]
+        sub = [[self.rows[i][j] for j in free_cols] for i in ids]
+        cols = solve(sub, threshold) if free_cols else [None] * len(ids)
+
+        for item_id, c in zip(ids, cols):
+            row = self.rows[item_id]
+            if c is None:
+                slots[item_id] = None
+                scores[item_id] = max(row) if row else 0
+            else:
+                slots[item_id] = free_cols[c] + 1
+                scores[item_id] = row[free_cols[c]]
+                holder[free_cols[c] + 1] = item_id
+
+        for item_id in ids:
+            row = self.rows[item_id]
+            if not row:
+                continue
+            best = max(range(len(row)), key=row.__getitem__)
+            if row[best] >= threshold and slots[item_id] != best + 1 and holder.get(best + 1, item_id) != item_id:
+                conflicts.append(Conflict(item_id, best + 1, holder[best + 1]))
+        return Assignment(slots, scores, conflicts)
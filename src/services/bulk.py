@@ -0,0 +1,84 @@
+"""
+Bulk intake helpers: a day's screenshots as one batch instead of one message each.
+
+- MediaGroupCollector gathers the messages of a Telegram album (same
+  media_group_id arrive as separate updates) until the album goes quiet.
+- zip_images() lists the screenshots inside a ZIP held in memory; entries
+  are decompressed one at a time with read_entry(), never written to disk.
+"""
+
+import asyncio
+import io
+import re
+import zipfile
+from typing import Generic, Hashable, TypeVar
+
+T = TypeVar("T")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+class MediaGroupCollector(Generic[T]):
+    """
+    Collects items per key until no new one arrived for `window_sec`.
+
+    The first caller for a key waits and gets the whole group back; later
+    callers for the same key get None (their message is already part of it).
+    """
+
+    def __init__(self, window_sec: float):
+        self.window_sec = window_sec
+        self._groups: dict[Hashable, list[T]] = {}
+        self._seen: dict[Hashable, int] = {}
+
+    async def collect(self, key: Hashable, item: T) -> list[T] | None:
+        group = self._groups.get(key)
+        if group is not None:
+            group.append(item)
+            return None
+        self._groups[key] = group = [item]
+        try:
+            # Wait until a full window passes without the group growing
+            while True:
+                size = len(group)
+                await asyncio.sleep(self.window_sec)
+                if len(group) == size:
+                    return group
+        finally:
+            del self._groups[key]
+
+
+def _natural_key(name: str) -> list:
+    """IMG_2.png before IMG_10.png."""
+    return [int(p) if p.isdigit() else p.lower() for p in re.split(r"(\d+)", name)]
+
+
+def zip_images(data: bytes, max_files: int, max_bytes: int) -> tuple[zipfile.ZipFile, list[zipfile.ZipInfo], int]:
+    """
+    Open a ZIP from memory and list its screenshots in natural name order.
+    Returns (zip, entries, skipped): folders, macOS metadata and non-images
+    are ignored; entries over `max_bytes` uncompressed or past `max_files`
+    count as skipped. Raises zipfile.BadZipFile for anything that isn't a ZIP.
+    """
+    zf = zipfile.ZipFile(io.BytesIO(data))
+    entries, skipped = [], 0
+    for info in zf.infolist():
+        name = info.filename
+        base = name.rsplit("/", 1)[-1]
+        if info.is_dir() or name.startswith("__MACOSX/") or base.startswith("."):
+            continue
+        if not base.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        if info.file_size > max_bytes:
+            skipped += 1
+            continue
+        entries.append(info)
+    entries.sort(key=lambda i: _natural_key(i.filename))
+    skipped += max(0, len(entries) - max_files)
+    return zf, entries[:max_files], skipped
+
+
+def read_entry(zf: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """Decompress one entry into memory."""
+    with zf.open(info) as f:
+        return f.read()
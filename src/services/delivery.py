@@ -0,0 +1,225 @@
+"""
+Delivery engine for /send: rate-limited, flood-control aware, resumable.
+
+- Per-chat token buckets (Telegram: ~20 messages/min into one group) plus a
+  global bucket (~30 messages/sec for the whole bot), shared by every /send.
+  A chat bucket only holds a small burst (DELIVERY_CHAT_BURST), so a report
+  is paced from its first photo instead of sending 20 at once.
+- A 429 (`TelegramRetryAfter`) pauses that chat for `retry_after` seconds and
+  the same photo is retried, so order is kept.
+- One report at a time per destination: photos go out in order and two
+  users' reports never interleave in the boss chat.
+- Optional album mode packs consecutive photos into media groups of up to
+  10, one API call each. Telegram counts every photo of an album as a
+  message, so an album takes one rate-limit token per photo.
+- Every attempt is written to the `deliveries` ledger per item and
+  destination (chat + topic): status, Telegram message id, attempts, sent_at.
+  A re-run of /send skips what already arrived and only retries failures, so
+  a crash mid-report costs only the remaining photos, never duplicates.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+from aiogram import Bot, types
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from .. import db
+from ..models import DeliveryItem, DeliveryReport
+from ..config import (
+    DELIVERY_CHAT_BURST,
+    DELIVERY_CHAT_PER_MIN,
+    DELIVERY_GLOBAL_PER_SEC,
+    DELIVERY_MAX_RETRIES,
+    DELIVERY_PROGRESS_EVERY_SEC,
+)
+from . import sending
+from .ratelimit import TokenBucket
+
+log = logging.getLogger(__name__)
+
+Progress = Callable[[int, int], Awaitable[None]]
+
+
+class DestinationError(Exception):
+    """The destination chat/topic can't receive messages (not found, bot removed, ...)."""
+
+
+def _is_destination_error(e: TelegramBadRequest) -> bool:
+    msg = (e.message or "").lower()
+    return "chat not found" in msg or "forbidden" in msg or "thread not found" in msg
+
+
+# ───────────────────────────── Ledger ───────────────────────────── #
+
+async def _delivered_ids(chat_id: int, thread_id: int | None, item_ids: list[int]) -> set[int]:
+    """Items already delivered to this chat + topic."""
+    if not item_ids:
+        return set()
+    marks = ",".join("?" * len(item_ids))
+    rows = await db.fetchall(
+        "SELECT item_id FROM deliveries WHERE chat_id=? AND thread_id=? AND status='sent' "
+        f"AND item_id IN ({marks})",
+        [chat_id, thread_id or 0, *item_ids],
+    )
+    return {r["item_id"] for r in rows}
+
+
+async def _record(
+    item_id: int, chat_id: int, thread_id: int | None, status: str, message_id: int | None = None
+) -> None:
+    """Upsert the outcome of one attempt ('sent' | 'failed') for this item and destination."""
+    await db.execute(
+        "INSERT INTO deliveries(item_id,chat_id,thread_id,message_id,status,attempts,sent_at,updated_at) "
+        "VALUES(?,?,?,?,?,1,CASE WHEN ?='sent' THEN datetime('now') END,datetime('now')) "
+        "ON CONFLICT(item_id,chat_id,thread_id) DO UPDATE SET message_id=excluded.message_id, "
+        "status=excluded.status, attempts=deliveries.attempts+1, "
+        "sent_at=COALESCE(excluded.sent_at, deliveries.sent_at), updated_at=excluded.updated_at",
+        [item_id, chat_id, thread_id or 0, message_id, status, status],
+    )
+
+
+# ───────────────────────────── Engine ───────────────────────────── #
+
+class DeliveryEngine:
+    def __init__(self, chat_per_min: float, global_per_sec: float, max_retries: int, chat_burst: float = 3):
+        self.chat_per_min = chat_per_min
+        self.chat_burst = max(1.0, min(chat_burst, chat_per_min))
+        self.max_retries = max(0, max_retries)
+        self._global = TokenBucket(global_per_sec, global_per_sec)
+        self._chats: dict[int, TokenBucket] = {}
+        self._paused_until: dict[int, float] = {}   # chat_id -> monotonic time (429)
+        self._locks: dict[int, asyncio.Lock] = {}
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        if chat_id not in self._chats:
+            self._chats[chat_id] = TokenBucket(self.chat_burst, self.chat_per_min / 60.0)
+        return self._chats[chat_id]
+
+    async def _wait_turn(self, chat_id: int, count: int = 1) -> None:
+        """
+        Sleep until this chat (and the bot overall) may send `count` more
+        messages. An album larger than the burst waits for a full bucket and
+        leaves it in debt, so the photos after it are paced accordingly.
+        """
+        bucket = self._bucket(chat_id)
+        while True:
+            now = time.monotonic()
+            wait = max(
+                self._paused_until.get(chat_id, 0.0) - now,
+                bucket.wait_time(count, now),
+                self._global.wait_time(count, now),
+            )
+            if wait <= 0:
+                bucket.consume(count, now)
+                self._global.consume(count, now)
+                return
+            await asyncio.sleep(wait)
+
+    async def _send_unit(
+        self, bot: Bot, chat_id: int, thread_id: int | None, items: list[DeliveryItem]
+    ) -> list[int] | None:
+        """
+        Send one photo or album, retrying flood control and transient errors.
+        Returns message ids in item order, or None if Telegram rejected it.
+        """
+        for attempt in range(self.max_retries + 1):
+            await self._wait_turn(chat_id, len(items))
+            try:
+                return await sending.send_album(bot, chat_id, thread_id, items)
+            except TelegramRetryAfter as e:
+                log.warning("Flood control in chat %s: retry after %ss", chat_id, e.retry_after)
+                self._paused_until[chat_id] = time.monotonic() + e.retry_after
+            except (TelegramNetworkError, TelegramServerError) as e:
+                log.warning("Send to %s failed (%s); attempt %d", chat_id, e, attempt + 1)
+                await asyncio.sleep(min(30.0, 2.0 ** attempt))
+            except TelegramForbiddenError as e:
+                raise DestinationError(str(e)) from e
+            except TelegramBadRequest as e:
+                if _is_destination_error(e):
+                    raise DestinationError(e.message) from e
+                log.warning("Items %s rejected by Telegram: %s", [it.item_id for it in items], e.message)
+                return None
+        return None
+
+    async def deliver(
+        self,
+        bot: Bot,
+        chat_id: int,
+        thread_id: int | None,
+        items: list[DeliveryItem],
+        progress: Progress | None = None,
+        album_size: int = 1,
+    ) -> DeliveryReport:
+        """
+        Send items in order to one destination (chat + topic), skipping those
+        already delivered there; earlier failures are retried.
+        album_size > 1 packs consecutive items into media groups (one API call each).
+        Raises DestinationError if the chat/topic is unusable.
+        """
+        report = DeliveryReport()
+        lock = self._locks.setdefault(chat_id, asyncio.Lock())
+        async with lock:
+            done_before = await _delivered_ids(chat_id, thread_id, [it.item_id for it in items])
+            todo = [it for it in items if it.item_id not in done_before]
+            report.skipped = len(items) - len(todo)
+
+            done = 0
+            for unit in sending.pack_albums(todo, album_size):
+                message_ids = await self._send_unit(bot, chat_id, thread_id, unit)
+                if message_ids is None and len(unit) > 1:
+                    # One bad photo rejects the whole album: send its photos one by one
+                    message_ids = []
+                    for item in unit:
+                        single = await self._send_unit(bot, chat_id, thread_id, [item])
+                        message_ids.append(single[0] if single else None)
+                for item, message_id in zip(unit, message_ids or [None] * len(unit)):
+                    if message_id is None:
+                        report.failed.append(item.item_id)
+                        await _record(item.item_id, chat_id, thread_id, "failed")
+                    else:
+                        report.sent += 1
+                        await _record(item.item_id, chat_id, thread_id, "sent", message_id)
+                done += len(unit)
+                if progress:
+                    await progress(done, len(todo))
+        return report
+
+
+class ProgressMessage:
+    """A single status message edited in place ("Sending n/N"), at most every few seconds."""
+
+    def __init__(self, message: types.Message, every_sec: float = DELIVERY_PROGRESS_EVERY_SEC):
+        self.message = message
+        self.every_sec = every_sec
+        self._last = 0.0
+
+    async def __call__(self, done: int, total: int) -> None:
+        now = time.monotonic()
+        if done < total and now - self._last < self.every_sec:
+            return
+        self._last = now
+        try:
+            await self.message.edit_text(f"📤 Sending… {done}/{total}")
+        except TelegramRetryAfter:
+            pass   # progress is cosmetic; never slow the report down for it
+        except TelegramBadRequest as e:
+            if "not modified" not in (e.message or "").lower():
+                log.warning("Progress edit failed: %s", e.message)
+
+
+# Shared engine so rate limits hold across concurrent /send commands
+engine = DeliveryEngine(
+    chat_per_min=DELIVERY_CHAT_PER_MIN,
+    global_per_sec=DELIVERY_GLOBAL_PER_SEC,
+    max_retries=DELIVERY_MAX_RETRIES,
+    chat_burst=DELIVERY_CHAT_BURST,
+)
@@ -0,0 +1,37 @@
+"""
+One in-memory copy of a downloaded screenshot, shared by every stage.
+
+Telegram's download is written straight into a BytesIO we own and taken out
+with getvalue(), which hands over the BytesIO's storage instead of copying
+it (unlike seek(0) + read()). From then on:
+- hashing uses a memoryview (`view()`),
+- the OCR worker process receives `data` once through the pool's pickling,
+  the only copy a process boundary needs,
+- the OpenAI client gets `data` itself and decodes it in its own
+  preprocessing step.
+"""
+
+import io
+
+from aiogram import Bot
+
+
+class ImageBuffer:
+    __slots__ = ("data",)
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    @classmethod
+    async def download(cls, bot: Bot, file_path: str) -> "ImageBuffer":
+        """Stream a Telegram file into memory (one buffer, no extra copy)."""
+        dest = io.BytesIO()
+        await bot.download_file(file_path, destination=dest, seek=False)
+        return cls(dest.getvalue())
+
+    def view(self) -> memoryview:
+        """Zero-copy view of the bytes (hashing, slicing)."""
+        return memoryview(self.data)
+
+    def __len__(self) -> int:
+        return len(self.data)
@@ -1,21 +1,151 @@
 """
 Local OCR using Tesseract (no network, no waiting).
 Extract username + followers from IG screenshots.
+
+Fast path: find the IG profile layout (username bar + posts/followers/following
+stat row) from cheap edge profiles, then OCR only those two small crops — the
+stats with a digits whitelist. Anything that doesn't look like a profile
+screenshot falls back to OCR over the whole image.
+
+Confidence is derived from Tesseract's per-word confidences of the tokens we
+picked, not from whether fields were found.
+
+When the session's order list is passed in, the username is decoded against
+it: every OCR word and run of adjacent words is looked up in an OrderIndex
+and the best entry at MATCH_THRESHOLD or above wins. An exact hit counts as
+certain; a fuzzy one keeps the lower of its match score and Tesseract's
+confidence in the words it came from, so a garbled read that merely
+resembles an entry still escalates to OpenAI. The heuristic pick is only
+used when nothing matches.
 """
 
+import atexit
 import io
+import logging
 import re
+from functools import lru_cache
 from typing import Optional
-from PIL import Image, ImageOps, ImageEnhance
+from PIL import Image, ImageOps, ImageEnhance, ImageFilter, ImageStat
 import pytesseract
 
 from ..models import OCRResult
-from ..config import TESSERACT_CMD
+from ..config import MATCH_SCORER, OCR_BACKEND, TESSERACT_CMD, TESSERACT_LANG
+from .matching import MATCH_THRESHOLD, OrderIndex
+from .normalize import clean_username
+
+# Optional in-process Tesseract bindings; pytesseract remains the fallback.
+try:
+    import tesserocr
+except Exception:  # pragma: no cover - optional dependency
+    tesserocr = None
+
+log = logging.getLogger(__name__)
 
 # Allow explicit tesseract path (Windows)
 if TESSERACT_CMD:
     pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 
+# Layout analysis runs on a copy scaled to this width
+_LAYOUT_WIDTH = 540
+# Mean edge strength above which a row/column counts as "has text"
+_EDGE_THR = 8.0
+# Characters allowed when reading the stats row
+_STATS_WHITELIST = "0123456789.,KkMm"
+
+_USERNAME_RE = re.compile(r"^[a-z0-9._]{3,30}$")
+_COUNT_RE = re.compile(r"^\d[\d,.]*[kKmM]?$")
+# Adjacent OCR words joined into one handle candidate ("sakura_ neko")
+_LEXICON_NGRAM = 3
+
+
+# One initialised Tesseract API per process (each OCR worker gets its own)
+_api = None
+
+
+def _get_api():
+    global _api
+    if _api is None:
+        _api = tesserocr.PyTessBaseAPI(lang=TESSERACT_LANG)
+        atexit.register(_api.End)
+    return _api
+
+
+def warm_up() -> None:
+    """Load the language model up front (OCR worker process initializer)."""
+    if OCR_BACKEND == "tesserocr" and tesserocr is not None:
+        try:
+            _get_api()
+        except Exception:
+            log.exception("tesserocr init failed; using pytesseract")
+
+
+def _ocr_words(img: Image.Image, psm: int, whitelist: str | None = None) -> list[tuple[str, float]]:
+    """
+    Run Tesseract on a PIL image with the given page segmentation mode.
+    Returns the recognised words with Tesseract's per-word confidence (0..1).
+    """
+    if OCR_BACKEND == "tesserocr" and tesserocr is not None:
+        try:
+            # In memory, no subprocess, model stays loaded between images
+            api = _get_api()
+            api.SetPageSegMode(psm)
+            api.SetVariable("tessedit_char_whitelist", whitelist or "")
+            api.SetImage(img)
+            api.Recognize()
+            level = tesserocr.RIL.WORD
+            words = []
+            for r in tesserocr.iterate_level(api.GetIterator(), level):
+                w = (r.GetUTF8Text(level) or "").strip()
+                if w:
+                    words.append((w, max(0.0, r.Confidence(level)) / 100.0))
+            return words
+        except Exception:
+            log.exception("tesserocr failed; falling back to pytesseract")
+
+    config = f"--psm {psm}"
+    if whitelist:
+        config += f" -c tessedit_char_whitelist={whitelist}"
+    data = pytesseract.image_to_data(img, config=config, output_type=pytesseract.Output.DICT)
+    words = []
+    for w, c in zip(data.get("text", []), data.get("conf", [])):
+        w = (w or "").strip()
+        try:
+            c = float(c)
+        except (TypeError, ValueError):
+            c = -1.0
+        if w and c >= 0:
+            words.append((w, c / 100.0))
+    return words
+
+
+def _words_text(words: list[tuple[str, float]]) -> str:
+    return " ".join(w for w, _ in words)
+
+
+def _span_conf(words: list[tuple[str, float]], token: str) -> float:
+    """Lowest confidence among the OCR words that make up `token` (0 if not found)."""
+    confs = []
+    for part in token.lower().split():
+        hits = [c for w, c in words if part in w.lower()]
+        if not hits:
+            return 0.0
+        confs.append(max(hits))
+    return min(confs) if confs else 0.0
+
+
+def _calibrate(username_conf: Optional[float], followers_conf: Optional[float]) -> float:
+    """
+    One 0..1 score for the read: the weaker field decides, and a missing
+    field halves it (a lone field is never a usable result).
+    """
+    present = [c for c in (username_conf, followers_conf) if c is not None]
+    if not present:
+        return 0.0
+    score = min(present)
+    if len(present) < 2:
+        score *= 0.5
+    return round(score, 3)
+
 
 def _preprocess(img: Image.Image) -> Image.Image:
     """Upscale + contrast/sharpen for better OCR."""
@@ -28,6 +158,141 @@ def _preprocess(img: Image.Image) -> Image.Image:
     return gray
 
 
+def _prepare_crop(gray: Image.Image, target_h: int = 48) -> Image.Image:
+    """Dark text on light background, scaled so text is a comfortable height."""
+    if ImageStat.Stat(gray).mean[0] < 128:  # dark mode
+        gray = ImageOps.invert(gray)
+    gray = ImageEnhance.Contrast(gray).enhance(1.6)
+    w, h = gray.size
+    if 0 < h < target_h:
+        f = target_h / h
+        gray = gray.resize((max(1, int(w * f)), target_h), Image.LANCZOS)
+    # A white margin helps Tesseract with tight crops
+    return ImageOps.expand(gray, border=10, fill=255)
+
+
+# ───────────────────────────── Layout detection ───────────────────────────── #
+
+def _runs(profile: list[float], thr: float, max_gap: int, min_len: int) -> list[tuple[int, int]]:
+    """[start, end) runs where profile > thr, merging gaps up to max_gap."""
+    runs: list[list[int]] = []
+    for i, v in enumerate(profile):
+        if v <= thr:
+            continue
+        if runs and i - runs[-1][1] <= max_gap:
+            runs[-1][1] = i + 1
+        else:
+            runs.append([i, i + 1])
+    return [(a, b) for a, b in runs if b - a >= min_len]
+
+
+def _edges(gray: Image.Image) -> Image.Image:
+    """Edge map with the 1px frame zeroed (FIND_EDGES lights up image borders)."""
+    return ImageOps.expand(ImageOps.crop(gray.filter(ImageFilter.FIND_EDGES), 1), border=1, fill=0)
+
+
+def _row_profile(edges: Image.Image) -> list[float]:
+    """Mean edge strength per row (box-resize to one column is very cheap)."""
+    return list(edges.resize((1, edges.height), Image.BOX).getdata())
+
+
+def _col_profile(edges: Image.Image) -> list[float]:
+    """Mean edge strength per column."""
+    return list(edges.resize((edges.width, 1), Image.BOX).getdata())
+
+
+def _text_bands(edges: Image.Image, box: tuple[int, int, int, int]) -> list[tuple[int, int]]:
+    """Text lines (absolute y ranges) inside `box` of the edge image."""
+    region = edges.crop(box)
+    prof = _row_profile(region)
+    return [(box[1] + a, box[1] + b) for a, b in _runs(prof, _EDGE_THR, max_gap=2, min_len=6)]
+
+
+def _detect_layout(gray: Image.Image):
+    """
+    Find the username bar and the stat-row numbers on an IG profile screenshot.
+    Returns (username_box, stats_box) in `gray` coordinates, or None.
+    """
+    w, h = gray.size
+    if h < w * 1.3:  # not a phone-portrait screenshot
+        return None
+
+    f = _LAYOUT_WIDTH / w
+    small = gray.resize((_LAYOUT_WIDTH, max(1, int(h * f))), Image.BILINEAR)
+    edges = _edges(small)
+    W = _LAYOUT_WIDTH
+
+    # Username bar: tallest text line near the top (status bar text is smaller)
+    top = _text_bands(edges, (int(0.08 * W), int(0.04 * W), int(0.8 * W), int(0.3 * W)))
+    if not top:
+        return None
+    u0, u1 = max(top, key=lambda b: b[1] - b[0])
+
+    # Stat row: right of the avatar, a numbers line directly above a labels line
+    rows = _text_bands(edges, (int(0.3 * W), u1, W, min(small.height, u1 + int(0.9 * W))))
+    stats = None
+    for (a0, a1), (b0, b1) in zip(rows, rows[1:]):
+        if b0 - a1 <= (a1 - a0) and (a1 - a0) >= (b1 - b0) * 0.8:
+            stats = (a0, a1)
+            break
+    if stats is None:
+        return None
+
+    def to_full(box: tuple[int, int, int, int]) -> tuple[int, ...]:
+        return tuple(int(v / f) for v in box)
+
+    pad = 4
+    username_box = (0, max(0, u0 - pad), W, u1 + pad)
+    stats_box = (int(0.3 * W), max(0, stats[0] - pad), W, stats[1] + pad)
+    return to_full(username_box), to_full(stats_box)
+
+
+def _split_columns(gray: Image.Image) -> list[Image.Image]:
+    """Split a stat-row crop into its number columns (posts | followers | following)."""
+    prof = _col_profile(_edges(gray))
+    # Digits of one number are close together; numbers are far apart
+    cols = _runs(prof, _EDGE_THR, max_gap=max(4, gray.height // 2), min_len=2)
+    return [gray.crop((max(0, a - 4), 0, min(gray.width, b + 4), gray.height)) for a, b in cols]
+
+
+def _read_roi(gray: Image.Image, lexicon: Optional[OrderIndex] = None):
+    """
+    OCR only the username bar and the followers number.
+    Returns (username, username_conf, followers, followers_conf); Nones if no layout.
+    """
+    layout = _detect_layout(gray)
+    if layout is None:
+        return None, None, None, None
+    username_box, stats_box = layout
+
+    username = username_conf = None
+    words = _ocr_words(_prepare_crop(gray.crop(username_box)), psm=7)
+    hit = _lexicon_username(words, lexicon) if lexicon else None
+    if hit:
+        username, username_conf = hit
+    else:
+        cand = _pick_username(_words_text(words))
+        if cand and _USERNAME_RE.match(cand):
+            username, username_conf = cand, _span_conf(words, cand)
+
+    followers = followers_conf = None
+    stats = gray.crop(stats_box)
+    cols = _split_columns(stats)
+    if len(cols) == 3:
+        words = _ocr_words(_prepare_crop(cols[1]), psm=7, whitelist=_STATS_WHITELIST)
+        tok = "".join(w for w, _ in words)
+        if _COUNT_RE.match(tok):
+            followers, followers_conf = tok, min(c for _, c in words)
+    if followers is None:
+        words = _ocr_words(_prepare_crop(stats), psm=7, whitelist=_STATS_WHITELIST)
+        if len(words) == 3 and _COUNT_RE.match(words[1][0]):
+            followers, followers_conf = words[1]
+
+    return username, username_conf, followers, followers_conf
+
+
+# ───────────────────────────── Text heuristics ───────────────────────────── #
+
 def _pick_username(text: str) -> Optional[str]:
     """
     Heuristic: choose most likely handle pattern @?letters/digits/._ length 3..30.
@@ -43,6 +308,39 @@ def _pick_username(text: str) -> Optional[str]:
     return None
 
 
+@lru_cache(maxsize=8)
+def _lexicon(candidates: tuple[str, ...]) -> OrderIndex:
+    """Index for an order list, kept per worker (every image of a session sends the same one)."""
+    return OrderIndex(list(candidates), MATCH_SCORER)
+
+
+def _lexicon_username(words: list[tuple[str, float]], lexicon: OrderIndex) -> Optional[tuple[str, float]]:
+    """
+    Best order entry spelled by an OCR word or a run of up to _LEXICON_NGRAM
+    adjacent words. Returns (handle, confidence), or None if nothing reaches
+    MATCH_THRESHOLD. Confidence is 1.0 for an exact hit, else the lower of
+    the match score (0..1) and the weakest word confidence in the run.
+    """
+    toks = [clean_username(w) or "" for w, _ in words]
+    best_i, best_s, best_conf = None, -1, 0.0
+    seen = set()
+    for i in range(len(toks)):
+        for k in range(1, min(_LEXICON_NGRAM, len(toks) - i) + 1):
+            tok = "".join(toks[i:i + k])
+            if len(tok) < 3 or tok in seen:
+                continue
+            seen.add(tok)
+            idx, score = lexicon.match(tok, MATCH_THRESHOLD)
+            if idx is not None and score > best_s:
+                if score == 100:
+                    return lexicon.choices[idx], 1.0
+                best_i, best_s = idx, score
+                best_conf = min(score / 100, min(c for _, c in words[i:i + k]))
+    if best_i is None:
+        return None
+    return lexicon.choices[best_i], best_conf
+
+
 def _pick_followers(text: str) -> Optional[str]:
     """
     Look for a number (with , . spaces) optionally followed by k/m,
@@ -63,29 +361,44 @@ def _pick_followers(text: str) -> Optional[str]:
     return None
 
 
-def extract(image_bytes: bytes) -> OCRResult:
-    """Return OCRResult(username, followers, confidence) from local OCR."""
+def extract(image_bytes: bytes, candidates: Optional[tuple[str, ...]] = None) -> OCRResult:
+    """
+    Return OCRResult(username, followers, confidence) from local OCR.
+    `confidence` comes from Tesseract's word confidences for the chosen
+    tokens (see _calibrate), so callers can threshold it.
+    `candidates` (the session's order list) constrains the username to a
+    known handle when one matches.
+    """
+    lexicon = _lexicon(candidates) if candidates else None
     try:
         img = Image.open(io.BytesIO(image_bytes))
+        img.load()
     except Exception:
         return OCRResult()
 
-    img = _preprocess(img)
-
     try:
-        text = pytesseract.image_to_string(img, config="--psm 6")
+        gray = ImageOps.grayscale(img)
+        username, username_conf, followers, followers_conf = _read_roi(gray, lexicon)
+
+        # Not a recognisable profile layout (or a crop failed): read everything
+        if not (username and followers):
+            words = _ocr_words(_preprocess(img), psm=6)
+            text = _words_text(words)
+            # Values picked by whole-page heuristics are trusted less than layout crops
+            if not username:
+                hit = _lexicon_username(words, lexicon) if lexicon else None
+                if hit:
+                    username, username_conf = hit[0], hit[1] * 0.85
+                else:
+                    username = _pick_username(text)
+                    if username:
+                        username_conf = _span_conf(words, username) * 0.85
+            if not followers:
+                followers = _pick_followers(text)
+                if followers:
+                    followers_conf = _span_conf(words, followers) * 0.85
     except Exception:
         return OCRResult()
 
-    username = _pick_username(text)
-    followers = _pick_followers(text)
-
-    # Simple confidence heuristic
-    if username and followers:
-        conf = 0.85
-    elif username or followers:
-        conf = 0.6
-    else:
-        conf = 0.0
-
+    conf = _calibrate(username_conf, followers_conf)
     return OCRResult(username=username, followers=followers, confidence=conf)
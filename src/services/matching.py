@@ -1,39 +1,266 @@
-
 """
 Fuzzy matching of OCR'd usernames to the fixed order list.
+
+Order entries are processed once into an OrderIndex (the same cleaning as
+normalize.clean_username, so "@Sakura.Neko " in an order matches the OCR'd
+"sakura.neko"), and each lookup is a single rapidfuzz.process.extractOne call
+over the processed choices instead of a Python loop per entry. Large orders
+get a character-bigram prefilter that shortlists the entries sharing the most
+bigrams with the candidate before scoring.
+
+Scorers (OrderIndex(..., scorer=) / best_match(..., scorer=), MATCH_SCORER):
+- "ratio": rapidfuzz fuzz.ratio
+- "ocr"  : ocr_ratio, an edit distance where the characters Tesseract mixes
+           up in handles (l/1/i, o/0, rn/m, _/.) cost much less than other
+           edits. It is never lower than "ratio" for the same pair.
 """
 
+from collections import Counter
 from typing import List, Optional, Tuple
 
+from .normalize import clean_username
+
 # Prefer rapidfuzz for speed/quality; fallback to difflib if not available.
 try:
-    from rapidfuzz import fuzz
+    from rapidfuzz import fuzz, process
 
     def fuzz_ratio(a: str, b: str) -> int:
         return int(fuzz.ratio(a, b))
+
+    def _extract_one(candidate: str, choices: List[str], cutoff: float = 0) -> Tuple[Optional[int], float]:
+        """(index, score) of the first best-scoring choice; (None, 0) if none reaches cutoff."""
+        hit = process.extractOne(candidate, choices, scorer=fuzz.ratio, processor=None, score_cutoff=cutoff)
+        return (hit[2], hit[1]) if hit else (None, 0)
+
+    def _extract_top(candidate: str, choices: List[str], limit: int, cutoff: float) -> List[int]:
+        """Indexes of the `limit` best choices scoring at least cutoff."""
+        hits = process.extract(
+            candidate, choices, scorer=fuzz.ratio, processor=None, limit=limit, score_cutoff=cutoff
+        )
+        return [h[2] for h in hits]
 except Exception:  # pragma: no cover - fallback path
     from difflib import SequenceMatcher as _SM
 
     def fuzz_ratio(a: str, b: str) -> int:
         return int(_SM(None, a, b).ratio() * 100)
 
+    def _extract_one(candidate: str, choices: List[str], cutoff: float = 0) -> Tuple[Optional[int], float]:
+        sm = _SM(None, b=candidate)  # difflib caches the analysis of `b`
+        best_i, best_s = None, -1.0
+        for i, c in enumerate(choices):
+            sm.set_seq1(c)
+            if sm.real_quick_ratio() * 100 <= best_s or sm.quick_ratio() * 100 <= best_s:
+                continue
+            s = sm.ratio() * 100
+            if s > best_s:
+                best_i, best_s = i, s
+        return (best_i, best_s) if best_i is not None and best_s >= cutoff else (None, 0)
+
+    def _extract_top(candidate: str, choices: List[str], limit: int, cutoff: float) -> List[int]:
+        scored = ((_SM(None, c, candidate).ratio() * 100, i) for i, c in enumerate(choices))
+        return [i for s, i in sorted(((s, i) for s, i in scored if s >= cutoff), key=lambda t: (-t[0], t[1]))[:limit]]
+
+
+# Default score an OCR'd username needs to count as a given order entry
+MATCH_THRESHOLD = 75
+
+# Orders at least this long use the bigram prefilter
+PREFILTER_MIN_ORDER = 500
+# How many entries the prefilter keeps for scoring
+PREFILTER_KEEP = 64
+
 
-def best_match(candidate: str, order_list: List[str], threshold: int = 80) -> Tuple[Optional[int], int]:
+# ─────────────────────── OCR-confusion scorer ─────────────────────── #
+
+# Edit costs on the fuzz.ratio scale: insert/delete 1, any other substitution
+# 2 (= delete + insert), so with no confusions ocr_ratio == fuzz.ratio.
+CONFUSION_COST = 0.5
+# Single characters Tesseract substitutes for each other in handles
+OCR_CONFUSIONS = [("l", "1"), ("l", "i"), ("1", "i"), ("o", "0"), ("_", ".")]
+# Two characters read as one (or the reverse)
+OCR_MERGES = [("rn", "m")]
+# The "ocr" scorer rescores the top entries of a canonical-form fuzz.ratio scan
+OCR_RESCORE_TOP = 4
+# ...and, for a whole score matrix, pairs whose canonical score reaches this
+OCR_RESCORE_MIN = 60
+
+# char -> {char it may be misread as: cost}; identical characters cost 0
+_SUB: dict[str, dict[str, float]] = {}
+for _a, _b in OCR_CONFUSIONS:
+    _SUB.setdefault(_a, {_a: 0.0})[_b] = CONFUSION_COST
+    _SUB.setdefault(_b, {_b: 0.0})[_a] = CONFUSION_COST
+# merged pair -> the character it is read as
+_MERGE: dict[str, str] = {pair: one for pair, one in OCR_MERGES}
+_MERGE_TARGETS = frozenset(one for _, one in OCR_MERGES)
+# Confusable characters collapse to one form (mirrors OCR_CONFUSIONS), so a
+# plain fuzz.ratio on canonical strings finds the entries worth rescoring
+_CANON = str.maketrans({"1": "l", "i": "l", "0": "o", ".": "_"})
+
+SCORERS = ("ratio", "ocr")
+
+
+def ocr_canonical(s: str) -> str:
+    """Collapse OCR-confusable characters (1/i -> l, 0 -> o, . -> _, rn -> m)."""
+    s = s.translate(_CANON)
+    for pair, one in _MERGE.items():
+        s = s.replace(pair, one)
+    return s
+
+
+def ocr_ratio(a: str, b: str, score_cutoff: float = 0) -> float:
+    """
+    0..100 similarity like fuzz.ratio, from a weighted edit distance that
+    charges CONFUSION_COST for OCR confusions. Returns 0 as soon as the
+    distance can no longer reach score_cutoff.
+    """
+    n, m = len(a), len(b)
+    total = n + m
+    if not total:
+        return 100.0
+    max_d = total * (100 - score_cutoff) / 100
+    if abs(n - m) * CONFUSION_COST > max_d:  # merges shrink lengths at CONFUSION_COST each
+        return 0.0
+
+    # Drop the shared prefix/suffix (handles usually differ in a character
+    # or two), stopping where a merge could align characters differently
+    merge = _MERGE
+    lo, lim = 0, min(n, m)
+    while (lo < lim and a[lo] == b[lo] and a[lo] not in _MERGE_TARGETS
+           and a[lo:lo + 2] not in merge and b[lo:lo + 2] not in merge):
+        lo += 1
+    hi = 0
+    while (hi < lim - lo and a[n - 1 - hi] == b[m - 1 - hi] and a[n - 1 - hi] not in _MERGE_TARGETS
+           and a[n - 2 - hi:n - hi] not in merge and b[m - 2 - hi:m - hi] not in merge):
+        hi += 1
+    a, b = a[lo:n - hi], b[lo:m - hi]
+    n, m = len(a), len(b)
+
+    # b's merge targets by column, so the inner loop only does list lookups
+    b_merge = [None, None] + [merge.get(b[j - 2:j]) for j in range(2, m + 1)]
+    prev2: Optional[List[float]] = None
+    prev = [float(j) for j in range(m + 1)]
+    for i in range(1, n + 1):
+        ca = a[i - 1]
+        costs = _SUB.get(ca) or {ca: 0.0}
+        a_merge = merge.get(a[i - 2:i]) if i > 1 else None
+        cur = [float(i)] + [0.0] * m
+        left = float(i)
+        for j in range(1, m + 1):
+            cb = b[j - 1]
+            d = prev[j - 1] + costs.get(cb, 2.0)
+            up = prev[j] + 1
+            if up < d:
+                d = up
+            if left + 1 < d:
+                d = left + 1
+            if a_merge == cb and prev2[j - 1] + CONFUSION_COST < d:
+                d = prev2[j - 1] + CONFUSION_COST
+            if b_merge[j] == ca and prev[j - 2] + CONFUSION_COST < d:
+                d = prev[j - 2] + CONFUSION_COST
+            cur[j] = left = d
+        # A merge can reach back two rows, so stop only when both are over budget
+        if min(cur) > max_d and min(prev) > max_d:
+            return 0.0
+        prev2, prev = prev, cur
+
+    score = 100 * (total - prev[m]) / total
+    return score if score >= score_cutoff else 0.0
+
+
+# ─────────────────────────── Order index ─────────────────────────── #
+
+
+def _process(u: str) -> str:
+    return clean_username(u) or ""
+
+
+def _bigrams(s: str) -> set[str]:
+    return {s[i:i + 2] for i in range(len(s) - 1)} if len(s) > 1 else {s}
+
+
+def best_match(
+    candidate: str, order_list: List[str], threshold: int = 80, scorer: str = "ratio"
+) -> Tuple[Optional[int], int]:
     """
     Return the best match (index, score) for candidate in order_list.
     - index is 0-based; None if the best score is below threshold.
-    - score is the fuzz ratio for visibility/debugging.
+    - score is the similarity (see SCORERS) for visibility/debugging.
+    For repeated lookups against the same list, build an OrderIndex once.
     """
-    if not order_list:
-        return None, 0
+    return OrderIndex(order_list, scorer).match(candidate, threshold)
+
+
+class OrderIndex:
+    """
+    An order list prepared for repeated matching (see services/order_cache.py):
+    - `usernames` keeps the entries as given (for display and captions),
+    - exact handles resolve through a dict of processed entries in O(1),
+    - everything else is one extractOne over the processed choices, after a
+      bigram shortlist when the order has PREFILTER_MIN_ORDER+ entries,
+    - with scorer="ocr", the OCR_RESCORE_TOP best entries by canonical form
+      are rescored with ocr_ratio first.
+    Ties go to the earliest entry.
+    """
+
+    def __init__(self, usernames: List[str], scorer: str = "ratio"):
+        if scorer not in SCORERS:
+            raise ValueError(f"unknown scorer {scorer!r} (expected one of {SCORERS})")
+        self.scorer = scorer
+        self.usernames = list(usernames)
+        self.choices = [_process(u) for u in self.usernames]
+        self._canon = [ocr_canonical(u) for u in self.choices] if scorer == "ocr" else []
+        self.positions: dict[str, int] = {}
+        for i, u in enumerate(self.choices):
+            self.positions.setdefault(u, i)  # first occurrence wins
+        self._grams: dict[str, list[int]] = {}
+        if len(self.choices) >= PREFILTER_MIN_ORDER:
+            for i, u in enumerate(self.choices):
+                for g in _bigrams(u):
+                    self._grams.setdefault(g, []).append(i)
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def _shortlist(self, candidate: str) -> list[int]:
+        hits: Counter = Counter()
+        for g in _bigrams(candidate):
+            hits.update(self._grams.get(g, ()))
+        return sorted(i for i, _ in hits.most_common(PREFILTER_KEEP))
+
+    def match(self, candidate: str, threshold: int = 80) -> Tuple[Optional[int], int]:
+        """Same contract as best_match(candidate, usernames, threshold)."""
+        if not self.usernames:
+            return None, 0
+
+        candidate = _process(candidate)
+        i = self.positions.get(candidate)
+        if i is not None:
+            return i, 100
+
+        if self._canon:
+            best_i, best_s = None, 0.0
+            for i in _extract_top(ocr_canonical(candidate), self._canon, OCR_RESCORE_TOP, threshold):
+                s = ocr_ratio(candidate, self.choices[i], score_cutoff=max(threshold, best_s))
+                if s > best_s or (s == best_s and best_i is not None and i < best_i):
+                    best_i, best_s = i, s
+            if best_i is not None and best_s >= threshold:
+                return best_i, int(best_s)
+            # No OCR-level match either: report the plain best score below
 
-    best_i, best_s = None, -1
-    for i, target in enumerate(order_list):
-        s = fuzz_ratio(candidate, target)
-        if s > best_s:
-            best_i, best_s = i, s
+        if not self._grams:
+            best_i, best_s = _extract_one(candidate, self.choices)
+        else:
+            short = self._shortlist(candidate)
+            j, best_s = _extract_one(candidate, [self.choices[i] for i in short])
+            best_i = short[j] if j is not None else None
+            if best_s < threshold:
+                # Nothing in the shortlist is good enough: score everything,
+                # letting rapidfuzz skip entries that can't reach the threshold
+                i, s = _extract_one(candidate, self.choices, cutoff=threshold)
+                if i is not None:
+                    best_i, best_s = i, s
 
-    if best_s >= threshold:
-        return best_i, best_s
+        if best_s >= threshold:
+            return best_i, int(best_s)
 
-    return None, best_s
+        return None, int(best_s)
@@ -0,0 +1,115 @@
+"""
+Persistent OCR result cache (SQLite table `ocr_cache`).
+
+Re-sent screenshots (after /undo or a bad correction) are recognised by
+Telegram's `file_unique_id` (no download needed) or by the SHA-256 of the
+image bytes, and reuse the stored OCRResult: no Tesseract, no OpenAI call.
+
+Only reads that are final go in (see handlers/images.py): a strong local
+read or an OpenAI one. A weak local read kept during an OpenAI cooldown is
+not cached, so the next copy of that screenshot is escalated again. A manual
+correction overwrites the entry (correct()).
+
+Eviction:
+- TTL: entries older than OCR_CACHE_TTL_SEC are ignored and purged.
+- LRU: the table is trimmed to OCR_CACHE_MAX_ENTRIES by last use.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import time
+
+from .. import db
+from ..models import OCRResult
+from ..config import OCR_CACHE_TTL_SEC, OCR_CACHE_MAX_ENTRIES
+
+log = logging.getLogger(__name__)
+
+# In-process counters (reset on restart)
+stats = {"hits": 0, "misses": 0}
+
+
+def content_hash(image_bytes: bytes | memoryview) -> str:
+    """Stable key for the image content."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+async def lookup(
+    *,
+    file_unique_id: str | None = None,
+    content_hash: str | None = None,
+) -> OCRResult | None:
+    """
+    Return the cached OCRResult for this file/content, or None on a miss.
+    A hit refreshes the entry's LRU timestamp. Misses are only counted for
+    content-hash lookups (the file id check is a pre-download shortcut).
+    """
+    if file_unique_id:
+        row = await db.fetchone("SELECT * FROM ocr_cache WHERE file_unique_id=?", [file_unique_id])
+    elif content_hash:
+        row = await db.fetchone("SELECT * FROM ocr_cache WHERE content_hash=?", [content_hash])
+    else:
+        return None
+
+    now = time.time()
+    if not row or now - (row["created_at"] or 0) > OCR_CACHE_TTL_SEC:
+        if content_hash and not file_unique_id:
+            stats["misses"] += 1
+        return None
+
+    await db.execute("UPDATE ocr_cache SET last_used_at=? WHERE content_hash=?", [now, row["content_hash"]])
+    stats["hits"] += 1
+    log.info("OCR cache hit (hits=%d misses=%d)", stats["hits"], stats["misses"])
+    return OCRResult(username=row["username"], followers=row["followers"], confidence=row["confidence"])
+
+
+async def store(content_hash: str, file_unique_id: str | None, result: OCRResult) -> None:
+    """Save a successful OCR result and apply TTL/LRU eviction."""
+    now = time.time()
+
+    def _store(conn: sqlite3.Connection) -> None:
+        db.q(
+            conn,
+            "INSERT INTO ocr_cache(content_hash,file_unique_id,username,followers,confidence,"
+            "created_at,last_used_at) VALUES(?,?,?,?,?,?,?) "
+            "ON CONFLICT(content_hash) DO UPDATE SET file_unique_id=excluded.file_unique_id, "
+            "username=excluded.username, followers=excluded.followers, "
+            "confidence=excluded.confidence, created_at=excluded.created_at, "
+            "last_used_at=excluded.last_used_at",
+            [content_hash, file_unique_id, result.username, result.followers, result.confidence, now, now],
+        )
+        db.q(conn, "DELETE FROM ocr_cache WHERE created_at < ?", [now - OCR_CACHE_TTL_SEC])
+        db.q(
+            conn,
+            "DELETE FROM ocr_cache WHERE content_hash NOT IN "
+            "(SELECT content_hash FROM ocr_cache ORDER BY last_used_at DESC LIMIT ?)",
+            [OCR_CACHE_MAX_ENTRIES],
+        )
+
+    await db.write(_store)
+
+
+async def correct(content_hash: str | None, file_unique_id: str | None, result: OCRResult | None) -> None:
+    """
+    Apply a manual correction to the entry for this screenshot: overwrite it
+    with `result`, or drop it when result is None (correction incomplete).
+    """
+    if not (content_hash or file_unique_id):
+        return
+    if result is not None and content_hash:
+        await store(content_hash, file_unique_id, result)
+        return
+
+    def _fix(conn: sqlite3.Connection) -> None:
+        where, params = ("content_hash=?", [content_hash]) if content_hash else ("file_unique_id=?", [file_unique_id])
+        if result is None:
+            db.q(conn, f"DELETE FROM ocr_cache WHERE {where}", params)
+        else:
+            db.q(
+                conn,
+                f"UPDATE ocr_cache SET username=?, followers=?, confidence=?, last_used_at=? WHERE {where}",
+                [result.username, result.followers, result.confidence, time.time(), *params],
+            )
+
+    await db.write(_fix)
@@ -0,0 +1,75 @@
+"""
+Local OCR engine: runs Tesseract in a process pool so the event loop never blocks.
+
+- Jobs run in parallel across OCR_WORKERS processes.
+- At most OCR_MAX_PENDING jobs sit in the pool; extra callers wait their turn
+  (backpressure) instead of piling unbounded work onto the executor.
+- `depth()` reports how many images are queued or running, for the "⏳ Queued" UX.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ..models import OCRResult
+from ..config import OCR_WORKERS, OCR_MAX_PENDING
+from . import local_ocr
+
+log = logging.getLogger(__name__)
+
+
+class OCREngine:
+    """Bounded async front-end for a ProcessPoolExecutor running local OCR."""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = max(1, workers)
+        self.max_pending = max(self.workers, max_pending)
+        self._pool: ProcessPoolExecutor | None = None
+        self._slots = asyncio.Semaphore(self.max_pending)
+        self._in_pool = 0   # submitted to the pool (queued there or running)
+        self._waiting = 0   # blocked on backpressure, not yet submitted
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created lazily so importing this module never forks processes
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=local_ocr.warm_up)
+        return self._pool
+
+    def depth(self) -> int:
+        """Images queued or running right now (0 = a new image starts immediately)."""
+        return self._in_pool + self._waiting
+
+    async def extract(self, image_bytes: bytes, candidates: tuple[str, ...] | None = None) -> OCRResult:
+        """
+        Run local OCR in a worker process; waits if the pool is full.
+        `candidates` is the order list to decode the username against.
+        """
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._in_pool += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_pool(), local_ocr.extract, image_bytes, candidates)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM on a huge image); start a fresh pool next time
+            log.exception("OCR worker pool broke; restarting it")
+            self._pool = None
+            return OCRResult()
+        finally:
+            self._in_pool -= 1
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        """Stop worker processes (called on bot shutdown)."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+# Shared engine used by the image handlers
+engine = OCREngine(workers=OCR_WORKERS, max_pending=OCR_MAX_PENDING)
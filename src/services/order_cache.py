@@ -0,0 +1,64 @@
+"""
+In-process cache of each user's /set_order list.
+
+Every screenshot, correction, /status, /review and /send needs the order;
+instead of SELECT + json.loads per message, the parsed list is kept as a
+matching.OrderIndex (exact-hit dict + one rapidfuzz extractOne over the
+processed entries, with a bigram prefilter for large orders).
+- Write-through: set_order() saves to SQLite and replaces the cached entry.
+- Versioned: every write bumps the user's version, and a load that raced
+  with a write is returned but not cached, so a stale list can never
+  overwrite a newer one.
+"""
+
+import json
+from collections import OrderedDict
+
+from .. import db
+from ..config import MATCH_SCORER, ORDER_CACHE_MAX_USERS
+from .matching import OrderIndex
+
+# tg_user_id -> (version, index); most recently used last
+_cache: "OrderedDict[int, tuple[int, OrderIndex]]" = OrderedDict()
+# tg_user_id -> version, bumped on every change
+_versions: dict[int, int] = {}
+
+
+def _bump(uid: int) -> int:
+    _versions[uid] = _versions.get(uid, 0) + 1
+    return _versions[uid]
+
+
+def _remember(uid: int, version: int, index: OrderIndex) -> OrderIndex:
+    if _versions.get(uid, 0) != version:
+        return index  # changed while we were loading; don't cache a stale list
+    _cache[uid] = (version, index)
+    _cache.move_to_end(uid)
+    while len(_cache) > ORDER_CACHE_MAX_USERS:
+        _cache.popitem(last=False)
+    return index
+
+
+async def get(uid: int) -> OrderIndex:
+    """The user's order (empty OrderIndex if none is set)."""
+    hit = _cache.get(uid)
+    if hit is not None:
+        _cache.move_to_end(uid)
+        return hit[1]
+    version = _versions.get(uid, 0)
+    row = await db.fetchone("SELECT usernames_json FROM username_orders WHERE tg_user_id=?", [uid])
+    usernames = json.loads(row["usernames_json"]) if row and row["usernames_json"] else []
+    return _remember(uid, version, OrderIndex(usernames, MATCH_SCORER))
+
+
+async def set_order(uid: int, usernames: list[str]) -> OrderIndex:
+    """Save a new order and make it the cached version."""
+    version = _bump(uid)
+    await db.execute(
+        "INSERT INTO username_orders(tg_user_id,usernames_json,updated_at) "
+        "VALUES(?,?,datetime('now')) "
+        "ON CONFLICT(tg_user_id) DO UPDATE SET usernames_json=excluded.usernames_json, updated_at=datetime('now')",
+        [uid, json.dumps(usernames)],
+    )
+    return _remember(uid, version, OrderIndex(usernames, MATCH_SCORER))
+
@@ -0,0 +1,167 @@
+"""
+Screenshot pipeline: download → OCR → DB, as separate stages.
+
+Each stage has its own queue, concurrency limit and metrics, so a burst of
+uploads overlaps instead of running one image at a time:
+- download : async Telegram file downloads, at most DOWNLOAD_CONCURRENCY at once
+- ocr      : local OCR on the process pool (ocr_engine: one job per core,
+             backpressure at OCR_MAX_PENDING)
+- db       : item inserts go through db.batch, which commits everything
+             queued within a few milliseconds in a single transaction
+
+`metrics()` is exposed on /healthz in webhook mode.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+from aiogram import Bot
+
+from .. import db
+from ..models import OCRResult
+from ..config import DOWNLOAD_CONCURRENCY
+from .imagebuf import ImageBuffer
+from .matching import OrderIndex
+from .ocr_engine import engine as ocr_engine
+
+log = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class Stage:
+    """Concurrency limit + counters for one pipeline stage."""
+
+    def __init__(self, name: str, concurrency: int):
+        self.name = name
+        self._slots = asyncio.Semaphore(max(1, concurrency))
+        self.waiting = 0
+        self.active = 0
+        self.done = 0
+        self.failed = 0
+        self.busy_sec = 0.0
+
+    async def run(self, fn: Callable[..., Awaitable[T]], *args: Any) -> T:
+        self.waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        t0 = time.perf_counter()
+        try:
+            result = await fn(*args)
+            self.done += 1
+            return result
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self.busy_sec += time.perf_counter() - t0
+            self.active -= 1
+            self._slots.release()
+
+    def metrics(self) -> dict[str, Any]:
+        finished = self.done + self.failed
+        return {
+            "waiting": self.waiting,
+            "active": self.active,
+            "done": self.done,
+            "failed": self.failed,
+            "avg_ms": round(1000 * self.busy_sec / finished, 1) if finished else None,
+        }
+
+
+# ───────────────────────────── Stages ───────────────────────────── #
+
+download_stage = Stage("download", DOWNLOAD_CONCURRENCY)
+# The OCR engine applies its own backpressure; this stage only measures
+ocr_stage = Stage("ocr", ocr_engine.max_pending)
+
+
+async def _download(bot: Bot, file_id: str) -> ImageBuffer:
+    fobj = await bot.get_file(file_id)
+    return await ImageBuffer.download(bot, fobj.file_path)
+
+
+async def download(bot: Bot, file_id: str) -> ImageBuffer:
+    """Fetch a Telegram file into one shared buffer (download stage)."""
+    return await download_stage.run(_download, bot, file_id)
+
+
+async def ocr(image: ImageBuffer, order: OrderIndex | None = None) -> OCRResult:
+    """Local OCR on the worker pool (ocr stage), constrained to `order` if given."""
+    candidates = tuple(order.choices) if order else None
+    return await ocr_stage.run(ocr_engine.extract, image.data, candidates)
+
+
+# ───────────────────────────── DB stage ───────────────────────────── #
+
+_ITEM_INSERT = (
+    "INSERT INTO items(session_id,order_index,username,followers_raw,followers_normalized,"
+    "image_file_id,ocr_confidence,corrected,image_hash,image_file_unique_id,created_at) "
+    "VALUES(?,?,?,?,?,?,?,?,?,?,datetime('now'))"
+)
+
+
+# Callers waiting on the batched writer (db.batch does the coalescing)
+db_stage = Stage("db", db.DB_BATCH_MAX)
+
+
+async def save_item(
+    session_id: int,
+    order_index: int | None,
+    username: str | None,
+    followers_raw: str | None,
+    followers_norm: str | None,
+    file_id: str,
+    confidence: float,
+    image_hash: str | None = None,
+    file_unique_id: str | None = None,
+) -> int:
+    """
+    Persist one screenshot row (db stage); returns once it is committed.
+    image_hash/file_unique_id are its ocr_cache keys (see ocr_cache.correct).
+    """
+    return await db_stage.run(
+        db.batch.execute,
+        _ITEM_INSERT,
+        [session_id, order_index, username, followers_raw, followers_norm, file_id, confidence, 0,
+         image_hash, file_unique_id],
+    )
+
+
+def _insert_items(conn, rows: list[tuple[list[Any], bytes | None]]) -> list[int]:
+    ids = []
+    for params, image in rows:
+        item_id = db.q(conn, _ITEM_INSERT, params).lastrowid
+        if image is not None:
+            db.q(conn, "INSERT INTO item_images(item_id,data) VALUES(?,?)", [item_id, image])
+        ids.append(item_id)
+    return ids
+
+
+async def save_items(session_id: int, items: list[dict[str, Any]]) -> list[int]:
+    """
+    Persist a whole batch of screenshots (bulk intake) in ONE transaction.
+    Each item has the save_item() fields as keys (image_hash/file_unique_id
+    optional), plus optional `image` bytes for screenshots without a Telegram
+    file id. Returns the row ids.
+    """
+    rows = [
+        (
+            [session_id, it["order_index"], it["username"], it["followers_raw"], it["followers_norm"],
+             it["file_id"], it["confidence"], 0, it.get("image_hash"), it.get("file_unique_id")],
+            it.get("image"),
+        )
+        for it in items
+    ]
+    return await db_stage.run(db.write, lambda conn: _insert_items(conn, rows))
+
+
+def metrics() -> dict[str, Any]:
+    out = {s.name: s.metrics() for s in (download_stage, ocr_stage, db_stage)}
+    out["db"]["batches"] = db.batch.batches
+    return out
@@ -0,0 +1,125 @@
+"""
+Token-bucket rate limiting.
+
+A bucket holds up to `capacity` units and refills continuously at
+`refill_per_sec`. Calls spend units; a full bucket allows a burst, an empty
+one makes callers wait for the refill. Levels may go negative ("debt") when
+a call turns out to cost more than reserved.
+
+`DualLimiter` pairs a requests bucket with a tokens bucket, as OpenAI limits
+both RPM and TPM. It also tracks what is in flight (acquired, not yet
+settled), so a server's remaining-count header never hands those units out
+a second time. Pure logic (no asyncio, no config) so it is easy to test.
+"""
+
+import time
+from typing import Mapping, Optional
+
+
+class TokenBucket:
+    def __init__(self, capacity: float, refill_per_sec: float, now: Optional[float] = None):
+        self.capacity = float(capacity)
+        self.rate = float(refill_per_sec)
+        self.level = self.capacity
+        self.updated = time.monotonic() if now is None else now
+
+    @property
+    def enabled(self) -> bool:
+        # capacity/rate <= 0 means "no limit configured"
+        return self.capacity > 0 and self.rate > 0
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` units are available (0 if available now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        need = min(amount, self.capacity)  # an oversized call just needs a full bucket
+        return max(0.0, (need - self.level) / self.rate)
+
+    def consume(self, amount: float, now: float) -> None:
+        self._refill(now)
+        self.level -= amount
+
+    def lower_to(self, level: float, now: float) -> None:
+        """Adopt the server's view of the level if it is lower than ours (never raises it)."""
+        self._refill(now)
+        self.level = min(self.level, float(level))
+
+    def eta(self, calls: int, amount_each: float, now: float) -> float:
+        """
+        Seconds until the `calls`-th call from now can start, if each costs
+        `amount_each` and every call starts as soon as units are available.
+        """
+        if not self.enabled or calls <= 0:
+            return 0.0
+        self._refill(now)
+        need = calls * min(amount_each, self.capacity)
+        return max(0.0, (need - self.level) / self.rate)
+
+
+def _header_float(headers: Mapping[str, str], name: str) -> Optional[float]:
+    v = headers.get(name)
+    if v is None:
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+class DualLimiter:
+    """Requests-per-minute and tokens-per-minute buckets checked together."""
+
+    def __init__(self, rpm: float, tpm: float, now: Optional[float] = None):
+        self.requests = TokenBucket(rpm, rpm / 60.0, now)
+        self.tokens = TokenBucket(tpm, tpm / 60.0, now)
+        self.inflight_requests = 0
+        self.inflight_tokens = 0.0
+
+    def wait_time(self, tokens: float, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+
+    def acquire(self, tokens: float, now: Optional[float] = None) -> None:
+        """Reserve one request and an estimated token cost (in flight until settle())."""
+        now = time.monotonic() if now is None else now
+        self.requests.consume(1, now)
+        self.tokens.consume(tokens, now)
+        self.inflight_requests += 1
+        self.inflight_tokens += tokens
+
+    def settle(self, reserved: float, actual: float, now: Optional[float] = None) -> None:
+        """
+        Finish an acquired call and charge its real token usage: positive
+        difference is debt, negative a refund. Call exactly once per acquire().
+        """
+        now = time.monotonic() if now is None else now
+        self.tokens.consume(actual - reserved, now)
+        self.inflight_requests = max(0, self.inflight_requests - 1)
+        self.inflight_tokens = max(0.0, self.inflight_tokens - reserved)
+
+    def sync_from_headers(self, headers: Mapping[str, str], now: Optional[float] = None) -> None:
+        """
+        Lower the levels to x-ratelimit-remaining-* from a response, less
+        what other calls still have in flight (their reservations were
+        already taken from our levels and must not be handed out again).
+        The headers never raise a level: an account allowing more than
+        OPENAI_MAX_RPM/TPM must still be held to the configured limits.
+        """
+        now = time.monotonic() if now is None else now
+        remaining_requests = _header_float(headers, "x-ratelimit-remaining-requests")
+        if remaining_requests is not None:
+            self.requests.lower_to(remaining_requests - self.inflight_requests, now)
+        remaining_tokens = _header_float(headers, "x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            self.tokens.lower_to(remaining_tokens - self.inflight_tokens, now)
+
+    def eta(self, calls: int, tokens_each: float, now: Optional[float] = None) -> float:
+        """Seconds until the `calls`-th queued call can start."""
+        now = time.monotonic() if now is None else now
+        return max(self.requests.eta(calls, 1, now), self.tokens.eta(calls, tokens_each, now))
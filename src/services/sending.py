@@ -1,9 +1,17 @@
-
 """
-Thin wrapper for sending photos to Telegram with captions.
+Thin wrappers for sending photos to Telegram with captions.
+
+Albums: `sendMediaGroup` takes 2–10 photos, each with its own caption, in one
+API call. Reports are packed into ordered albums of up to ALBUM_MAX photos.
 """
 
 from aiogram import Bot
+from aiogram.types import BufferedInputFile, InputMediaPhoto
+
+from ..models import DeliveryItem
+
+# Telegram's limit for one media group
+ALBUM_MAX = 10
 
 
 async def send_to_boss(bot: Bot, boss_chat_id: int, photo_file_id: str, caption: str) -> None:
@@ -11,3 +19,36 @@ async def send_to_boss(bot: Bot, boss_chat_id: int, photo_file_id: str, caption:
     Re-send a previously uploaded Telegram photo by file_id, with caption.
     """
     await bot.send_photo(chat_id=boss_chat_id, photo=photo_file_id, caption=caption)
+
+
+def pack_albums(items: list[DeliveryItem], size: int = ALBUM_MAX) -> list[list[DeliveryItem]]:
+    """Split ordered items into consecutive albums of at most `size` photos."""
+    size = max(1, min(size, ALBUM_MAX))
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _media(item: DeliveryItem) -> str | BufferedInputFile:
+    """The item's Telegram file id, or its stored bytes as an upload."""
+    return item.photo or BufferedInputFile(item.data or b"", filename=f"{item.item_id}.jpg")
+
+
+async def send_album(bot: Bot, chat_id: int, thread_id: int | None, items: list[DeliveryItem]) -> list[int]:
+    """
+    Send items as one album (a single photo goes out as a plain photo, since
+    media groups need at least two). Returns the message ids in item order.
+    """
+    if len(items) == 1:
+        msg = await bot.send_photo(
+            chat_id=chat_id,
+            photo=_media(items[0]),
+            caption=items[0].caption,
+            message_thread_id=thread_id,
+        )
+        return [msg.message_id]
+
+    messages = await bot.send_media_group(
+        chat_id=chat_id,
+        media=[InputMediaPhoto(media=_media(it), caption=it.caption) for it in items],
+        message_thread_id=thread_id,  # the whole album lands in the forum topic
+    )
+    return [msg.message_id for msg in messages]
@@ -0,0 +1,64 @@
+"""
+Keeps each open session's items assigned one-to-one to its order slots.
+
+reassign() runs after every saved screenshot or correction: it loads the
+session's items, rescores only new/changed usernames (assignment.SessionMatcher)
+and solves the global assignment. Items whose slot changed are written back
+through db.batch. Corrected items keep the slot they were given by hand;
+if two corrections name the same slot, the earlier item loses it (its
+order_index is cleared) and is matched like any other item afterwards.
+
+Matchers are cached per session and rebuilt when the user's order changes
+(order_cache hands out a new OrderIndex on every /set_order).
+"""
+
+import asyncio
+from collections import OrderedDict
+
+from .. import db
+from ..config import ORDER_CACHE_MAX_USERS
+from .assignment import Assignment, SessionMatcher
+from .matching import MATCH_THRESHOLD, OrderIndex
+
+# session_id -> (order it was built for, matcher); most recently used last
+_matchers: "OrderedDict[int, tuple[OrderIndex, SessionMatcher]]" = OrderedDict()
+_locks: dict[int, asyncio.Lock] = {}
+
+
+def _matcher(session_id: int, order: OrderIndex) -> SessionMatcher:
+    hit = _matchers.get(session_id)
+    if hit is None or hit[0] is not order:
+        hit = (order, SessionMatcher(order.choices, order.scorer))
+    _matchers[session_id] = hit
+    _matchers.move_to_end(session_id)
+    while len(_matchers) > ORDER_CACHE_MAX_USERS:
+        old, _ = _matchers.popitem(last=False)
+        if old in _locks and not _locks[old].locked():
+            del _locks[old]
+    return hit[1]
+
+
+async def reassign(session_id: int, order: OrderIndex, threshold: int = MATCH_THRESHOLD) -> Assignment:
+    """Re-solve the session's assignment and persist changed order_index values."""
+    lock = _locks.setdefault(session_id, asyncio.Lock())
+    async with lock:
+        rows = await db.fetchall(
+            "SELECT id, username, order_index, corrected FROM items WHERE session_id=?",
+            [session_id],
+        )
+        matcher = _matcher(session_id, order)
+        pinned = {r["id"]: r["order_index"] for r in rows if r["corrected"] and r["order_index"]}
+        matcher.sync({r["id"]: r["username"] for r in rows if r["username"] and r["id"] not in pinned})
+        result = matcher.assign(threshold, pinned)
+
+        changed = [
+            (result.slots.get(r["id"]), r["id"])
+            for r in rows
+            if result.slots.get(r["id"]) != r["order_index"]
+        ]
+        if changed:
+            await asyncio.gather(*(
+                db.batch.execute("UPDATE items SET order_index=? WHERE id=?", list(p)) for p in changed
+            ))
+        return result
+
@@ -1,34 +1,132 @@
 """
-OpenAI Vision client — JSON output + dual throttling + real Retry-After handling.
+OpenAI Vision client — JSON output + token-bucket throttling + real Retry-After handling.
+Fully async: retries wait on the event loop (never in a thread), and every
+wait goes through `_throttle_once`, which honours the global `_next_allowed_ts`.
 """
 
 import asyncio
 import base64
+import io
 import json
-import os
+import math
 import re
 import time
 from typing import Optional
-from openai import OpenAI
+from openai import AsyncOpenAI, RateLimitError
+from PIL import Image
 
 from ..models import OCRResult
+from .ratelimit import DualLimiter
 from ..config import (
     OPENAI_MODEL,
     OPENAI_MAX_RPM,
     OPENAI_MAX_TPM,
     OPENAI_TOKENS_PER_IMAGE,
+    OPENAI_IMAGE_MAX_EDGE,
+    OPENAI_IMAGE_FORMAT,
+    OPENAI_IMAGE_QUALITY,
+    OPENAI_CROP_TOP_FRACTION,
+    OPENAI_IMAGE_MAX_TILES,
+    OPENAI_IMAGE_DETAIL,
 )
 
 def _guess_mime(b: bytes) -> str:
     if b.startswith(b"\x89PNG\r\n\x1a\n"): return "image/png"
     if b[0:3] == b"\xff\xd8\xff": return "image/jpeg"
+    if b[0:4] == b"RIFF" and b[8:12] == b"WEBP": return "image/webp"
     return "image/jpeg"
 
-def _to_data_url(image_bytes: bytes) -> str:
-    mime = _guess_mime(image_bytes)
+def _to_data_url(image_bytes: bytes, mime: Optional[str] = None) -> str:
+    mime = mime or _guess_mime(image_bytes)
     b64 = base64.b64encode(image_bytes).decode("ascii")
     return f"data:{mime};base64,{b64}"
 
+# Image token pricing (high detail): base + per 512px tile; low detail is the
+# base alone. gpt-4o-mini bills images at a higher token count for the same price.
+_IMAGE_TOKEN_COST = {"gpt-4o-mini": (2833, 5667)}
+_IMAGE_BASE_TOKENS, _IMAGE_TILE_TOKENS = _IMAGE_TOKEN_COST.get(OPENAI_MODEL, (85, 170))
+_TILE = 512
+_PROMPT_TOKENS = 200  # system prompt + instructions + JSON answer, per request
+# Most a prepared image can cost (see _prepare_image)
+_MAX_IMAGE_TOKENS = _IMAGE_BASE_TOKENS + (
+    0 if OPENAI_IMAGE_DETAIL == "low" else _IMAGE_TILE_TOKENS * OPENAI_IMAGE_MAX_TILES
+)
+
+def _image_tokens(w: int, h: int) -> int:
+    """
+    Token cost of a w×h image: fit within 2048×2048, scale the short side
+    down to 768, then count 512px tiles.
+    """
+    if OPENAI_IMAGE_DETAIL == "low":
+        return _IMAGE_BASE_TOKENS
+    scale = min(1.0, 2048 / max(w, h))
+    w, h = w * scale, h * scale
+    scale = min(1.0, 768 / min(w, h))
+    w, h = w * scale, h * scale
+    return _IMAGE_BASE_TOKENS + _IMAGE_TILE_TOKENS * math.ceil(w / _TILE) * math.ceil(h / _TILE)
+
+def _fit_tiles(w: int, h: int, max_tiles: int) -> tuple[int, int]:
+    """
+    Largest size of a w×h image (never upscaled) that covers at most
+    `max_tiles` 512px tiles, trying every cols×rows grid within the budget.
+    """
+    best = max(min(c * _TILE / w, (max_tiles // c) * _TILE / h) for c in range(1, max(1, max_tiles) + 1))
+    scale = min(1.0, best)
+    return max(1, int(w * scale)), max(1, int(h * scale))
+
+def _batch_within_tpm(max_batch: int, tpm: float = OPENAI_MAX_TPM) -> int:
+    """Cap a batch size so one request's token estimate fits the TPM bucket (tpm <= 0: no limit)."""
+    if tpm > 0:
+        max_batch = min(max_batch, int((tpm - _PROMPT_TOKENS) // _MAX_IMAGE_TOKENS))
+    return max(1, max_batch)
+
+# Running per-image estimate for ETAs, learned from the images we actually send
+_tokens_per_image = OPENAI_TOKENS_PER_IMAGE or float(_MAX_IMAGE_TOKENS)
+
+def _prepare_image(image_bytes: bytes) -> tuple[bytes, str, int]:
+    """
+    Crop tall screenshots to the profile header, shrink to OPENAI_IMAGE_MAX_EDGE
+    and to OPENAI_IMAGE_MAX_TILES tiles (512px for low detail), and re-encode. Returns (bytes, mime, token_cost); undecodable input is sent as-is.
+    """
+    global _tokens_per_image
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(io.BytesIO(image_bytes))
+        img.load()
+    except Exception:
+        return image_bytes, _guess_mime(image_bytes), int(_tokens_per_image)
+
+    w, h = img.size
+    if 0 < OPENAI_CROP_TOP_FRACTION < 1 and h > w * 1.2:
+        # Username + stats row sit in the top part of an IG profile screenshot
+        img = img.crop((0, 0, w, max(w, int(h * OPENAI_CROP_TOP_FRACTION))))
+    img.thumbnail((OPENAI_IMAGE_MAX_EDGE, OPENAI_IMAGE_MAX_EDGE))
+    if OPENAI_IMAGE_DETAIL == "low":
+        img.thumbnail((_TILE, _TILE))  # the model sees low detail at 512px anyway
+    else:
+        img.thumbnail(_fit_tiles(*img.size, OPENAI_IMAGE_MAX_TILES))
+    if img.mode not in ("RGB", "L"):
+        img = img.convert("RGB")
+
+    fmt, mime = ("WEBP", "image/webp") if OPENAI_IMAGE_FORMAT == "webp" else ("JPEG", "image/jpeg")
+    out = io.BytesIO()
+    img.save(out, fmt, quality=OPENAI_IMAGE_QUALITY)
+    data = out.getvalue()
+
+    tokens = _image_tokens(*img.size)
+    _tokens_per_image = 0.8 * _tokens_per_image + 0.2 * tokens
+    print(
+        f"VISION PREP: {len(image_bytes)}→{len(data)} bytes, {w}x{h}→{img.width}x{img.height}, "
+        f"~{tokens} tokens, {(time.perf_counter() - t0) * 1000:.0f} ms"
+    )
+    return data, mime, tokens
+
+async def _prepare_images(images: list[bytes]) -> tuple[list[str], int]:
+    """Preprocess off the event loop; returns data URLs and the request's token estimate."""
+    prepared = await asyncio.gather(*(asyncio.to_thread(_prepare_image, b) for b in images))
+    urls = [_to_data_url(data, mime) for data, mime, _ in prepared]
+    return urls, _PROMPT_TOKENS + sum(t for _, _, t in prepared)
+
 def _strip_code_fences(text: str) -> str:
     t = text.strip()
     if t.startswith("```"):
@@ -51,121 +149,324 @@ def _parse_retry_after_seconds(msg: str) -> Optional[float]:
     if m: return float(m.group(1))
     return None
 
-INTERVAL_BY_RPM = (60.0 / OPENAI_MAX_RPM) if OPENAI_MAX_RPM > 0 else 0.0
-INTERVAL_BY_TPM = (OPENAI_TOKENS_PER_IMAGE / OPENAI_MAX_TPM) * 60.0 if OPENAI_MAX_TPM > 0 else 0.0
-MIN_INTERVAL_SEC = max(INTERVAL_BY_RPM, INTERVAL_BY_TPM)
+def _parse_reset_header(value: str) -> Optional[float]:
+    """
+    Parse x-ratelimit-reset-* values: durations like "6m0s", "1.5s", "20ms",
+    or a bare number (seconds, or a unix timestamp if it is in the future).
+    """
+    v = str(value).strip().lower()
+    if not v:
+        return None
+    try:
+        num = float(v)
+        return max(0.0, num - time.time()) if num > 1e9 else num
+    except ValueError:
+        pass
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", v)
+    if not parts:
+        return None
+    scale = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(float(n) * scale[u] for n, u in parts)
+
+def _server_wait_seconds(e: Exception) -> Optional[float]:
+    """How long the server asked us to back off (message text and headers)."""
+    retry_after = _parse_retry_after_seconds(str(e))
+    resp = getattr(e, "response", None)
+    if resp is not None:
+        try:
+            h = getattr(resp, "headers", {}) or {}
+            retry_after_hdr = h.get("retry-after") or h.get("Retry-After")
+            if retry_after_hdr and not retry_after:
+                try:
+                    retry_after = float(retry_after_hdr)
+                except Exception:
+                    retry_after = None
+            for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens"):
+                secs = _parse_reset_header(h.get(name) or "")
+                if secs:
+                    retry_after = max(retry_after or 0.0, secs)
+        except Exception:
+            pass
+    return retry_after
+
+def _is_rate_limit(e: Exception) -> bool:
+    msg = str(e)
+    return (
+        isinstance(e, RateLimitError)
+        or "Too Many Requests" in msg
+        or "rate limit" in msg.lower()
+        or "429" in msg
+    )
+
+# Requests + tokens buckets: bursts up to the per-minute budget, then refill
+_limiter = DualLimiter(rpm=OPENAI_MAX_RPM, tpm=OPENAI_MAX_TPM)
 
 _throttle_lock = asyncio.Lock()
-_last_call_ts = 0.0
+_waiters = 0             # calls queued in (or holding) _throttle_once
 _next_allowed_ts = 0.0   # set when server tells us to retry later
 
-async def _throttle_once():
-    global _last_call_ts, _next_allowed_ts
-    async with _throttle_lock:
-        now = time.monotonic()
-        wait_due_to_interval = max(0.0, MIN_INTERVAL_SEC - (now - _last_call_ts))
-        wait_due_to_server = max(0.0, _next_allowed_ts - now)
-        wait = max(wait_due_to_interval, wait_due_to_server)
-        if wait > 0:
-            await asyncio.sleep(wait)
-        _last_call_ts = time.monotonic()
+def _defer_until(retry_after: float) -> None:
+    """Push the global 'not before' time; _throttle_once enforces it."""
+    global _next_allowed_ts
+    _next_allowed_ts = max(_next_allowed_ts, time.monotonic() + retry_after)
+
+async def _throttle_once(tokens: float):
+    """Wait for budget (and any server cooldown), then reserve one call + `tokens`."""
+    global _waiters
+    _waiters += 1
+    try:
+        async with _throttle_lock:
+            while True:
+                now = time.monotonic()
+                wait = max(_limiter.wait_time(tokens, now), _next_allowed_ts - now)
+                if wait <= 0:
+                    break
+                # Re-check after sleeping: a 429 elsewhere may have pushed the cooldown
+                await asyncio.sleep(wait)
+            _limiter.acquire(tokens)
+    finally:
+        _waiters -= 1
+
+# In-flight vision jobs per Telegram user, so /cancel can stop them
+_inflight: dict[int, set[asyncio.Future]] = {}
+
+class VisionCancelled(Exception):
+    """The job was cancelled by its owner (e.g. /cancel) before it finished."""
+
+def cancel_pending(owner: int) -> int:
+    """Cancel every queued/running vision job of this user. Returns how many."""
+    jobs = _inflight.pop(owner, set())
+    for j in jobs:
+        j.cancel()
+    return len(jobs)
+
+async def _await_owned(job: asyncio.Future, owner: Optional[int]) -> OCRResult:
+    """
+    Await a vision job. If `owner` is given, the job can be stopped with
+    cancel_pending(owner), which raises VisionCancelled here.
+    """
+    if owner is not None:
+        _inflight.setdefault(owner, set()).add(job)
+    try:
+        await asyncio.wait({job})
+    except asyncio.CancelledError:
+        job.cancel()
+        raise
+    finally:
+        if owner is not None:
+            jobs = _inflight.get(owner)
+            if jobs is not None:
+                jobs.discard(job)
+                if not jobs:
+                    _inflight.pop(owner, None)
+    if job.cancelled():
+        raise VisionCancelled()
+    return job.result()
+
+def _to_result(data) -> OCRResult:
+    """Build an OCRResult from one parsed JSON object (anything else → empty)."""
+    if not isinstance(data, dict):
+        return OCRResult()
+    username = data.get("username")
+    followers = data.get("followers")
+    conf = data.get("confidence")
+    try:
+        conf = float(conf) if conf is not None else None
+    except Exception:
+        conf = None
+    print("VISION OK:", {"username": username, "followers": followers, "confidence": conf})
+    return OCRResult(username=username, followers=followers, confidence=conf)
+
+SINGLE_PROMPT = (
+    "You are an OCR+reasoning parser for Instagram stats screenshots.\n"
+    'Return JSON with keys: "username" (lowercase, no "@"), '
+    '"followers" (as displayed, may include k/m), '
+    '"confidence" (0..1). If not confident, set confidence <= 0.6. '
+    "Return ONLY JSON."
+)
+
+BATCH_PROMPT = (
+    "You are an OCR+reasoning parser for Instagram stats screenshots.\n"
+    "You get several screenshots, labelled Image 1..N in order.\n"
+    'Return JSON: {"results": [ ... ]} with exactly one object per image, in order, '
+    'each with keys: "index" (the image number), "username" (lowercase, no "@"), '
+    '"followers" (as displayed, may include k/m), "confidence" (0..1). '
+    "If not confident, set confidence <= 0.6. Return ONLY JSON."
+)
 
 class VisionClient:
-    """OpenAI Chat Completions for vision OCR with robust backoff."""
+    """Async OpenAI Chat Completions for vision OCR; retries are scheduled on the loop."""
     def __init__(self, api_key: str):
-        self.client = OpenAI(api_key=api_key)
+        # max_retries=0: our own scheduler owns retries so the global throttle sees them
+        self.client = AsyncOpenAI(api_key=api_key, max_retries=0)
         self.model = OPENAI_MODEL or "gpt-4o-mini"
 
-    async def extract(self, image_bytes: bytes) -> OCRResult:
-        await _throttle_once()
-        loop = asyncio.get_event_loop()
-        return await loop.run_in_executor(None, self._extract_sync, image_bytes)
+    async def extract(self, image_bytes: bytes, owner: Optional[int] = None) -> OCRResult:
+        """Run vision OCR for one image (one request). Cancellable per owner."""
+        task = asyncio.create_task(self._extract_async(image_bytes))
+        return await _await_owned(task, owner)
+
+    async def extract_many(self, images: list[bytes]) -> list[OCRResult]:
+        """OCR several screenshots in ONE request; results are in input order."""
+        if len(images) == 1:
+            return [await self._extract_async(images[0])]
+
+        content = [{
+            "type": "text",
+            "text": f"Extract username and total followers for each of the {len(images)} images. "
+                    "Output only JSON.",
+        }]
+        urls, tokens = await _prepare_images(images)
+        for i, url in enumerate(urls, start=1):
+            content.append({"type": "text", "text": f"Image {i}:"})
+            content.append({"type": "image_url", "image_url": {"url": url, "detail": OPENAI_IMAGE_DETAIL}})
+
+        data = await self._request(BATCH_PROMPT, content, tokens=tokens)
+        entries = data.get("results") if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            return [OCRResult() for _ in images]
 
-    def _extract_sync(self, image_bytes: bytes) -> OCRResult:
-        global _next_allowed_ts
-        data_url = _to_data_url(image_bytes)
+        # Prefer the model's own "index"; fall back to position
+        by_index: dict[int, OCRResult] = {}
+        for pos, entry in enumerate(entries, start=1):
+            idx = entry.get("index") if isinstance(entry, dict) else None
+            idx = idx if isinstance(idx, int) and 1 <= idx <= len(images) else pos
+            by_index.setdefault(idx, _to_result(entry))
+        return [by_index.get(i, OCRResult()) for i in range(1, len(images) + 1)]
 
-        system_prompt = (
-            "You are an OCR+reasoning parser for Instagram stats screenshots.\n"
-            'Return JSON with keys: "username" (lowercase, no "@"), '
-            '"followers" (as displayed, may include k/m), '
-            '"confidence" (0..1). If not confident, set confidence <= 0.6. '
-            "Return ONLY JSON."
-        )
+    async def _extract_async(self, image_bytes: bytes) -> OCRResult:
+        urls, tokens = await _prepare_images([image_bytes])
+        content = [
+            {"type": "text", "text": "Extract username and total followers. Output only JSON."},
+            {"type": "image_url", "image_url": {"url": urls[0], "detail": OPENAI_IMAGE_DETAIL}},
+        ]
+        data = await self._request(SINGLE_PROMPT, content, tokens=tokens)
+        return _to_result(data)
 
+    async def _request(self, system_prompt: str, content: list, tokens: float):
+        """
+        One JSON chat completion with rate-limit retries. Returns the parsed
+        JSON, or None if the request failed.
+        """
         max_attempts = 5
         base_backoff = 20.0
 
         for attempt in range(1, max_attempts + 1):
+            # Waits for both our own pacing and any server-imposed cooldown
+            await _throttle_once(tokens)
             try:
-                chat = self.client.chat.completions.create(
+                raw = await self.client.chat.completions.with_raw_response.create(
                     model=self.model,
                     messages=[
                         {"role": "system", "content": system_prompt},
-                        {
-                            "role": "user",
-                            "content": [
-                                {"type": "text", "text": "Extract username and total followers. Output only JSON."},
-                                {"type": "image_url", "image_url": {"url": data_url}},
-                            ],
-                        },
+                        {"role": "user", "content": content},
                     ],
                     temperature=0.0,
                     response_format={"type": "json_object"},
                 )
-                text = (chat.choices[0].message.content or "").strip()
-                text = _strip_code_fences(text)
-                data = json.loads(text)
-
-                username = data.get("username") if isinstance(data, dict) else None
-                followers = data.get("followers") if isinstance(data, dict) else None
-                conf = data.get("confidence") if isinstance(data, dict) else None
-                try:
-                    conf = float(conf) if conf is not None else None
-                except Exception:
-                    conf = None
-
-                print("VISION OK:", {"username": username, "followers": followers, "confidence": conf})
-                return OCRResult(username=username, followers=followers, confidence=conf)
-
+                chat = await raw.parse()
+            except asyncio.CancelledError:
+                _limiter.settle(tokens, 0)
+                raise
             except Exception as e:
-                msg = str(e)
-                retry_after = _parse_retry_after_seconds(msg)
-
-                resp = getattr(e, "response", None)
-                if resp is not None:
-                    try:
-                        h = getattr(resp, "headers", {}) or {}
-                        retry_after_hdr = h.get("retry-after") or h.get("Retry-After")
-                        if retry_after_hdr and not retry_after:
-                            try:
-                                retry_after = float(retry_after_hdr)
-                            except Exception:
-                                retry_after = None
-                        reset_epoch = h.get("x-ratelimit-reset-requests") or h.get("x-ratelimit-reset-tokens")
-                        if reset_epoch and str(reset_epoch).isdigit():
-                            secs = max(0.0, float(reset_epoch) - time.time())
-                            if secs > 0:
-                                retry_after = max(retry_after or 0.0, secs)
-                    except Exception:
-                        pass
-
-                if "Too Many Requests" in msg or "rate limit" in msg.lower() or "429" in msg:
+                # Rejected calls spend no tokens; give the reservation back
+                _limiter.settle(tokens, 0)
+                if _is_rate_limit(e):
+                    retry_after = _server_wait_seconds(e)
                     if retry_after is None:
                         retry_after = base_backoff * (2 ** (attempt - 1))
-                    _next_allowed_ts = max(_next_allowed_ts, time.monotonic() + retry_after)
-                    print(f"VISION RATE-LIMIT: attempt {attempt}/{max_attempts}, sleeping {retry_after:.1f}s")
-                    time.sleep(retry_after)
+                    _defer_until(retry_after)
+                    print(f"VISION RATE-LIMIT: attempt {attempt}/{max_attempts}, retrying in {retry_after:.1f}s")
                     continue
 
                 print("VISION ERROR (chat request):", repr(e))
-                return OCRResult()
+                return None
+
+            # Learn the real budget: charge actual usage (settling this call),
+            # then lower our levels to the server's x-ratelimit-remaining-* (when sent)
+            _limiter.settle(tokens, chat.usage.total_tokens if chat.usage is not None else tokens)
+            _limiter.sync_from_headers(raw.headers)
+
+            try:
+                text = _strip_code_fences((chat.choices[0].message.content or "").strip())
+                return json.loads(text)
+            except Exception as e:
+                print("VISION ERROR (chat request):", repr(e))
+                return None
 
         print("VISION ERROR: exhausted retries due to rate limits.")
-        return OCRResult()
+        return None
+
+class VisionBatcher:
+    """
+    Micro-batching stage in front of VisionClient.
+
+    Images arriving within `window_sec` of each other (up to `max_batch`) are
+    sent as ONE multi-image request, and each waiting caller gets its own
+    result back. Same interface as VisionClient.extract. A batch never holds
+    more images than fit within the TPM budget in one request.
+    """
+    def __init__(self, client: VisionClient, max_batch: int, window_sec: float):
+        self.client = client
+        self.max_batch = _batch_within_tpm(max_batch)
+        self.window_sec = max(0.0, window_sec)
+        self._pending: list[tuple[bytes, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: set[asyncio.Task] = set()
+
+    async def extract(self, image_bytes: bytes, owner: Optional[int] = None) -> OCRResult:
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((image_bytes, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_sec, self._flush)
+        return await _await_owned(fut, owner)
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Jobs cancelled while waiting for the window are simply dropped
+        jobs = [(b, f) for b, f in self._pending if not f.done()]
+        self._pending = []
+        if not jobs:
+            return
+
+        task = asyncio.create_task(self._run(jobs))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+        # If every caller in the batch gives up (/cancel), abort the request too
+        def _abort_if_abandoned(_):
+            if all(f.cancelled() for _, f in jobs):
+                task.cancel()
+        for _, f in jobs:
+            f.add_done_callback(_abort_if_abandoned)
+
+    async def _run(self, jobs: list[tuple[bytes, asyncio.Future]]) -> None:
+        try:
+            results = await self.client.extract_many([b for b, _ in jobs])
+        except asyncio.CancelledError:
+            for _, fut in jobs:
+                fut.cancel()
+            raise
+        except Exception as e:
+            print("VISION ERROR (batch):", repr(e))
+            results = [OCRResult() for _ in jobs]
+        for (_, fut), res in zip(jobs, results):
+            if not fut.done():
+                fut.set_result(res)
 
-def estimate_wait_seconds() -> float:
+def estimate_wait_seconds(position: Optional[int] = None) -> float:
+    """
+    ETA in seconds until a call at queue `position` can start (0 = next).
+    Defaults to the position a newly queued image would get.
+    """
+    if position is None:
+        position = _waiters
     now = time.monotonic()
-    wait_due_to_interval = max(0.0, MIN_INTERVAL_SEC - (now - _last_call_ts))
+    wait_due_to_budget = _limiter.eta(position + 1, _tokens_per_image + _PROMPT_TOKENS, now)
     wait_due_to_server = max(0.0, _next_allowed_ts - now)
-    return max(wait_due_to_interval, wait_due_to_server)
+    return max(wait_due_to_budget, wait_due_to_server)
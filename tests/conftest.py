@@ -0,0 +1,24 @@
+import pytest
+
+from src import db
+
+
+def _drop_connections() -> None:
+    """Close the pooled connections so the next query opens db.DB_PATH afresh."""
+    with db._writer_lock:
+        if db._writer is not None:
+            db._writer.close()
+            db._writer = None
+    while not db._readers.empty():
+        db._readers.get_nowait().close()
+
+
+@pytest.fixture
+def tmp_db(tmp_path, monkeypatch):
+    """A fresh, fully migrated database in place of BOT_DB_PATH."""
+    path = tmp_path / "bot.db"
+    monkeypatch.setattr(db, "DB_PATH", path)
+    _drop_connections()
+    db.init_db()
+    yield path
+    _drop_connections()
@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from services import assignment
+from services.assignment import SessionMatcher, solve
+
+
+def test_near_identical_handles_get_distinct_slots():
+    sm = SessionMatcher(["sakura9neko", "sakura9neko_", "other"])
+    sm.sync({1: "sakura9neko_", 2: "sakura9neko"})
+    res = sm.assign(75)
+    assert res.slots == {1: 2, 2: 1}
+    assert res.conflicts == []
+
+
+def test_loser_is_flagged_as_conflict():
+    sm = SessionMatcher(["sakura9neko", "zzz"])
+    sm.sync({1: "sakura9neko", 2: "sakura9nek0"})
+    res = sm.assign(75)
+    assert res.slots == {1: 1, 2: None}
+    assert res.conflicts == [assignment.Conflict(item_id=2, slot=1, holder_id=1)]
+
+
+def test_pinned_slot_is_kept():
+    sm = SessionMatcher(["alpha", "beta"])
+    sm.sync({1: "alpha"})
+    res = sm.assign(75, pinned={2: 1})
+    assert res.slots == {1: None, 2: 1}
+    assert res.conflicts == [assignment.Conflict(item_id=1, slot=1, holder_id=2)]
+
+
+def test_sync_rescores_only_changes():
+    sm = SessionMatcher(["alpha", "beta"])
+    sm.sync({1: "alpha", 2: "beta"})
+    row = sm.rows[1]
+    sm.sync({1: "alpha", 3: "beta"})
+    assert sm.rows[1] is row and set(sm.rows) == {1, 3}
+
+
+@pytest.mark.parametrize("shape", [(4, 6), (6, 4), (5, 5)])
+def test_fallback_solver_is_optimal(monkeypatch, shape):
+    r = random.Random(7)
+    n, m = shape
+    for _ in range(20):
+        rows = [[r.randint(0, 100) for _ in range(m)] for _ in range(n)]
+        expected = solve(rows, 50)
+        monkeypatch.setattr(assignment, "np", None)
+        got = solve(rows, 50)
+        monkeypatch.undo()
+        total = lambda cols: sum(rows[i][j] for i, j in enumerate(cols) if j is not None)
+        assert total(got) == total(expected)
+        assert len({j for j in got if j is not None}) == sum(j is not None for j in got)
+
+
+def test_ocr_scorer_assigns_misread_handles():
+    order = ["lily_o", "mimi", "kolo"]
+    sm = SessionMatcher(order, "ocr")
+    sm.sync({1: "1i1y.0", 2: "rnirni", 3: "k010"})
+    assert sm.assign(75).slots == {1: 1, 2: 2, 3: 3}
+
+
+def test_pinned_clash_unassigns_earlier_item():
+    sm = SessionMatcher(["alpha", "beta"])
+    sm.sync({3: "beta"})
+    res = sm.assign(75, pinned={1: 1, 2: 1})
+    assert res.slots == {1: None, 2: 1, 3: 2}
+    assert res.conflicts == [assignment.Conflict(item_id=1, slot=1, holder_id=2)]
@@ -0,0 +1,46 @@
+import asyncio
+import io
+import zipfile
+
+from services.bulk import MediaGroupCollector, read_entry, zip_images
+
+
+def make_zip(files: dict[str, bytes]) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return out.getvalue()
+
+
+def test_zip_images_lists_screenshots_in_natural_order():
+    archive = make_zip({
+        "day/IMG_10.png": b"ten",
+        "day/IMG_2.png": b"two",
+        "__MACOSX/day/._IMG_2.png": b"meta",
+        "notes.txt": b"hi",
+        "big.jpg": b"x" * 100,
+    })
+    zf, entries, skipped = zip_images(archive, max_files=10, max_bytes=50)
+    assert [e.filename for e in entries] == ["day/IMG_2.png", "day/IMG_10.png"]
+    assert skipped == 1
+    assert read_entry(zf, entries[1]) == b"ten"
+
+
+def test_zip_images_caps_file_count():
+    archive = make_zip({f"{i}.jpg": b"x" for i in range(5)})
+    _, entries, skipped = zip_images(archive, max_files=3, max_bytes=10)
+    assert [e.filename for e in entries] == ["0.jpg", "1.jpg", "2.jpg"] and skipped == 2
+
+
+def test_media_group_collector_returns_group_once():
+    async def run():
+        c = MediaGroupCollector(0.05)
+
+        async def later(item, delay):
+            await asyncio.sleep(delay)
+            return await c.collect("album", item)
+
+        return await asyncio.gather(c.collect("album", 1), later(2, 0.01), later(3, 0.03))
+
+    assert asyncio.run(run()) == [[1, 2, 3], None, None]
@@ -0,0 +1,150 @@
+import asyncio
+import io
+import threading
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from src import db
+from src.handlers import images
+from src.handlers.sessions import Intake
+from src.models import OCRResult
+from src.services import bulk, order_cache, pipeline
+from src.services.imagebuf import ImageBuffer
+
+
+class FakeMessage:
+    def __init__(self, uid, message_id=1, photo=None, document=None, media_group_id=None):
+        self.from_user = SimpleNamespace(id=uid)
+        self.chat = SimpleNamespace(id=uid)
+        self.message_id = message_id
+        self.photo = photo
+        self.document = document
+        self.media_group_id = media_group_id
+        self.replies: list[str] = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeState:
+    async def get_state(self):
+        return Intake.collecting_images.state
+
+
+def photo(file_id):
+    return [SimpleNamespace(file_id=file_id, file_unique_id=f"u-{file_id}")]
+
+
+def zip_doc(name="shots.zip"):
+    return SimpleNamespace(file_id="zip", file_unique_id="u-zip", file_name=name,
+                           mime_type="application/zip", file_size=1000)
+
+
+def make_zip(files: dict[str, bytes]) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    return out.getvalue()
+
+
+@pytest.fixture
+def intake(tmp_db, monkeypatch):
+    """Local OCR reads 'username|followers' image bytes; downloads come from `files`."""
+    files: dict[str, bytes] = {}
+
+    async def fake_ocr(image, order=None):
+        username, _, followers = bytes(image.data).decode().partition("|")
+        return OCRResult(username=username or None, followers=followers or None, confidence=0.9)
+
+    async def fake_download(bot, file_id):
+        return ImageBuffer(files[file_id])
+
+    monkeypatch.setattr(pipeline, "ocr", fake_ocr)
+    monkeypatch.setattr(pipeline, "download", fake_download)
+    monkeypatch.setattr(images, "OPENAI_API_KEY", "")
+    monkeypatch.setattr(images, "albums", bulk.MediaGroupCollector(0.05))
+    return files
+
+
+def open_session(uid, order):
+    async def run():
+        await db.execute("INSERT INTO sessions(tg_user_id, status) VALUES(?, 'open')", [uid])
+        await order_cache.set_order(uid, order)
+    asyncio.run(run())
+
+
+def saved(uid):
+    async def run():
+        return await db.fetchall(
+            "SELECT i.username, i.order_index, i.image_file_id, g.item_id IS NOT NULL AS has_bytes "
+            "FROM items i JOIN sessions s ON s.id = i.session_id "
+            "LEFT JOIN item_images g ON g.item_id = i.id WHERE s.tg_user_id=? ORDER BY i.id",
+            [uid],
+        )
+    return [tuple(r) for r in asyncio.run(run())]
+
+
+def test_zip_batch_is_read_off_the_loop_and_summarised(intake, monkeypatch):
+    uid = 9001
+    open_session(uid, ["alice", "bob", "carol"])
+    intake["zip"] = make_zip({
+        "IMG_2.png": b"bob|2,000",
+        "IMG_10.png": b"alice|1.2k",
+        "blurry.png": b"",
+        "notes.txt": b"not an image",
+    })
+    threads = []
+    real_read = bulk.read_entry
+
+    def read_entry(zf, info):
+        threads.append(threading.current_thread())
+        return real_read(zf, info)
+
+    monkeypatch.setattr(bulk, "read_entry", read_entry)
+    m = FakeMessage(uid, document=zip_doc())
+    asyncio.run(images.on_zip(m, None, FakeState()))
+
+    assert threads and all(t is not threading.main_thread() for t in threads)
+    # ZIP entries have no Telegram file id, so their bytes are stored for /send
+    assert saved(uid) == [("bob", 2, None, 1), ("alice", 1, None, 1)]
+    [summary] = m.replies
+    assert "saved 2, 2 matched to your order." in summary
+    assert "Couldn't read 1 — send them on their own: blurry.png" in summary
+    assert "Still missing 1 of 3" in summary
+
+
+def test_invalid_zip_is_reported(intake):
+    uid = 9002
+    open_session(uid, [])
+    intake["zip"] = b"definitely not a zip"
+    m = FakeMessage(uid, document=zip_doc("broken.zip"))
+    asyncio.run(images.on_zip(m, None, FakeState()))
+    assert m.replies == ["🚫 broken.zip isn't a valid ZIP."]
+    assert saved(uid) == []
+
+
+def test_album_is_one_batch_with_one_summary(intake):
+    uid = 9003
+    open_session(uid, ["alice", "bob"])
+    intake.update({"p1": b"alice|100", "p2": b"bob|200"})
+    text_doc = SimpleNamespace(file_id="d", file_unique_id="u-d", file_name="notes.txt", mime_type="text/plain")
+    msgs = [
+        FakeMessage(uid, 3, document=text_doc, media_group_id="g"),
+        FakeMessage(uid, 1, photo=photo("p1"), media_group_id="g"),
+        FakeMessage(uid, 2, photo=photo("p2"), media_group_id="g"),
+    ]
+
+    async def run():
+        await asyncio.gather(*(images.on_album(m, None, FakeState()) for m in msgs))
+
+    asyncio.run(run())
+    assert saved(uid) == [("alice", 1, "p1", 0), ("bob", 2, "p2", 0)]
+    replies = [r for m in msgs for r in m.replies]
+    assert len(replies) == 1
+    assert "Batch of 2 screenshot(s): saved 2, 2 matched" in replies[0]
+    assert "🚫 #3 is not an image or ZIP." in replies[0]
+    assert "Every order entry has a screenshot" in replies[0]
+    assert msgs[1].replies == replies  # the summary answers the album's first message
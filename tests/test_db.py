@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+
+from src import db
+
+
+def columns(conn, table):
+    return {r["name"] for r in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def baseline_db(path):
+    """A database as the bot created it before versioned migrations (user_version 0)."""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.executescript(db._BASE_SCHEMA)
+    conn.execute("INSERT INTO users(tg_user_id, boss_chat_id) VALUES(42, -100)")
+    conn.execute("INSERT INTO sessions(tg_user_id, date_str, status) VALUES(42, '01/01/2025', 'open')")
+    conn.execute("INSERT INTO items(session_id, order_index, username) VALUES(1, 1, 'sakura')")
+    conn.commit()
+    return conn
+
+
+def test_migrate_baseline_db(tmp_path):
+    conn = baseline_db(tmp_path / "old.db")
+    assert db.schema_version(conn) == 0
+
+    assert db.migrate(conn) == db.SCHEMA_VERSION
+    assert db.schema_version(conn) == db.SCHEMA_VERSION
+    assert {"boss_thread_id", "updated_at"} <= columns(conn, "users")
+    assert {"thread_id", "attempts", "sent_at"} <= columns(conn, "deliveries")
+    assert {"image_hash", "image_file_unique_id"} <= columns(conn, "items")
+    tables = {r["name"] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+    assert {"ocr_cache", "deliveries", "fsm_state", "item_images"} <= tables
+
+    # Existing rows survive, and a second run is a no-op
+    assert conn.execute("SELECT username FROM items").fetchone()["username"] == "sakura"
+    assert db.migrate(conn) == db.SCHEMA_VERSION
+
+
+def test_migrate_step_by_step_keeps_deliveries(tmp_path):
+    conn = baseline_db(tmp_path / "old.db")
+    assert db.migrate(conn, target=4) == 4
+    conn.execute(
+        "INSERT INTO deliveries(item_id, chat_id, message_id, status, updated_at) "
+        "VALUES(1, -100, 7, 'sent', '2025-01-01 10:00:00')"
+    )
+    conn.commit()
+
+    db.migrate(conn)
+    row = conn.execute("SELECT thread_id, attempts, sent_at FROM deliveries").fetchone()
+    assert tuple(row) == (0, 1, "2025-01-01 10:00:00")
+
+
+def batch_table():
+    return db.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER UNIQUE)")
+
+
+def test_batch_writer_coalesces_into_one_commit(tmp_db):
+    async def run():
+        await batch_table()
+        bw = db.BatchWriter(max_batch=100, window_sec=0.01)
+        ids = await asyncio.gather(*(bw.execute("INSERT INTO t(x) VALUES(?)", [i]) for i in range(5)))
+        return bw, ids, await db.fetchall("SELECT x FROM t ORDER BY x")
+
+    bw, ids, rows = asyncio.run(run())
+    assert (bw.batches, bw.statements) == (1, 5)
+    assert ids == [1, 2, 3, 4, 5]
+    assert [r["x"] for r in rows] == [0, 1, 2, 3, 4]
+
+
+def test_batch_writer_splits_at_max_batch(tmp_db):
+    async def run():
+        await batch_table()
+        bw = db.BatchWriter(max_batch=2, window_sec=10)  # full batches flush without the timer
+        await asyncio.gather(*(bw.execute("INSERT INTO t(x) VALUES(?)", [i]) for i in range(4)))
+        return bw
+
+    assert asyncio.run(run()).batches == 2
+
+
+def test_batch_writer_isolates_bad_statement(tmp_db):
+    async def run():
+        await batch_table()
+        bw = db.BatchWriter(max_batch=100, window_sec=0.01)
+        results = await asyncio.gather(
+            bw.execute("INSERT INTO t(x) VALUES(?)", [1]),
+            bw.execute("INSERT INTO t(x) VALUES(?)", [1]),  # violates UNIQUE
+            bw.execute("INSERT INTO t(x) VALUES(?)", [2]),
+            return_exceptions=True,
+        )
+        return results, await db.fetchall("SELECT x FROM t ORDER BY x")
+
+    results, rows = asyncio.run(run())
+    assert isinstance(results[1], sqlite3.IntegrityError)
+    assert not isinstance(results[0], Exception) and not isinstance(results[2], Exception)
+    assert [r["x"] for r in rows] == [1, 2]
+
+
+def test_writer_fsyncs_every_commit(tmp_db):
+    async def run():
+        return await db.write(lambda conn: conn.execute("PRAGMA synchronous").fetchone()[0])
+
+    assert asyncio.run(run()) == 2  # FULL, not the NORMAL other connections use
@@ -0,0 +1,117 @@
+import asyncio
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from src import db
+from src.models import DeliveryItem
+from src.services.delivery import DeliveryEngine
+
+CHAT = -100123
+
+
+class FakeBot:
+    """Records what was sent; rejects photos by caption and can hit flood control first."""
+
+    def __init__(self, reject=(), flood=0):
+        self.reject = set(reject)
+        self.flood = flood
+        self.photo_calls = 0
+        self.album_calls = 0
+        self.sent: list[tuple[int, int | None, str]] = []
+
+    def _check(self, captions):
+        if self.flood:
+            self.flood -= 1
+            raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0)
+        if self.reject & set(captions):
+            raise TelegramBadRequest(method=None, message="Bad Request: wrong file identifier")
+
+    def _message(self, chat_id, thread_id, caption):
+        self.sent.append((chat_id, thread_id, caption))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def send_photo(self, chat_id, photo, caption, message_thread_id=None):
+        self.photo_calls += 1
+        self._check([caption])
+        return self._message(chat_id, message_thread_id, caption)
+
+    async def send_media_group(self, chat_id, media, message_thread_id=None):
+        self.album_calls += 1
+        self._check([m.caption for m in media])
+        return [self._message(chat_id, message_thread_id, m.caption) for m in media]
+
+
+def make_engine():
+    return DeliveryEngine(chat_per_min=60_000, global_per_sec=1000, max_retries=2, chat_burst=1000)
+
+
+def items(*ids):
+    return [DeliveryItem(item_id=i, photo=f"file-{i}", caption=f"#{i}") for i in ids]
+
+
+def ledger():
+    async def rows():
+        return await db.fetchall(
+            "SELECT item_id, thread_id, status, attempts, message_id FROM deliveries ORDER BY item_id, thread_id"
+        )
+    return [tuple(r) for r in asyncio.run(rows())]
+
+
+def test_rerun_skips_delivered_items(tmp_db):
+    engine, bot = make_engine(), FakeBot()
+    first = asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2, 3)))
+    again = asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2, 3)))
+    assert (first.sent, first.skipped) == (3, 0)
+    assert (again.sent, again.skipped) == (0, 3)
+    assert len(bot.sent) == 3
+    assert [r[2] for r in ledger()] == ["sent"] * 3
+
+
+def test_rerun_retries_only_failures(tmp_db):
+    engine = make_engine()
+    first = asyncio.run(engine.deliver(FakeBot(reject={"#2"}), CHAT, None, items(1, 2, 3)))
+    assert first.failed == [2]
+
+    bot = FakeBot()
+    again = asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2, 3)))
+    assert [c for _, _, c in bot.sent] == ["#2"]
+    assert (again.sent, again.skipped, again.failed) == (1, 2, [])
+    assert ledger()[1] == (2, 0, "sent", 2, 1)  # second attempt, message id from the re-run
+
+
+def test_new_topic_is_a_new_destination(tmp_db):
+    engine, bot = make_engine(), FakeBot()
+    asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2)))
+    report = asyncio.run(engine.deliver(bot, CHAT, 7, items(1, 2)))
+    assert (report.sent, report.skipped) == (2, 0)
+    assert [t for _, t, _ in bot.sent] == [None, None, 7, 7]
+    assert [(r[0], r[1]) for r in ledger()] == [(1, 0), (1, 7), (2, 0), (2, 7)]
+
+
+def test_rejected_album_falls_back_to_single_photos(tmp_db):
+    engine, bot = make_engine(), FakeBot(reject={"#2"})
+    report = asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2, 3, 4), album_size=3))
+    # album [1,2,3] rejected -> three singles; then #4 alone
+    assert bot.album_calls == 1
+    assert bot.photo_calls == 4
+    assert [c for _, _, c in bot.sent] == ["#1", "#3", "#4"]
+    assert (report.sent, report.failed) == (3, [2])
+    assert [r[2] for r in ledger()] == ["sent", "failed", "sent", "sent"]
+
+
+def test_flood_control_retries_same_photo(tmp_db):
+    engine, bot = make_engine(), FakeBot(flood=2)
+    report = asyncio.run(engine.deliver(bot, CHAT, None, items(1, 2)))
+    assert report.sent == 2 and report.failed == []
+    assert bot.photo_calls == 4
+    assert [c for _, _, c in bot.sent] == ["#1", "#2"]
+    assert CHAT in engine._paused_until
+
+
+def test_flood_control_gives_up_after_max_retries(tmp_db):
+    engine, bot = make_engine(), FakeBot(flood=10)
+    report = asyncio.run(engine.deliver(bot, CHAT, None, items(1)))
+    assert report.failed == [1]
+    assert bot.photo_calls == 3  # first try + max_retries
+    assert ledger() == [(1, 0, "failed", 1, None)]
@@ -0,0 +1,66 @@
+import asyncio
+
+from aiogram.fsm.storage.base import StorageKey
+
+from src import db
+from src.fsm_storage import SQLiteStorage
+
+KEY = StorageKey(bot_id=1, chat_id=2, user_id=3)
+
+
+def rows():
+    async def fetch():
+        return await db.fetchall("SELECT key, state, data_json FROM fsm_state")
+    return [tuple(r) for r in asyncio.run(fetch())]
+
+
+def test_state_survives_restart(tmp_db):
+    async def first_run():
+        storage = SQLiteStorage(flush_sec=60)
+        await storage.set_state(KEY, "Intake:collecting_images")
+        await storage.set_data(KEY, {"date": "01/01/2025"})
+        await storage.close()  # shutdown flushes what is pending
+
+    async def second_run():
+        storage = SQLiteStorage(flush_sec=60)
+        assert await storage.load() == 1
+        return await storage.get_state(KEY), await storage.get_data(KEY)
+
+    asyncio.run(first_run())
+    assert rows() == [("1:2:3:::default", "Intake:collecting_images", '{"date": "01/01/2025"}')]
+    assert asyncio.run(second_run()) == ("Intake:collecting_images", {"date": "01/01/2025"})
+
+
+def test_cleared_state_deletes_row(tmp_db):
+    async def run():
+        storage = SQLiteStorage(flush_sec=0.01)
+        await storage.set_state(KEY, "Intake:collecting_images")
+        await asyncio.sleep(0.05)  # write-behind flush
+        assert len(await db.fetchall("SELECT key FROM fsm_state")) == 1
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        await storage.close()
+
+    asyncio.run(run())
+    assert rows() == []
+
+
+def test_change_during_flush_is_flushed(tmp_db, monkeypatch):
+    real_write = db.write
+
+    async def slow_write(fn):
+        await asyncio.sleep(0.1)
+        return await real_write(fn)
+
+    async def run():
+        storage = SQLiteStorage(flush_sec=0.05)
+        await storage.set_state(KEY, "Intake:waiting_date")
+        await asyncio.sleep(0.08)  # first flush is now inside db.write
+        await storage.set_state(KEY, "Intake:collecting_images")
+        await asyncio.sleep(0.5)
+        assert not storage._dirty
+        await storage.close()
+
+    monkeypatch.setattr(db, "write", slow_write)
+    asyncio.run(run())
+    assert rows()[0][1] == "Intake:collecting_images"
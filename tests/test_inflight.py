@@ -0,0 +1,36 @@
+import asyncio
+
+from src.middleware.inflight import InFlightMiddleware
+
+
+def test_drain_waits_for_updates_in_progress():
+    mw = InFlightMiddleware()
+    finished = []
+
+    async def handler(event, data):
+        await asyncio.sleep(0.05)
+        finished.append(event)
+
+    async def run():
+        tasks = [asyncio.create_task(mw(handler, n, {})) for n in range(3)]
+        assert await mw.drain(timeout=5) == 3  # picks up tasks that have not started yet
+        assert mw.tasks == set()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert sorted(finished) == [0, 1, 2]
+
+
+def test_drain_gives_up_after_timeout():
+    mw = InFlightMiddleware()
+
+    async def handler(event, data):
+        await asyncio.sleep(10)
+
+    async def run():
+        task = asyncio.create_task(mw(handler, None, {}))
+        assert await mw.drain(timeout=0.01) == 1
+        assert not task.done()
+        task.cancel()
+
+    asyncio.run(run())
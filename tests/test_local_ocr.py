@@ -0,0 +1,29 @@
+from src.services.local_ocr import _lexicon_username
+from src.services.matching import OrderIndex
+
+ORDER = OrderIndex(["sakura_neko", "moon.child", "brightside"])
+
+
+def test_exact_hit_is_certain():
+    assert _lexicon_username([("@Sakura_Neko", 0.4)], ORDER) == ("sakura_neko", 1.0)
+
+
+def test_split_handle_is_joined():
+    assert _lexicon_username([("moon.", 0.9), ("child", 0.9)], ORDER) == ("moon.child", 1.0)
+
+
+def test_fuzzy_hit_keeps_weak_word_confidence():
+    # "sakura_nek0" scores >= 75 against the order, but Tesseract barely read it
+    handle, conf = _lexicon_username([("sakura_nek0", 0.3)], ORDER)
+    assert handle == "sakura_neko"
+    assert conf == 0.3
+
+
+def test_fuzzy_hit_capped_by_match_score():
+    handle, conf = _lexicon_username([("brightsid", 0.95)], ORDER)
+    assert handle == "brightside"
+    assert 0.75 <= conf < 0.95
+
+
+def test_no_entry_close_enough():
+    assert _lexicon_username([("zzqx", 0.99), ("42", 0.99)], ORDER) is None
@@ -0,0 +1,50 @@
+import random
+import string
+
+from services.matching import OrderIndex, best_match, fuzz_ratio, ocr_ratio
+
+
+def test_order_index_exact_hit():
+    idx = OrderIndex(["alpha", "sakura9neko", "beta"])
+    assert idx.match("sakura9neko") == (1, 100)
+
+
+def test_order_index_matches_best_match():
+    r = random.Random(1)
+    handles = ["".join(r.choices(string.ascii_lowercase + "._0123456789", k=r.randint(3, 20))) for _ in range(200)]
+    idx = OrderIndex(handles)
+    for h in handles[:50]:
+        noisy = h[:-1] + "x" if len(h) > 3 else h + "x"
+        assert idx.match(noisy, 75) == best_match(noisy, handles, 75)
+    assert OrderIndex([]).match("x") == best_match("x", [])
+
+
+def test_order_entries_are_cleaned_like_ocr_usernames():
+    idx = OrderIndex(["@Sakura.Neko ", "beta"])
+    assert idx.match("sakura.neko") == (0, 100)
+    assert idx.usernames[0] == "@Sakura.Neko "
+
+
+def test_prefiltered_large_order_finds_best_entry():
+    r = random.Random(2)
+    handles = ["".join(r.choices(string.ascii_lowercase + "._0123456789", k=r.randint(5, 18))) for _ in range(2000)]
+    idx = OrderIndex(handles)
+    for h in handles[::40]:
+        noisy = h[:-1] + "x"
+        j, score = idx.match(noisy, 75)
+        assert score == max(fuzz_ratio(noisy, other) for other in handles)
+        assert j is not None and fuzz_ratio(noisy, handles[j]) == score
+
+
+def test_ocr_ratio_forgives_ocr_confusions():
+    assert ocr_ratio("sakura9neko", "sakura9nek0") > fuzz_ratio("sakura9neko", "sakura9nek0")
+    assert ocr_ratio("burn.it", "bum_it") >= 90
+    assert ocr_ratio("abcdef", "abcxyz") == fuzz_ratio("abcdef", "abcxyz")
+    assert ocr_ratio("abc", "xyz", score_cutoff=50) == 0
+
+
+def test_ocr_scorer_matches_misread_handle():
+    order = ["mr_marco", "mrmarcy", "lily.o"]
+    assert best_match("mr.rnarco", order, 75) == (None, 70)
+    assert best_match("mr.rnarco", order, 75, scorer="ocr") == (0, 94)
+    assert OrderIndex(order, "ocr").match("1i1y_0", 75) == (2, 83)
@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src import db
+from src.models import OCRResult
+from src.services import ocr_cache
+
+READ = OCRResult(username="sakura", followers="1.2k", confidence=0.9)
+
+
+@pytest.fixture
+def clock(tmp_db, monkeypatch):
+    """ocr_cache's notion of now, moved by hand."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(ocr_cache, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_lookup_by_file_id_or_content_hash(clock):
+    run(ocr_cache.store("h1", "file-1", READ))
+    assert run(ocr_cache.lookup(file_unique_id="file-1")) == READ
+    assert run(ocr_cache.lookup(content_hash="h1")) == READ
+    assert run(ocr_cache.lookup(content_hash="other")) is None
+    assert run(ocr_cache.lookup()) is None
+
+
+def test_expired_entry_is_a_miss_and_purged(clock, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_TTL_SEC", 60)
+    run(ocr_cache.store("old", None, READ))
+    clock[0] += 61
+    assert run(ocr_cache.lookup(content_hash="old")) is None
+    run(ocr_cache.store("new", None, READ))  # every store purges expired rows
+    assert [r["content_hash"] for r in run(db.fetchall("SELECT content_hash FROM ocr_cache"))] == ["new"]
+
+
+def test_least_recently_used_entries_are_trimmed(clock, monkeypatch):
+    monkeypatch.setattr(ocr_cache, "OCR_CACHE_MAX_ENTRIES", 2)
+    run(ocr_cache.store("a", None, READ))
+    clock[0] += 1
+    run(ocr_cache.store("b", None, READ))
+    clock[0] += 1
+    run(ocr_cache.lookup(content_hash="a"))  # a is now more recent than b
+    clock[0] += 1
+    run(ocr_cache.store("c", None, READ))
+    rows = run(db.fetchall("SELECT content_hash FROM ocr_cache ORDER BY content_hash"))
+    assert [r["content_hash"] for r in rows] == ["a", "c"]
+
+
+def test_correction_overwrites_entry(clock):
+    run(ocr_cache.store("h1", "file-1", READ))
+    fixed = OCRResult(username="sakura_neko", followers="1,250", confidence=1.0)
+    run(ocr_cache.correct("h1", "file-1", fixed))
+    assert run(ocr_cache.lookup(file_unique_id="file-1")) == fixed
+
+
+def test_correction_by_file_id_only(clock):
+    # Items read from a file-id cache hit never had their bytes hashed
+    run(ocr_cache.store("h1", "file-1", READ))
+    fixed = OCRResult(username="sakura_neko", followers="1.2k", confidence=1.0)
+    run(ocr_cache.correct(None, "file-1", fixed))
+    assert run(ocr_cache.lookup(content_hash="h1")) == fixed
+
+
+def test_incomplete_correction_drops_entry(clock):
+    run(ocr_cache.store("h1", "file-1", READ))
+    run(ocr_cache.correct(None, "file-1", None))
+    assert run(ocr_cache.lookup(content_hash="h1")) is None
+    run(ocr_cache.correct(None, None, None))  # nothing to key on: no-op
@@ -0,0 +1,47 @@
+import asyncio
+
+from src import db
+from src.services import order_cache
+
+
+def test_get_caches_and_set_order_writes_through(tmp_db):
+    async def run():
+        assert len(await order_cache.get(7001)) == 0
+        await order_cache.set_order(7001, ["alpha", "beta"])
+        first = await order_cache.get(7001)
+        return first, await order_cache.get(7001)
+
+    first, second = asyncio.run(run())
+    assert first.usernames == ["alpha", "beta"]
+    assert second is first  # served from the cache
+
+
+def test_load_racing_a_write_is_not_cached(tmp_db, monkeypatch):
+    uid = 7002
+    real_fetchone = db.fetchone
+
+    async def run():
+        await db.execute(
+            "INSERT INTO username_orders(tg_user_id, usernames_json) VALUES(?, ?)", [uid, '["old"]']
+        )
+        loaded = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow_fetchone(sql, params=None):
+            row = await real_fetchone(sql, params)
+            loaded.set()
+            await release.wait()  # /set_order lands while this load is in flight
+            return row
+
+        monkeypatch.setattr(db, "fetchone", slow_fetchone)
+        load = asyncio.create_task(order_cache.get(uid))
+        await loaded.wait()
+        await order_cache.set_order(uid, ["new"])
+        release.set()
+        stale = await load
+        monkeypatch.setattr(db, "fetchone", real_fetchone)
+        return stale, await order_cache.get(uid)
+
+    stale, current = asyncio.run(run())
+    assert stale.usernames == ["old"]
+    assert current.usernames == ["new"]
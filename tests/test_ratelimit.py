@@ -0,0 +1,63 @@
+from services.ratelimit import DualLimiter, TokenBucket
+
+
+def test_burst_then_refill():
+    # 3 RPM: three calls go immediately, the fourth waits 20s
+    b = TokenBucket(3, 3 / 60.0, now=0.0)
+    for _ in range(3):
+        assert b.wait_time(1, 0.0) == 0.0
+        b.consume(1, 0.0)
+    assert b.wait_time(1, 0.0) == 20.0
+    assert b.wait_time(1, 20.0) == 0.0
+
+
+def test_settle_charges_real_usage():
+    lim = DualLimiter(rpm=100, tpm=6000, now=0.0)
+    lim.acquire(900, now=0.0)
+    lim.settle(900, 3000, now=0.0)  # call used more than reserved
+    assert lim.tokens.level == 3000
+
+
+def test_headers_override_levels():
+    lim = DualLimiter(rpm=10, tpm=10000, now=0.0)
+    lim.sync_from_headers(
+        {"x-ratelimit-remaining-requests": "0", "x-ratelimit-remaining-tokens": "5000"}, now=0.0
+    )
+    assert lim.wait_time(100, now=0.0) == 6.0  # one request refills in 60/10 s
+
+
+def test_eta_for_queue_position():
+    lim = DualLimiter(rpm=3, tpm=100000, now=0.0)
+    assert lim.eta(3, 900, now=0.0) == 0.0   # fits in the burst
+    assert lim.eta(5, 900, now=0.0) == 40.0  # two refills at 20s each
+
+
+def test_headers_keep_inflight_reservations():
+    lim = DualLimiter(rpm=10, tpm=10000, now=0.0)
+    lim.acquire(3000, now=0.0)  # call A, still running
+    lim.acquire(2000, now=0.0)  # call B finishes first...
+    lim.settle(2000, 2000, now=0.0)
+    # ...and the server has only seen B (and other traffic): A's reservation must stay taken
+    lim.sync_from_headers(
+        {"x-ratelimit-remaining-requests": "8", "x-ratelimit-remaining-tokens": "6000"}, now=0.0
+    )
+    assert lim.tokens.level == 3000
+    assert lim.requests.level == 7
+    lim.settle(3000, 3000, now=0.0)
+    assert lim.inflight_requests == 0 and lim.inflight_tokens == 0
+
+
+def test_headers_never_raise_configured_limits():
+    # The account allows 500 RPM, but we are configured for 3
+    lim = DualLimiter(rpm=3, tpm=100000, now=0.0)
+    started = 0
+    for _ in range(10):
+        if lim.wait_time(100, now=0.0) > 0:
+            break
+        lim.acquire(100, now=0.0)
+        lim.settle(100, 100, now=0.0)
+        lim.sync_from_headers(
+            {"x-ratelimit-remaining-requests": "499", "x-ratelimit-remaining-tokens": "1999000"}, now=0.0
+        )
+        started += 1
+    assert started == 3
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.handlers import commands
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.from_user = SimpleNamespace(id=1)
+        self.replies: list[str] = []
+
+    async def reply(self, text, **kwargs):
+        self.replies.append(text)
+
+
+@pytest.mark.parametrize("text", ["/send foo", "/send albm", "/send single please"])
+def test_unknown_mode_gets_usage(text, tmp_db):
+    m = FakeMessage(text)
+    asyncio.run(commands.send_cmd(m, bot=None))
+    assert len(m.replies) == 1 and m.replies[0].startswith("Usage: /send [album|single]")
+
+
+@pytest.mark.parametrize("text", ["/send", "/send album", "/send SINGLE"])
+def test_known_mode_goes_ahead(text, tmp_db):
+    m = FakeMessage(text)
+    asyncio.run(commands.send_cmd(m, bot=None))
+    assert m.replies == ["No open session. Use /start_session."]
@@ -0,0 +1,22 @@
+import asyncio
+
+from src import db
+from src.services import session_slots
+from src.services.matching import OrderIndex
+
+
+def test_pinned_clash_is_persisted(tmp_db):
+    async def run():
+        for username, slot, corrected in [("alpha", 1, 1), ("alpah", 1, 1), ("beta", None, 0)]:
+            await db.execute(
+                "INSERT INTO items(session_id, username, order_index, corrected) VALUES(1, ?, ?, ?)",
+                [username, slot, corrected],
+            )
+        result = await session_slots.reassign(1, OrderIndex(["alpha", "beta"]))
+        rows = await db.fetchall("SELECT id, order_index FROM items ORDER BY id")
+        return result, {r["id"]: r["order_index"] for r in rows}
+
+    result, saved = asyncio.run(run())
+    # Item 2 was corrected onto slot 1 last: item 1 loses it, in the DB too
+    assert saved == {1: None, 2: 1, 3: 2}
+    assert saved == result.slots
@@ -0,0 +1,122 @@
+import asyncio
+
+import pytest
+
+from src.models import OCRResult
+from src.services import vision
+from src.services.vision import VisionBatcher, VisionCancelled, VisionClient
+
+
+class FakeClient:
+    """Answers each image with its own bytes as the username; can hang until cancelled."""
+
+    def __init__(self, hang=False):
+        self.hang = hang
+        self.batches: list[list[bytes]] = []
+        self.cancelled = False
+
+    async def extract_many(self, images):
+        self.batches.append(list(images))
+        if self.hang:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                self.cancelled = True
+                raise
+        return [OCRResult(username=b.decode()) for b in images]
+
+
+def test_window_groups_images_into_one_request():
+    client = FakeClient()
+
+    async def run():
+        batcher = VisionBatcher(client, max_batch=8, window_sec=0.02)
+        return await asyncio.gather(*(batcher.extract(n.encode()) for n in ("a", "b", "c")))
+
+    results = asyncio.run(run())
+    assert client.batches == [[b"a", b"b", b"c"]]
+    assert [r.username for r in results] == ["a", "b", "c"]
+
+
+def test_full_batch_flushes_without_waiting_for_window():
+    client = FakeClient()
+
+    async def run():
+        batcher = VisionBatcher(client, max_batch=2, window_sec=10)
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.extract(n.encode()) for n in ("a", "b", "c", "d"))), timeout=1
+        )
+
+    results = asyncio.run(run())
+    assert client.batches == [[b"a", b"b"], [b"c", b"d"]]
+    assert [r.username for r in results] == ["a", "b", "c", "d"]
+
+
+def test_request_is_aborted_when_every_caller_cancels():
+    client = FakeClient(hang=True)
+
+    async def run():
+        batcher = VisionBatcher(client, max_batch=2, window_sec=10)
+        jobs = [asyncio.create_task(batcher.extract(n.encode(), owner=7)) for n in ("a", "b")]
+        await asyncio.sleep(0.01)  # batch is full and in flight
+        assert vision.cancel_pending(7) == 2
+        for job in jobs:
+            with pytest.raises(VisionCancelled):
+                await job
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert client.cancelled
+
+
+def test_request_continues_for_remaining_caller():
+    client = FakeClient()
+
+    async def run():
+        batcher = VisionBatcher(client, max_batch=8, window_sec=0.02)
+        mine = asyncio.create_task(batcher.extract(b"a", owner=1))
+        theirs = asyncio.create_task(batcher.extract(b"b", owner=2))
+        await asyncio.sleep(0)
+        vision.cancel_pending(1)  # cancelled while still waiting for the window
+        with pytest.raises(VisionCancelled):
+            await mine
+        return await theirs
+
+    assert asyncio.run(run()).username == "b"
+    assert client.batches == [[b"b"]]  # the cancelled image is not sent
+
+
+# ───────────────────────── extract_many result mapping ───────────────────────── #
+
+def extract_many(reply, n):
+    client = VisionClient(api_key="test")
+
+    async def fake_request(system_prompt, content, tokens):
+        return reply
+
+    client._request = fake_request
+    return asyncio.run(client.extract_many([b"not an image"] * n))
+
+
+def usernames(results):
+    return [r.username for r in results]
+
+
+def test_results_follow_model_index():
+    reply = {"results": [{"index": 2, "username": "b"}, {"index": 1, "username": "a"}]}
+    assert usernames(extract_many(reply, 2)) == ["a", "b"]
+
+
+def test_missing_or_bad_index_falls_back_to_position():
+    reply = {"results": [{"username": "a"}, {"index": 9, "username": "b"}, {"index": "3", "username": "c"}]}
+    assert usernames(extract_many(reply, 3)) == ["a", "b", "c"]
+
+
+def test_duplicate_index_keeps_first_and_leaves_gap_empty():
+    reply = {"results": [{"index": 1, "username": "a"}, {"index": 1, "username": "again"}]}
+    assert usernames(extract_many(reply, 2)) == ["a", None]
+
+
+def test_malformed_reply_gives_empty_results():
+    assert usernames(extract_many({"oops": []}, 2)) == [None, None]
+    assert usernames(extract_many(None, 2)) == [None, None]
@@ -0,0 +1,26 @@
+import math
+
+from src.services import vision
+
+
+def tiles(w: int, h: int) -> int:
+    return math.ceil(w / 512) * math.ceil(h / 512)
+
+
+def test_header_crop_fits_tile_budget():
+    # 1080×2340 phone screenshot, top half kept, then fitted to 2 tiles
+    for max_tiles in (1, 2, 4):
+        w, h = vision._fit_tiles(1024, 1109, max_tiles)
+        assert tiles(w, h) <= max_tiles
+    assert vision._fit_tiles(1024, 1109, 2)[0] >= 470  # still wide enough to read
+
+
+def test_small_images_are_not_upscaled():
+    assert vision._fit_tiles(400, 300, 2) == (400, 300)
+
+
+def test_batch_fits_tpm():
+    cap = vision._batch_within_tpm(8, tpm=100_000)
+    assert vision._PROMPT_TOKENS + cap * vision._MAX_IMAGE_TOKENS <= 100_000
+    assert vision._batch_within_tpm(8, tpm=1) == 1
+    assert vision._batch_within_tpm(8, tpm=0) == 8